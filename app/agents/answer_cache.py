@@ -0,0 +1,65 @@
+import asyncio
+from typing import Literal
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END
+from langgraph.types import Command
+from agents.state import ChatState
+from tools.answer_cache import SemanticAnswerCache
+
+# Which agent produced an answer decides how long it is cached
+def answer_source(cache: SemanticAnswerCache, state: ChatState) -> str:
+    messages = state["messages"]
+    ids = [message.id for message in messages]
+    start = ids.index(state["turn_message_id"]) if state.get("turn_message_id") in ids else 0
+    sources = set()
+    for message in messages[start:]:
+        if isinstance(message, AIMessage) and message.name == "research_agent":
+            sources.add("research")
+        elif isinstance(message, ToolMessage) and message.name == "retrieve_blog_posts":
+            sources.add("blog")
+        elif isinstance(message, ToolMessage) and message.name in ("sql_db_query", "sql_db_next_page"):
+            sources.add("sql")
+    # Several agents answered together: the shortest lifetime wins
+    return min(sources, key=lambda source: cache.ttls[source]) if sources else "direct"
+
+# Only the first question of a thread stands on its own. Follow-ups ("Why?", "Translate your last answer")
+# depend on the conversation, so their answers must not be shared with other threads or users.
+def is_standalone_question(state: ChatState) -> bool:
+    messages = state["messages"]
+    return len(messages) > 0 and messages[0].id == state.get("turn_message_id")
+
+def create_answer_cache_nodes(cache: SemanticAnswerCache, next_node: str = "supervisor"):
+    # Entry node: answer the first question of a thread from the cache, or hand over to next_node (the supervisor or the router).
+    # Set {"configurable": {"answer_cache": False}} to skip the lookup for one request.
+    def check_answer_cache(state: ChatState, config: RunnableConfig) -> Command:
+        question_message = state["messages"][-1]
+        update = {"turn_message_id": question_message.id}
+        if config["configurable"].get("answer_cache", True) and len(state["messages"]) == 1:
+            answer = cache.lookup(question_message.content)
+            if answer is not None:
+                update["messages"] = [AIMessage(answer, name="answer_cache")]
+                return Command(update=update, goto=END)
+        return Command(update=update, goto=next_node)
+
+    # Embedding runs in a worker thread, off the event loop
+    async def acheck_answer_cache(state: ChatState, config: RunnableConfig) -> Command:
+        return await asyncio.to_thread(check_answer_cache, state, config)
+
+    def store_answer(state: ChatState):
+        messages = state["messages"]
+        if is_standalone_question(state):
+            cache.store(messages[0].content, messages[-1].content, answer_source(cache, state))
+        return {}
+
+    async def astore_answer(state: ChatState):
+        return await asyncio.to_thread(store_answer, state)
+
+    return (check_answer_cache, acheck_answer_cache), (store_answer, astore_answer)
+
+# Store the supervisor's final answer, not the handoffs to other agents
+def route_after_supervisor(state: ChatState) -> Literal["store_answer", "__end__"]:
+    last_message = state["messages"][-1]
+    if isinstance(last_message, AIMessage) and last_message.name == "supervisor" and not last_message.tool_calls and last_message.content:
+        return "store_answer"
+    return END
@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, convert_to_messages
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+from agents.deadline import DeadlineExceeded, Deadlines
+from agents.state import ChatState
+
+# Order in which branch results reach the supervisor, whatever order the branches finish in
+BRANCH_ORDER = ("research_agent", "retriever", "sql_agent")
+
+# Messages of an agent stopped before it answered: its work so far (the task, tool results), without a tool call
+# it was still waiting for, and a note that it did not answer
+def _timed_out(name: str, state: ChatState, messages: List[BaseMessage], timeout: float) -> List[BaseMessage]:
+    messages = list(messages) or convert_to_messages(state["messages"])[-1:]
+    while messages and isinstance(messages[-1], AIMessage) and messages[-1].tool_calls:
+        messages.pop()
+    return messages + [AIMessage(f"{name} did not answer within {round(timeout, 1):g} seconds.", name=name)]
+
+# Node running one agent (a compiled subgraph) on the task it was sent by a handoff or the router.
+# Its messages are kept in branch_results, so agents running in parallel never interleave in the shared history.
+# The branch gives up after timeout seconds (or the agent's NODE_TIMEOUTS entry), and at the request's deadline
+# less the supervisor's reserve; it then reports the agent's partial work and that it did not answer.
+def create_branch_node(agent: CompiledStateGraph, timeout: Optional[float] = None, deadlines: Optional[Deadlines] = None):
+    name = agent.name
+    deadlines = deadlines if deadlines is not None else Deadlines()
+
+    def run_branch(state: ChatState, config: RunnableConfig):
+        agent_input = {"messages": state["messages"]}
+        budget = deadlines.budget(name, config, timeout)
+        # Latest state of the agent's run, what it has done so far when it is stopped
+        progress = {"messages": []}
+
+        def run():
+            for values in agent.stream(agent_input, config, stream_mode="values"):
+                progress["messages"] = values["messages"]
+
+        if budget is None:
+            run()
+            messages = progress["messages"]
+        elif budget <= 0:
+            deadlines.timed_out(name)
+            messages = _timed_out(name, state, [], 0)
+        else:
+            # A sync call cannot be cancelled: the agent finishes in the background and its result is dropped.
+            # An agent that fails within its budget raises its own error.
+            executor = ThreadPoolExecutor(max_workers=1)
+            try:
+                future = executor.submit(run)
+                if wait([future], timeout=budget).done:
+                    future.result()
+                    messages = progress["messages"]
+                else:
+                    deadlines.timed_out(name)
+                    messages = _timed_out(name, state, progress["messages"], budget)
+            finally:
+                executor.shutdown(wait=False)
+        return {"branch_results": [{"agent": name, "messages": messages}]}
+
+    # The agent's in-flight LLM and tool calls are cancelled when it runs out of time; its own errors propagate
+    async def arun_branch(state: ChatState, config: RunnableConfig):
+        progress = {"messages": []}
+
+        async def run():
+            async for values in agent.astream({"messages": state["messages"]}, config, stream_mode="values"):
+                progress["messages"] = values["messages"]
+
+        try:
+            await deadlines.arun(name, config, run, timeout)
+            messages = progress["messages"]
+        except DeadlineExceeded as e:
+            messages = _timed_out(name, state, progress["messages"], e.budget)
+        return {"branch_results": [{"agent": name, "messages": messages}]}
+
+    return run_branch, arun_branch
+
+# Runs once after all the branches of a supervisor turn: appends their messages in BRANCH_ORDER,
+# so the supervisor synthesizes one answer from every result
+def merge_branches(state: ChatState):
+    results = sorted(
+        state.get("branch_results") or [],
+        key=lambda result: BRANCH_ORDER.index(result["agent"]) if result["agent"] in BRANCH_ORDER else len(BRANCH_ORDER),
+    )
+    return {
+        "messages": [message for result in results for message in result["messages"]],
+        "branch_results": None,
+    }
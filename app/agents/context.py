@@ -0,0 +1,220 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage, convert_to_messages
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+from langchain_core.runnables import RunnableConfig
+
+logger = logging.getLogger(__name__)
+
+# Messages that end a turn: the answer the user saw
+FINAL_ANSWER_NAMES = ("supervisor", "answer_cache")
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation between a user and a chatbot below, for the chatbot to continue it. "
+    "Keep the user's goals, the facts and figures found (with table names, links or document ids) and open questions. "
+    "Be concise, write at most a few short paragraphs.\n\n"
+    "Summary so far:\n{summary}\n\nNew messages:\n{messages}"
+)
+
+@dataclass
+class Summary:
+    text: str
+    until_id: str  # id of the last message it covers
+
+def _is_final_answer(message: BaseMessage) -> bool:
+    return isinstance(message, AIMessage) and message.name in FINAL_ANSWER_NAMES and not message.tool_calls and bool(message.content)
+
+# Completed turns (question ... final answer) and the messages of the turn in progress
+def split_turns(messages: Sequence[BaseMessage]) -> tuple:
+    turns, current = [], []
+    for message in messages:
+        current.append(message)
+        if _is_final_answer(message):
+            turns.append(current)
+            current = []
+    return turns, current
+
+# A completed turn without the agents' work: the user question, the agents' answers and the final answer.
+# Tool calls are dropped together with their results, so the history stays valid for the LLM API.
+def compact_turn(turn: List[BaseMessage]) -> List[BaseMessage]:
+    return [
+        message for i, message in enumerate(turn)
+        if (i == 0 and isinstance(message, HumanMessage))
+        or (isinstance(message, AIMessage) and not message.tool_calls and message.content)
+    ]
+
+# In the turn in progress, only the latest output of each tool is useful: the earlier ones
+# (e.g. failed queries the SQL agent has since fixed) are replaced by a stub
+def drop_stale_tool_outputs(messages: List[BaseMessage]) -> List[BaseMessage]:
+    latest: Dict[str, int] = {}
+    for i, message in enumerate(messages):
+        if isinstance(message, ToolMessage):
+            latest[message.name] = i
+    return [
+        message.model_copy(update={"content": f"[Earlier {message.name} output removed]"})
+        if isinstance(message, ToolMessage) and latest[message.name] != i else message
+        for i, message in enumerate(messages)
+    ]
+
+# Last resort when the turn in progress alone is over budget: cut the largest tool outputs
+def truncate_tool_outputs(messages: List[BaseMessage], budget: int, token_counter: Callable[[Sequence[BaseMessage]], int]) -> List[BaseMessage]:
+    messages = list(messages)
+    for _ in range(8):
+        excess = token_counter(messages) - budget
+        tools = [i for i, message in enumerate(messages) if isinstance(message, ToolMessage) and len(str(message.content)) > 400]
+        if excess <= 0 or not tools:
+            break
+        i = max(tools, key=lambda i: len(str(messages[i].content)))
+        content = str(messages[i].content)
+        # About 4 characters per token
+        keep = max(len(content) - excess * 4, len(content) // 2, 200)
+        messages[i] = messages[i].model_copy(update={"content": content[:keep] + f"\n[{len(content) - keep} characters truncated]"})
+    return messages
+
+# Context of one LLM node: what of the conversation it sees, within `budget` tokens.
+# - completed turns lose their tool calls and results, the last keep_tool_turns excepted
+# - the turn in progress keeps only the latest output of each tool
+# - with an llm, completed turns beyond the last keep_turns are summarized in the background once they reach
+#   summary_trigger tokens; the rolling summary replaces them from the next call on (kept in memory, per thread)
+# - what is still over budget is trimmed from the oldest turns; the turn in progress is kept, with its largest
+#   tool outputs truncated if it does not fit on its own
+class ContextManager:
+    def __init__(
+        self,
+        budget: int = 4000,
+        llm: Optional[BaseChatModel] = None,
+        keep_turns: int = 4,
+        keep_tool_turns: int = 0,
+        summary_trigger: int = 1500,
+        max_threads: int = 10000,
+        token_counter: Callable[[Sequence[BaseMessage]], int] = count_tokens_approximately,
+    ):
+        self.budget = budget
+        self.llm = llm
+        self.keep_turns = keep_turns
+        self.keep_tool_turns = keep_tool_turns
+        self.summary_trigger = summary_trigger
+        self.max_threads = max_threads
+        self.token_counter = token_counter
+        self.summaries: "OrderedDict[str, Summary]" = OrderedDict()
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.summarized = 0
+        self.trimmed = 0
+
+    def prepare(self, messages: Sequence[BaseMessage], thread_id: Optional[str] = None) -> List[BaseMessage]:
+        messages = convert_to_messages(messages)
+        turns, current = split_turns(messages)
+
+        # Turns covered by the thread's summary are replaced by it
+        summary = self._summary(thread_id, messages)
+        if summary is not None:
+            covered = next(i for i, turn in enumerate(turns) if turn[-1].id == summary.until_id) + 1
+            turns = turns[covered:]
+
+        if self.llm is not None and thread_id is not None:
+            self._maybe_summarize(thread_id, turns[:max(len(turns) - self.keep_turns, 0)], summary)
+
+        cut = max(len(turns) - self.keep_tool_turns, 0)
+        history = [message for turn in turns[:cut] for message in compact_turn(turn)]
+        history += [message for turn in turns[cut:] for message in turn]
+        current = drop_stale_tool_outputs(current)
+        if self.token_counter(current) > self.budget:
+            current = truncate_tool_outputs(current, self.budget, self.token_counter)
+        if summary is not None:
+            history.insert(0, SystemMessage(f"Summary of the earlier conversation:\n{summary.text}"))
+
+        # The turn in progress is kept, the history gets what is left of the budget
+        remaining = self.budget - self.token_counter(current)
+        if history and self.token_counter(history) > remaining:
+            history = trim_messages(
+                history,
+                max_tokens=max(remaining, 0),
+                token_counter=self.token_counter,
+                strategy="last",
+                start_on="human",
+                include_system=summary is not None,
+                allow_partial=False,
+            )
+            with self.lock:
+                self.trimmed += 1
+        return history + current
+
+    # pre_model_hook of create_react_agent: the LLM sees the prepared messages, the state keeps them all
+    def pre_model_hook(self, state: dict, config: RunnableConfig) -> dict:
+        return {"llm_input_messages": self.prepare(state["messages"], _thread_id(config))}
+
+    def _summary(self, thread_id: Optional[str], messages: Sequence[BaseMessage]) -> Optional[Summary]:
+        if thread_id is None:
+            return None
+        with self.lock:
+            summary = self.summaries.get(thread_id)
+            if summary is not None:
+                self.summaries.move_to_end(thread_id)
+        # Stale when the history it covers is gone (thread deleted and restarted)
+        if summary is not None and not any(message.id == summary.until_id and _is_final_answer(message) for message in messages):
+            return None
+        return summary
+
+    def _maybe_summarize(self, thread_id: str, turns: List[List[BaseMessage]], summary: Optional[Summary]) -> None:
+        if not turns:
+            return
+        messages = [message for turn in turns for message in compact_turn(turn)]
+        if self.token_counter(messages) < self.summary_trigger:
+            return
+        with self.lock:
+            if thread_id in self.pending:
+                return
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+            self.pending[thread_id] = self.executor.submit(self._summarize, thread_id, messages, summary, turns[-1][-1].id)
+
+    def _summarize(self, thread_id: str, messages: List[BaseMessage], summary: Optional[Summary], until_id: str) -> None:
+        try:
+            transcript = "\n".join(f"{message.type}: {message.content}" for message in messages)
+            prompt = SUMMARY_PROMPT.format(summary=summary.text if summary is not None else "(none)", messages=transcript)
+            text = self.llm.invoke([HumanMessage(prompt)]).content
+            with self.lock:
+                self.summaries[thread_id] = Summary(text, until_id)
+                self.summaries.move_to_end(thread_id)
+                while len(self.summaries) > self.max_threads:
+                    self.summaries.popitem(last=False)
+                self.summarized += 1
+        except Exception:
+            # The turns stay in the history, trimmed to the budget; the next call tries again
+            logger.exception("Could not summarize thread %s", thread_id)
+        finally:
+            with self.lock:
+                self.pending.pop(thread_id, None)
+
+    # Wait for the summaries in progress, for tests and benchmarks
+    def flush(self) -> None:
+        with self.lock:
+            pending = list(self.pending.values())
+        for future in pending:
+            future.result()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"summaries": self.summarized, "threads": len(self.summaries), "trimmed_calls": self.trimmed}
+
+def _thread_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+# Context manager of one LLM node, configured from environment variables:
+# CONTEXT_BUDGET_<NODE> tokens, and for the supervisor the rolling summary settings
+def get_context_manager(node: str, llm: Optional[BaseChatModel] = None) -> ContextManager:
+    return ContextManager(
+        budget=int(os.getenv(f"CONTEXT_BUDGET_{node.upper()}", "4000")),
+        llm=llm if os.getenv("CONTEXT_SUMMARY", "1") == "1" else None,
+        keep_turns=int(os.getenv("CONTEXT_KEEP_TURNS", "4")),
+        keep_tool_turns=int(os.getenv("CONTEXT_KEEP_TOOL_TURNS", "0")),
+        summary_trigger=int(os.getenv("CONTEXT_SUMMARY_TRIGGER", "1500")),
+    )
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from tools.metrics import NODE_TIMEOUTS
+
+# Deadline of a request, in the "configurable" of its graph config: its end on the time.monotonic() clock,
+# and its budget in seconds. Every node, subgraph and tool of the run sees it.
+def deadline_config(timeout: Optional[float]) -> dict:
+    if timeout is None:
+        return {}
+    return {"deadline": time.monotonic() + timeout, "timeout": timeout}
+
+# Seconds left until the request's deadline, None without one
+def remaining(config: Optional[RunnableConfig]) -> Optional[float]:
+    deadline = ((config or {}).get("configurable") or {}).get("deadline")
+    return deadline - time.monotonic() if deadline is not None else None
+
+# Tool results that only give the agents context, not answers
+CONTEXT_TOOLS = ("sql_db_list_tables", "sql_db_schema")
+
+# Best answer of a turn that ran out of time: the last answer an LLM wrote in the turn, or else the last tool result
+# (query result, retrieved documents), or else an apology. The turn starts after the question with id turn_message_id;
+# without it in messages (the run never started) the answer is the apology. Messages the graph writes itself
+# (notes of stopped agents, table lists) carry no token usage, and are skipped.
+def partial_answer(messages: Sequence[BaseMessage], turn_message_id: Optional[str], timeout: Optional[float]) -> str:
+    start = next((i + 1 for i, message in enumerate(messages) if message.id == turn_message_id), len(messages))
+    turn = [message for message in messages[start:] if isinstance(message.content, str) and message.content.strip()]
+    answer = next((message.content for message in reversed(turn) if isinstance(message, AIMessage) and message.usage_metadata and not message.tool_calls), None)
+    if answer is None:
+        answer = next((message.content for message in reversed(turn) if isinstance(message, ToolMessage) and message.name not in CONTEXT_TOOLS and message.status != "error"), None)
+    if answer is None:
+        answer = f"Sorry, I could not answer within {timeout:g} seconds." if timeout else "Sorry, I could not answer in time."
+    return answer
+
+# Raised by Deadlines.run/arun when a node is stopped at the end of its budget (seconds, 0 when none was left)
+class DeadlineExceeded(Exception):
+    def __init__(self, node: str, budget: float):
+        super().__init__(f"{node} ran out of its {budget:g} seconds")
+        self.node = node
+        self.budget = budget
+
+# Time limits of the graph's nodes within the request's deadline:
+# - node_timeouts: seconds per node, by its path as in the metrics, e.g. {"research_agent": 30, "sql_agent/generate_query": 20}
+# - reserve: fraction of the request's budget the agents leave at its end, for the supervisor to answer from their partial results
+# - max_queries: queries a SQL agent may run on one task before it stops with the last result
+# Async calls past their budget are cancelled (in-flight LLM requests and tool calls included). Sync calls
+# cannot be interrupted, they are only refused once the budget is spent.
+class Deadlines:
+    def __init__(self, node_timeouts: Optional[Dict[str, float]] = None, reserve: float = 0.2, max_queries: int = 5):
+        self.node_timeouts = dict(node_timeouts or {})
+        self.reserve = reserve
+        self.max_queries = max_queries
+        self.lock = threading.Lock()
+        self.timeouts: Dict[str, int] = defaultdict(int)
+        self.query_caps = 0
+        self.partial_answers = 0
+
+    # Seconds node may still take: its own timeout (or the default given), cut at the request's deadline less the reserve
+    def budget(self, node: str, config: Optional[RunnableConfig], timeout: Optional[float] = None) -> Optional[float]:
+        timeout = self.node_timeouts.get(node, timeout)
+        configurable = (config or {}).get("configurable") or {}
+        if configurable.get("deadline") is not None:
+            left = configurable["deadline"] - time.monotonic() - self.reserve * configurable.get("timeout", 0)
+            timeout = left if timeout is None else min(timeout, left)
+        return timeout
+
+    def timed_out(self, node: str) -> None:
+        with self.lock:
+            self.timeouts[node] += 1
+        NODE_TIMEOUTS.inc(node=node)
+
+    # Await call() within node's budget; raises DeadlineExceeded after cancelling it.
+    # A TimeoutError of call()'s own (an LLM or HTTP client's) propagates as it is.
+    async def arun(self, node: str, config: Optional[RunnableConfig], call: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        budget = self.budget(node, config, timeout)
+        if budget is None:
+            return await call()
+        if budget <= 0:
+            self.timed_out(node)
+            raise DeadlineExceeded(node, 0)
+        try:
+            async with asyncio.timeout(budget) as scope:
+                return await call()
+        except TimeoutError:
+            if not scope.expired():
+                raise
+            self.timed_out(node)
+            raise DeadlineExceeded(node, budget) from None
+
+    # Sync twin: call() runs to the end, unless the budget is already spent
+    def run(self, node: str, config: Optional[RunnableConfig], call: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        budget = self.budget(node, config, timeout)
+        if budget is not None and budget <= 0:
+            self.timed_out(node)
+            raise DeadlineExceeded(node, 0)
+        return call()
+
+    def query_capped(self) -> None:
+        with self.lock:
+            self.query_caps += 1
+
+    def partial_answer(self, messages: Sequence[BaseMessage], turn_message_id: Optional[str], timeout: Optional[float]) -> str:
+        with self.lock:
+            self.partial_answers += 1
+        return partial_answer(messages, turn_message_id, timeout)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "node_timeouts": sum(self.timeouts.values()),
+                "sql_query_caps": self.query_caps,
+                "partial_answers": self.partial_answers,
+                **{f"timeouts.{node}": count for node, count in sorted(self.timeouts.items())},
+            }
+
+# Node timeouts from NODE_TIMEOUTS, a JSON object of seconds by node path, e.g. {"research_agent": 30, "sql_agent/generate_query": 20};
+# DEADLINE_RESERVE is the agents' share of the request's budget left to the supervisor, SQL_MAX_QUERIES the queries per SQL task
+def get_deadlines() -> Deadlines:
+    return Deadlines(
+        node_timeouts={node: float(seconds) for node, seconds in json.loads(os.getenv("NODE_TIMEOUTS", "{}")).items()},
+        reserve=float(os.getenv("DEADLINE_RESERVE", "0.2")),
+        max_queries=int(os.getenv("SQL_MAX_QUERIES", "5")),
+    )
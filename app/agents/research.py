@@ -1,14 +1,19 @@
+from typing import Optional
 from dotenv import load_dotenv
 from langchain_tavily import TavilySearch
+from langchain_core.tools.base import BaseTool
 from langgraph.prebuilt import create_react_agent
 from langchain_core.language_models.chat_models import BaseChatModel
 from langgraph.graph.state import CompiledStateGraph
+from tools.search_cache import get_search_tool
 
 # Load TavilySearch environment variables from .env file
 load_dotenv()
 
-def create_research_agent(llm: BaseChatModel) -> CompiledStateGraph: 
-    web_search = TavilySearch(max_results=3)
+# web_search defaults to Tavily behind the search cache (SEARCH_CACHE); benchmarks pass a local stand-in
+def create_research_agent(llm: BaseChatModel, web_search: Optional[BaseTool] = None) -> CompiledStateGraph: 
+    if web_search is None:
+        web_search = get_search_tool(TavilySearch(max_results=3))
     research_agent = create_react_agent(
         model=llm,
         tools=[web_search],
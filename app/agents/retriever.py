@@ -1,6 +1,12 @@
 from langchain.tools.retriever import create_retriever_tool
 from langchain_core.vectorstores import VectorStore
 from langchain_core.tools.simple import Tool
+from langchain_core.tools.base import BaseTool
+from typing import Literal, Optional
+from langchain_core.messages import AIMessage, ToolMessage, convert_to_messages
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, MessagesState
+from agents.speculation import Speculator
 
 def get_retriever_tool(vectorstore: VectorStore, description: str, document_prompt: str) -> Tool:
     retriever = vectorstore.as_retriever()
@@ -9,4 +15,27 @@ def get_retriever_tool(vectorstore: VectorStore, description: str, document_prom
         description, #"retrieve_blog_posts",
         document_prompt, #"Search and return information about Lilian Weng blog posts.",
     )
-    return retriever_tool
\ No newline at end of file
+    return retriever_tool
+
+# Entry point of the retriever agent, target of the transfer_to_retriever handoff:
+# records the task description and turns it into a retriever tool call, which the "retrieve" ToolNode then executes.
+# With a speculator, the retrieval prefetched on the user's question is used instead when there is one.
+def get_retriever_entry_node(retriever_tool: BaseTool, speculator: Optional[Speculator] = None):
+    def retriever(state: MessagesState, config: RunnableConfig):
+        task_description_message = convert_to_messages(state["messages"])[-1]
+        tool_call = {
+            "name": retriever_tool.name,
+            "args": {"query": task_description_message.content},
+            "id": "retriever",
+            "type": "tool_call",
+        }
+        messages = [task_description_message, AIMessage(content="", tool_calls=[tool_call])]
+        documents = speculator.take(config, "retriever", task_description_message.content) if speculator is not None else None
+        if documents is not None:
+            messages.append(ToolMessage(content=documents, name=retriever_tool.name, tool_call_id=tool_call["id"]))
+        return {"messages": messages}
+    return retriever
+
+# The retrieve ToolNode runs unless the entry node already answered the tool call with prefetched documents
+def route_after_retriever(state: MessagesState) -> Literal["retrieve", "__end__"]:
+    return END if isinstance(state["messages"][-1], ToolMessage) else "retrieve"
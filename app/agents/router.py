@@ -0,0 +1,106 @@
+import os
+import json
+import asyncio
+import threading
+from typing import List, Literal, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableConfig
+from langgraph.types import Command, Send
+from agents.state import ChatState
+
+# Agents the router may hand over to directly. Examples labelled "supervisor"
+# (multi-part questions, chit-chat, ...) are never routed locally.
+AGENTS = ("research_agent", "retriever", "sql_agent")
+
+# Nearest-centroid classifier over sentence embeddings, trained from labelled example questions
+class EmbeddingRouter:
+    def __init__(self, embedding: Embeddings, examples: List[Tuple[str, str]], temperature: float = 0.05):
+        self.embedding = embedding
+        self.temperature = temperature
+        self.labels = sorted({label for _, label in examples})
+        vectors = self._normalize(np.asarray(embedding.embed_documents([q for q, _ in examples]), dtype=np.float32))
+        label_of = np.asarray([label for _, label in examples])
+        self.centroids = self._normalize(np.stack([vectors[label_of == label].mean(axis=0) for label in self.labels]))
+        self.lock = threading.Lock()
+        self.routed = 0
+        self.deferred = 0
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    # Examples file: one JSON object per line, {"question": ..., "route": ...}
+    @classmethod
+    def from_file(cls, path: str, embedding: Embeddings, **kwargs) -> "EmbeddingRouter":
+        return cls(embedding, load_examples(path), **kwargs)
+
+    # Most likely label and its probability (softmax over centroid similarities)
+    def route(self, question: str) -> Tuple[str, float]:
+        return self.route_batch([question])[0]
+
+    def route_batch(self, questions: List[str]) -> List[Tuple[str, float]]:
+        vectors = self._normalize(np.asarray(self.embedding.embed_documents(questions), dtype=np.float32))
+        logits = vectors @ self.centroids.T / self.temperature
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        return [(self.labels[i], float(p[i])) for i, p in zip(best, probs)]
+
+    def record(self, routed: bool) -> None:
+        with self.lock:
+            if routed:
+                self.routed += 1
+            else:
+                self.deferred += 1
+
+    # Each routed question saves the supervisor's routing LLM call
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.routed + self.deferred
+            return {
+                "routed": self.routed,
+                "deferred_to_supervisor": self.deferred,
+                "llm_calls_saved": self.routed,
+                "route_rate": self.routed / total if total else 0.0,
+            }
+
+def load_examples(path: str) -> List[Tuple[str, str]]:
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(row["question"], row["route"]) for row in rows]
+
+def create_router_node(router: EmbeddingRouter, threshold: float):
+    # Confident routes skip the supervisor LLM and go straight to the agent, the same way a handoff
+    # tool would; everything else goes to the supervisor as before
+    def route_question(state: ChatState, config: RunnableConfig) -> Command[Literal["supervisor", "research_agent", "retriever", "sql_agent"]]:
+        messages = state["messages"]
+        # Follow-up questions ("which of those ...") need the conversation, which only the supervisor
+        # can fold into a task description. Only the first question of a thread is routed locally.
+        if len(messages) == 1:
+            question = messages[-1].content
+            label, confidence = router.route(question)
+            if label in AGENTS and confidence >= threshold:
+                router.record(routed=True)
+                # A standalone question is its own complete task description
+                task_description_message = {"role": "user", "content": question}
+                return Command(goto=[Send(label, {**state, "messages": [task_description_message]})])
+        router.record(routed=False)
+        return Command(goto="supervisor")
+
+    # Embedding runs in a worker thread, off the event loop
+    async def aroute_question(state: ChatState, config: RunnableConfig):
+        return await asyncio.to_thread(route_question, state, config)
+
+    return route_question, aroute_question
+
+# Router trained from the bundled examples, configured from environment variables
+def get_router(embedding: Embeddings) -> EmbeddingRouter:
+    base_dir = os.path.dirname(os.path.abspath(__file__))  # this gives /code/app/agents
+    app_dir = os.path.abspath(os.path.join(base_dir, '..'))  # move one level up to /code/app
+    return EmbeddingRouter.from_file(
+        os.getenv("ROUTER_EXAMPLES", os.path.join(app_dir, "data", "router_examples.jsonl")),
+        embedding,
+        temperature=float(os.getenv("ROUTER_TEMPERATURE", "0.05")),
+    )
@@ -0,0 +1,135 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+from langchain_core.messages import convert_to_messages
+from langchain_core.runnables import RunnableConfig
+from agents.state import ChatState
+
+logger = logging.getLogger(__name__)
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+@dataclass
+class _Speculation:
+    question: str
+    # First question of its thread: it is its own task description, whatever words the supervisor hands over
+    standalone: bool
+    started: float = field(default_factory=time.perf_counter)
+    futures: Dict[str, Future] = field(default_factory=dict)
+
+# Speculative prefetch of the agents' first lookup, run while the supervisor LLM decides where the question goes.
+# Agents register a cheap, side effect free prefetch by name (the retriever's vector search, the SQL agents' schema index lookup).
+# At the start of a turn every prefetch runs on the raw question in a worker thread; an agent the question is then handed to
+# takes its result instead of doing the lookup. Results of agents that were not called are discarded when the thread's
+# next turn starts, after ttl seconds, or when more than max_threads threads have pending results.
+class Speculator:
+    def __init__(self, max_workers: int = 4, ttl: float = 60.0, max_threads: int = 1024):
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self.prefetches: Dict[str, Callable[[str], Any]] = {}
+        self.pending: "OrderedDict[str, _Speculation]" = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculate")
+        self.lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.errors = 0
+        self.saved_seconds = 0.0
+        self.wasted_seconds = 0.0
+
+    def register(self, name: str, prefetch: Callable[[str], Any]) -> None:
+        self.prefetches[name] = prefetch
+
+    @staticmethod
+    def _timed(prefetch: Callable[[str], Any], question: str) -> Tuple[Any, float]:
+        start = time.perf_counter()
+        return prefetch(question), time.perf_counter() - start
+
+    def _discard(self, future: Future) -> None:
+        self.discarded += 1
+        if not future.cancel() and future.done() and future.exception() is None:
+            self.wasted_seconds += future.result()[1]
+
+    def start(self, thread_id: str, question: str, standalone: bool) -> None:
+        speculation = _Speculation(question, standalone)
+        for name, prefetch in self.prefetches.items():
+            speculation.futures[name] = self.executor.submit(self._timed, prefetch, question)
+        with self.lock:
+            self.started += len(speculation.futures)
+            previous = self.pending.pop(thread_id, None)
+            for future in previous.futures.values() if previous is not None else ():
+                self._discard(future)
+            self.pending[thread_id] = speculation
+            while len(self.pending) > self.max_threads:
+                for future in self.pending.popitem(last=False)[1].futures.values():
+                    self._discard(future)
+
+    # Prefetched result of agent name for the turn of this thread, or None when there is none or it does not fit the task:
+    # the task must be the question itself, or the question must stand on its own
+    def take(self, config: Optional[RunnableConfig], name: str, task: str) -> Optional[Any]:
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        if thread_id is None:
+            return None
+        with self.lock:
+            speculation = self.pending.get(str(thread_id))
+            future = speculation.futures.pop(name, None) if speculation is not None else None
+            if future is None:
+                return None
+            if not speculation.futures:
+                del self.pending[str(thread_id)]
+            if time.perf_counter() - speculation.started > self.ttl or not (
+                speculation.standalone or _normalize(task) == _normalize(speculation.question)
+            ):
+                self.misses += 1
+                self._discard(future)
+                return None
+        start = time.perf_counter()
+        try:
+            value, seconds = future.result()
+        except Exception:
+            logger.warning("Speculative prefetch for %s failed", name, exc_info=True)
+            with self.lock:
+                self.errors += 1
+            return None
+        with self.lock:
+            self.hits += 1
+            # The lookup would have taken seconds from now on, the agent only waited for the rest of it
+            self.saved_seconds += max(0.0, seconds - (time.perf_counter() - start))
+        return value
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "started": self.started,
+                "hits": self.hits,
+                "misses": self.misses,
+                "discarded": self.discarded,
+                "errors": self.errors,
+                "hit_rate": self.hits / self.started if self.started else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "wasted_seconds": self.wasted_seconds,
+                "pending_threads": len(self.pending),
+            }
+
+# Node started at START, next to the entry node: starts the prefetches for the new question and returns at once
+def create_speculation_node(speculator: Speculator):
+    def speculate(state: ChatState, config: RunnableConfig):
+        thread_id = config.get("configurable", {}).get("thread_id")
+        messages = convert_to_messages(state["messages"])
+        if thread_id is not None and messages and messages[-1].type == "human":
+            speculator.start(str(thread_id), messages[-1].content, standalone=len(messages) == 1)
+        return {}
+    return speculate
+
+def get_speculator() -> Speculator:
+    return Speculator(
+        max_workers=int(os.getenv("SPECULATION_WORKERS", "4")),
+        ttl=float(os.getenv("SPECULATION_TTL_SECONDS", "60")),
+    )
@@ -1,83 +1,20 @@
-from typing import Literal, List
+from typing import Dict, Literal, List, Optional
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.tools.base import BaseTool
 from langchain_community.utilities import SQLDatabase
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import ToolNode
-from langgraph.graph import MessagesState
+from langgraph.graph import StateGraph, START, MessagesState, END
+from langgraph.graph.state import CompiledStateGraph
+from agents.context import ContextManager
+from agents.deadline import DeadlineExceeded, Deadlines
+from agents.speculation import Speculator
+from agents.state import dual_node
+from tools.schema_index import SchemaIndex
+from tools.sql_validator import SQLValidator
 
-# Global avr
-llm = None
-tools = None
-db = None
-
-# Get Set Global vars
-def get_llm() -> BaseChatModel:
-    return llm
-
-def set_llm(value: BaseChatModel):
-    global llm
-    llm = value
-
-def get_tools() -> List[BaseTool]:
-    return tools
-
-def set_tools(value: List[BaseTool]):
-    global tools
-    tools = value
-
-def get_db() -> SQLDatabase:
-    return db
-
-def set_db(value: SQLDatabase):
-    global db
-    db = value
-
-# Get table schema
-# Use set_tools to set tool before running this function
-def get_get_schema_node() -> ToolNode:
-    get_schema_tool = next(tool for tool in tools if tool.name == "sql_db_schema")
-    return ToolNode([get_schema_tool], name="get_schema")
-
-# Run SQL query
-# Use set_tools to set tool before running this function
-def get_run_query_node() -> ToolNode:
-    run_query_tool = next(tool for tool in tools if tool.name == "sql_db_query")
-    return ToolNode([run_query_tool], name="run_query")
-
-# Entry point of SQL
-def sql_agent(state: MessagesState):
-    return state
-
-def list_tables(state: MessagesState):
-    tool_call = {
-        "name": "sql_db_list_tables",
-        "args": {},
-        "id": "abc123",
-        "type": "tool_call",
-    }
-    tool_call_message = AIMessage(content="", tool_calls=[tool_call])
-
-    list_tables_tool = next(tool for tool in tools if tool.name == "sql_db_list_tables")
-    tool_message = list_tables_tool.invoke(tool_call)
-    response = AIMessage(f"Available tables: {tool_message.content}")
-
-    return {"messages": [tool_call_message, tool_message, response]}
-
-
-# Example: force a model to create a tool call
-def call_get_schema(state: MessagesState):
-    # Note that LangChain enforces that all models accept `tool_choice="any"`
-    # as well as `tool_choice=<string name of tool>`.
-    get_schema_tool = next(tool for tool in tools if tool.name == "sql_db_schema")
-    llm_with_tools = llm.bind_tools([get_schema_tool], tool_choice="any")
-    response = llm_with_tools.invoke(state["messages"])
-
-    return {"messages": [response]}
-
-
-def generate_query(state: MessagesState):
-    generate_query_system_prompt = """
+GENERATE_QUERY_SYSTEM_PROMPT = """
     You are an agent designed to interact with a SQL database.
     Given an input question, create a syntactically correct {dialect} query to run,
     then look at the results of the query and return the answer. Unless the user
@@ -89,26 +26,9 @@ def generate_query(state: MessagesState):
     only ask for the relevant columns given the question.
 
     DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
-    """.format(
-        dialect=db.dialect,
-        top_k=5,
-    )
-    
-    system_message = {
-        "role": "system",
-        "content": generate_query_system_prompt,
-    }
-    # We do not force a tool call here, to allow the model to
-    # respond naturally when it obtains the solution.
-    run_query_tool = next(tool for tool in tools if tool.name == "sql_db_query")
-    llm_with_tools = llm.bind_tools([run_query_tool])
-    response = llm_with_tools.invoke([system_message] + state["messages"])
-
-    return {"messages": [response]}
-
-
-def check_query(state: MessagesState):
-    check_query_system_prompt = """
+    """
+
+CHECK_QUERY_SYSTEM_PROMPT = """
     You are a SQL expert with a strong attention to detail.
     Double check the {dialect} query for common mistakes, including:
     - Using NOT IN with NULL values
@@ -124,27 +44,255 @@ def check_query(state: MessagesState):
     just reproduce the original query.
 
     You will call the appropriate tool to execute the query after running this check.
-    """.format(dialect=db.dialect)
+    """
+
+# SQL agent of one database: question -> schema -> query loop -> answer.
+# Everything a node needs is prepared once here (tools by name, models with their tools bound, system prompts),
+# and the subgraph is compiled once; agents of different databases share no state.
+# - schema_index: relevant DDL comes from the precomputed index instead of the list_tables / call_get_schema round trip
+# - sql_validator: queries passing the static checks skip the check_query LLM call
+# - context: the LLM nodes see the conversation within its token budget
+# - speculator: the schema index lookup is prefetched on the user's question while the supervisor decides
+# - deadlines: generate_query, check_query and run_query stop at their NODE_TIMEOUTS and the request's deadline,
+#   and the query loop stops after max_queries queries, leaving the last result to the supervisor
+# The supervisor hands tasks over to it by name, description says what the database holds.
+class SQLAgent:
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        tools: List[BaseTool],
+        db: SQLDatabase,
+        name: str = "sql_agent",
+        description: str = "the chinook database of songs",
+        schema_index: Optional[SchemaIndex] = None,
+        sql_validator: Optional[SQLValidator] = None,
+        context: Optional[ContextManager] = None,
+        top_k: int = 5,
+        speculator: Optional[Speculator] = None,
+        deadlines: Optional[Deadlines] = None,
+    ):
+        self.name = name
+        self.description = description
+        self.db = db
+        self.schema_index = schema_index
+        self.sql_validator = sql_validator
+        self.context = context
+        self.speculator = speculator
+        self.deadlines = deadlines if deadlines is not None else Deadlines()
+        self.tools: Dict[str, BaseTool] = {tool.name: tool for tool in tools}
+        self.list_tables_tool = self.tools["sql_db_list_tables"]
+        self.get_schema_tool = self.tools["sql_db_schema"]
+        self.run_query_tool = self.tools["sql_db_query"]
+        # Pages of truncated results, when the tools render results in pages
+        self.query_tools = [self.run_query_tool] + ([self.tools["sql_db_next_page"]] if "sql_db_next_page" in self.tools else [])
+        self.run_query_node = ToolNode(self.query_tools, name="run_query")
+
+        # Note that LangChain enforces that all models accept `tool_choice="any"`
+        # as well as `tool_choice=<string name of tool>`.
+        self.call_get_schema_model = llm.bind_tools([self.get_schema_tool], tool_choice="any")
+        # We do not force a tool call here, to allow the model to
+        # respond naturally when it obtains the solution.
+        self.generate_query_model = llm.bind_tools(self.query_tools)
+        self.check_query_model = llm.bind_tools([self.run_query_tool], tool_choice="any")
+        self.generate_query_system_message = {"role": "system", "content": GENERATE_QUERY_SYSTEM_PROMPT.format(dialect=db.dialect, top_k=top_k)}
+        self.check_query_system_message = {"role": "system", "content": CHECK_QUERY_SYSTEM_PROMPT.format(dialect=db.dialect)}
+
+        if speculator is not None and schema_index is not None:
+            speculator.register(self.name, self.select_schema)
+        self.graph = self._build()
+
+    def _build(self) -> CompiledStateGraph:
+        builder = StateGraph(MessagesState)
+        # LLM and tool nodes have async twins so astream never blocks the event loop
+        builder.add_node("generate_query", dual_node("generate_query", self.generate_query, self.agenerate_query))
+        builder.add_node("check_query", dual_node("check_query", self.check_query, self.acheck_query))
+        builder.add_node("run_query", dual_node("run_query", self.run_query, self.arun_query))
+
+        if self.schema_index is not None:
+            # Relevant DDL comes from the precomputed schema index
+            builder.add_node("lookup_schema", self.lookup_schema)
+            builder.add_edge(START, "lookup_schema")
+            builder.add_edge("lookup_schema", "generate_query")
+        else:
+            # LLM picks the tables to inspect
+            builder.add_node("list_tables", dual_node("list_tables", self.list_tables, self.alist_tables))
+            builder.add_node("call_get_schema", dual_node("call_get_schema", self.call_get_schema, self.acall_get_schema))
+            builder.add_node("get_schema", ToolNode([self.get_schema_tool], name="get_schema"))
+            builder.add_edge(START, "list_tables")
+            builder.add_edge("list_tables", "call_get_schema")
+            builder.add_edge("call_get_schema", "get_schema")
+            builder.add_edge("get_schema", "generate_query")
+
+        builder.add_conditional_edges(
+            "generate_query",
+            self.should_continue,
+            {"supervisor": END, "check_query": "check_query", "run_query": "run_query"},
+        )
+        builder.add_edge("check_query", "run_query")
+        builder.add_edge("run_query", "generate_query")
+        return builder.compile(name=self.name)
+
+    # Messages the LLM nodes see: all of them, or what the context manager keeps within its budget
+    def _llm_messages(self, state: MessagesState) -> list:
+        return self.context.prepare(state["messages"]) if self.context is not None else state["messages"]
+
+    @staticmethod
+    def _list_tables_call() -> tuple:
+        tool_call = {
+            "name": "sql_db_list_tables",
+            "args": {},
+            "id": "abc123",
+            "type": "tool_call",
+        }
+        return AIMessage(content="", tool_calls=[tool_call]), tool_call
+
+    def list_tables(self, state: MessagesState):
+        tool_call_message, tool_call = self._list_tables_call()
+        tool_message = self.list_tables_tool.invoke(tool_call)
+        response = AIMessage(f"Available tables: {tool_message.content}")
+
+        return {"messages": [tool_call_message, tool_message, response]}
+
+    async def alist_tables(self, state: MessagesState):
+        tool_call_message, tool_call = self._list_tables_call()
+        # Tool runs in the default executor, off the event loop
+        tool_message = await self.list_tables_tool.ainvoke(tool_call)
+        response = AIMessage(f"Available tables: {tool_message.content}")
 
-    system_message = {
-            "role": "system",
-            "content": check_query_system_prompt,
+        return {"messages": [tool_call_message, tool_message, response]}
+
+    # Names and DDL of the tables relevant to the question
+    def select_schema(self, question: str) -> tuple:
+        table_names = self.schema_index.select_tables(question)
+        return table_names, self.schema_index.get_table_info(table_names)
+
+    # Look up the relevant tables in the precomputed schema index, no LLM call needed (or take the speculative lookup).
+    # Messages mimic a sql_db_schema tool call so generate_query sees the same context as the LLM path.
+    def lookup_schema(self, state: MessagesState, config: RunnableConfig):
+        question = state["messages"][-1].content
+        schema = self.speculator.take(config, self.name, question) if self.speculator is not None else None
+        table_names, table_info = schema or self.select_schema(question)
+        tool_call = {
+            "name": "sql_db_schema",
+            "args": {"table_names": ", ".join(table_names)},
+            "id": "lookup_schema",
+            "type": "tool_call",
         }
+        tool_call_message = AIMessage(content="", tool_calls=[tool_call])
+        tool_message = ToolMessage(
+            content=table_info,
+            name="sql_db_schema",
+            tool_call_id=tool_call["id"],
+        )
+
+        return {"messages": [tool_call_message, tool_message]}
+
+    # Example: force a model to create a tool call
+    def call_get_schema(self, state: MessagesState):
+        response = self.call_get_schema_model.invoke(self._llm_messages(state))
+
+        return {"messages": [response]}
+
+    async def acall_get_schema(self, state: MessagesState):
+        response = await self.call_get_schema_model.ainvoke(self._llm_messages(state))
+
+        return {"messages": [response]}
+
+    def _generate_query_input(self, state: MessagesState) -> list:
+        return [self.generate_query_system_message] + self._llm_messages(state)
+
+    # Stop the query loop once max_queries queries ran on the task, the results so far stay in the messages
+    def _query_cap(self, state: MessagesState) -> Optional[dict]:
+        query_tool_names = {tool.name for tool in self.query_tools}
+        queries = sum(
+            1 for message in state["messages"]
+            if isinstance(message, AIMessage) and any(tool_call["name"] in query_tool_names for tool_call in message.tool_calls)
+        )
+        if queries < self.deadlines.max_queries:
+            return None
+        self.deadlines.query_capped()
+        return {"messages": [AIMessage(f"{self.name} stopped after {queries} queries without an answer.", name=self.name)]}
+
+    def _out_of_time(self) -> dict:
+        return {"messages": [AIMessage(f"{self.name} ran out of time before answering.", name=self.name)]}
+
+    def generate_query(self, state: MessagesState, config: RunnableConfig):
+        if (capped := self._query_cap(state)) is not None:
+            return capped
+        try:
+            response = self.deadlines.run(f"{self.name}/generate_query", config, lambda: self.generate_query_model.invoke(self._generate_query_input(state)))
+        except DeadlineExceeded:
+            return self._out_of_time()
+
+        return {"messages": [response]}
+
+    async def agenerate_query(self, state: MessagesState, config: RunnableConfig):
+        if (capped := self._query_cap(state)) is not None:
+            return capped
+        try:
+            response = await self.deadlines.arun(f"{self.name}/generate_query", config, lambda: self.generate_query_model.ainvoke(self._generate_query_input(state)))
+        except DeadlineExceeded:
+            return self._out_of_time()
+
+        return {"messages": [response]}
+
+    def _check_query_input(self, state: MessagesState) -> list:
+        # Generate an artificial user message to check
+        tool_call = next(tool_call for tool_call in state["messages"][-1].tool_calls if tool_call["name"] == self.run_query_tool.name)
+        user_message = {"role": "user", "content": tool_call["args"]["query"]}
+        # Point the LLM at what the static validator found; should_continue already validated this query,
+        # so the issues come from the validator's memo rather than a second EXPLAIN
+        if self.sql_validator is not None and (issues := self.sql_validator.validate(tool_call["args"]["query"])):
+            user_message["content"] += "\n\n-- Possible issues:\n" + "\n".join(f"-- {issue}" for issue in issues)
+        return [self.check_query_system_message, user_message]
+
+    # Out of time, the query runs as generated, unchecked
+    def check_query(self, state: MessagesState, config: RunnableConfig):
+        try:
+            response = self.deadlines.run(f"{self.name}/check_query", config, lambda: self.check_query_model.invoke(self._check_query_input(state)))
+        except DeadlineExceeded:
+            return {"messages": []}
+        response.id = state["messages"][-1].id
+
+        return {"messages": [response]}
+
+    async def acheck_query(self, state: MessagesState, config: RunnableConfig):
+        try:
+            response = await self.deadlines.arun(f"{self.name}/check_query", config, lambda: self.check_query_model.ainvoke(self._check_query_input(state)))
+        except DeadlineExceeded:
+            return {"messages": []}
+        response.id = state["messages"][-1].id
+
+        return {"messages": [response]}
+
+    # Every tool call gets an answer, an error when the query did not finish in time
+    def _query_timed_out(self, state: MessagesState) -> dict:
+        return {"messages": [
+            ToolMessage(content="Error: the query did not finish in time.", name=tool_call["name"], tool_call_id=tool_call["id"], status="error")
+            for tool_call in state["messages"][-1].tool_calls
+        ]}
+
+    def run_query(self, state: MessagesState, config: RunnableConfig):
+        try:
+            return self.deadlines.run(f"{self.name}/run_query", config, lambda: self.run_query_node.invoke(state, config))
+        except DeadlineExceeded:
+            return self._query_timed_out(state)
+
+    # A query already running in its worker thread finishes there, its result is dropped
+    async def arun_query(self, state: MessagesState, config: RunnableConfig):
+        try:
+            return await self.deadlines.arun(f"{self.name}/run_query", config, lambda: self.run_query_node.ainvoke(state, config))
+        except DeadlineExceeded:
+            return self._query_timed_out(state)
 
-    # Generate an artificial user message to check
-    tool_call = state["messages"][-1].tool_calls[0]
-    user_message = {"role": "user", "content": tool_call["args"]["query"]}
-    run_query_tool = next(tool for tool in tools if tool.name == "sql_db_query")
-    llm_with_tools = llm.bind_tools([run_query_tool], tool_choice="any")
-    response = llm_with_tools.invoke([system_message, user_message])
-    response.id = state["messages"][-1].id
-
-    return {"messages": [response]}
-
-def should_continue(state: MessagesState) -> Literal["supervisor", "check_query"]:
-    messages = state["messages"]
-    last_message = messages[-1]
-    if not last_message.tool_calls:
-        return "supervisor"
-    else:
-        return "check_query"
\ No newline at end of file
+    # Queries that pass the static validator, and next page requests, go straight to run_query; others get the LLM check
+    def should_continue(self, state: MessagesState) -> Literal["supervisor", "check_query", "run_query"]:
+        messages = state["messages"]
+        last_message = messages[-1]
+        if not last_message.tool_calls:
+            return "supervisor"
+        queries = [tool_call["args"].get("query", "") for tool_call in last_message.tool_calls if tool_call["name"] == self.run_query_tool.name]
+        if not queries or (self.sql_validator is not None and self.sql_validator.can_skip_llm_check(queries)):
+            return "run_query"
+        else:
+            return "check_query"
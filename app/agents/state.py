@@ -0,0 +1,20 @@
+from typing import Annotated, Optional
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import MessagesState
+
+# Reducer of ChatState.branch_results: branches running in parallel each add their result, None clears the list
+def add_branch_results(left: Optional[list], right: Optional[list]) -> list:
+    if right is None:
+        return []
+    return (left or []) + right
+
+# Graph state shared by the supervisor and every agent
+class ChatState(MessagesState):
+    # Id of the user message that started the current turn
+    turn_message_id: str
+    # Results of the agents dispatched in the current supervisor turn, waiting for merge_branches
+    branch_results: Annotated[list, add_branch_results]
+
+# Node that runs its sync function under stream/invoke and its async twin under astream/ainvoke
+def dual_node(name: str, func, afunc) -> RunnableLambda:
+    return RunnableLambda(func, afunc=afunc, name=name)
@@ -1,5 +1,5 @@
 
-from typing import Annotated, List
+from typing import Annotated, List, Optional, Sequence, Tuple
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.tools import tool
 from langchain_core.tools.base import BaseTool
@@ -7,6 +7,7 @@ from langgraph.graph import MessagesState
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import create_react_agent, InjectedState
 from langgraph.types import Command, Send
+from agents.context import ContextManager
 
 def create_task_description_handoff_tool(
     *, agent_name: str, description: str | None = None
@@ -32,7 +33,25 @@ def create_task_description_handoff_tool(
         )
     return handoff_tool
 
-def create_supervisor_agent_with_description(llm: BaseChatModel, tools: List[BaseTool]) -> CompiledStateGraph:
+def create_supervisor_agent_with_description(
+    llm: BaseChatModel,
+    tools: List[BaseTool],
+    parallel: bool = False,
+    context: Optional[ContextManager] = None,
+    extra_agents: Sequence[Tuple[str, str]] = (),
+) -> CompiledStateGraph:
+    # Parallel mode: several handoffs in one turn run concurrently, their results come back together
+    if parallel:
+        dispatch = (
+            "When a question needs several agents, call all of their transfer tools in the same turn; they work in parallel "
+            "and you receive all their results at once. Give each agent only its own part of the question.\n"
+        )
+    else:
+        dispatch = "Assign work to one agent at a time, do not call agents in parallel.\n"
+    # SQL agents of other databases, by name and what their database holds
+    extra = "".join(
+        f"There is also a sql agent of {description}, use transfer_to_{name} for tasks about it.\n" for name, description in extra_agents
+    )
     # Supervisor node
     supervisor_agent_with_description = create_react_agent(
         model=llm,
@@ -43,9 +62,14 @@ def create_supervisor_agent_with_description(llm: BaseChatModel, tools: List[Bas
             "- a retriever agent. The retriever agent retrieve local machine learning related documents. Assign machine learning topic related tasks to this assistant\n"
             "- a sql agent. The sql agent retrieve songs information from chinook databasae. Assign song-related topic tasks to this assistant\n"        
             "Use one of three agents if neccessary: transfer_to_research_agent, transfer_to_retriever, transfer_to_sql_agent. Do Not use other agents.\n"
-            "Assign work to one agent at a time, do not call agents in parallel.\n"
+            + extra + dispatch +
             "The user should only see the final response. When no further tool use is needed, finalize your answer to the user, including relevant references such as web links, document IDs, or database table names."
         ),
         name="supervisor",
+        # The LLM sees the conversation within the context budget, the graph state keeps all of it
+        pre_model_hook=context.pre_model_hook if context is not None else None,
+        # One ToolNode runs all tool calls of a turn and combines their handoffs into a single parent Command.
+        # With v2 every call is a separate task, and only the first task's handoff would reach the parent graph.
+        version="v1",
     )
     return supervisor_agent_with_description
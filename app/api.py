@@ -0,0 +1,515 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from contextlib import aclosing, asynccontextmanager, suppress
+from collections import deque
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.graph import END
+from langgraph.types import StateUpdate
+from agents.deadline import deadline_config, partial_answer, remaining
+from tools.metrics import REGISTRY, REQUESTS_TOTAL, WS_SLOW_CONSUMERS, RequestMetrics, StartupTimer, stats_collector
+from tools.scheduler import LLMRateLimiter, Rejected, Ticket, get_admission_controller
+
+# The chatbot module pulls in the whole graph, it is only imported when the chatbot loads
+if TYPE_CHECKING:
+    from chatbot import Chatbot
+    from langgraph.graph.state import CompiledStateGraph
+
+logger = logging.getLogger(__name__)
+
+# Define Pydantic model for request body
+class QuestionRequest(BaseModel):
+    question: str
+    user_id: str
+    thread_id: str
+    use_cache: bool = True # Set False to skip the semantic answer cache for this request
+    trace: bool = False # Set True to get the node, LLM and tool timings of this request
+    timeout: Optional[float] = Field(None, gt=0) # Seconds to answer within, at most REQUEST_TIMEOUT_SECONDS
+
+# The request's deadline (timeout seconds from now, None for none) goes to every node and tool in the config
+def run_config(request: QuestionRequest, metrics: RequestMetrics, timeout: Optional[float] = None) -> dict:
+    return {
+        "configurable": {
+            "user_id": request.user_id, "thread_id": request.thread_id, "answer_cache": request.use_cache,
+            **deadline_config(timeout),
+        },
+        "callbacks": [metrics.handler],
+    }
+
+# Sometimes supervisor will silence if toolnodes answer the user question.
+# In this case, we return the message from toolnodes
+def final_answer(messages: list[BaseMessage]) -> str:
+    if messages[-1].content:
+        return messages[-1].content #supervisor message
+    else:
+        return messages[-2].content #toolnodes message
+
+# Answer of a run stopped at its deadline: the best partial answer of the turn in the last checkpoint.
+# The turn starts at the question with id turn_message_id, None when the run never started (it timed out in the admission queue).
+# The answer is saved as the turn's answer and the stopped run's pending tasks are dropped, so the next turn of the thread sees it.
+async def timed_out_answer(chatbot: "Chatbot", config: dict, turn_message_id: Optional[str]) -> str:
+    messages = (await chatbot.agent.aget_state(config)).values.get("messages", []) if turn_message_id is not None else []
+    timeout = config["configurable"].get("timeout")
+    if chatbot.deadlines is not None:
+        answer = chatbot.deadlines.partial_answer(messages, turn_message_id, timeout)
+    else:
+        answer = partial_answer(messages, turn_message_id, timeout)
+    # Nothing to save if the question never reached a checkpoint
+    if any(message.id == turn_message_id for message in messages):
+        update = {"branch_results": None}
+        last = messages[-1]
+        # The supervisor may have written its answer already, it is not repeated
+        if not (isinstance(last, AIMessage) and last.name == "supervisor" and not last.tool_calls and last.content == answer):
+            update["messages"] = [AIMessage(answer, name="supervisor")]
+        await chatbot.agent.abulk_update_state(config, [[StateUpdate(update, "merge_branches")], [StateUpdate(None, END)]])
+    return answer
+
+# Record the question and answer of a finished turn in the chat history, if the chatbot keeps one
+async def record_turn(chatbot: "Chatbot", request: "QuestionRequest", answer: str) -> None:
+    if chatbot.history is not None:
+        await chatbot.history.aappend(request.thread_id, request.user_id, [HumanMessage(request.question), AIMessage(answer)])
+
+# Format one Server-Sent Event
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Question of a turn, with the id that marks the start of the turn in the thread's messages
+def question_message(question: str) -> HumanMessage:
+    return HumanMessage(question, id=str(uuid.uuid4()))
+
+# Incremental events of a graph run: ("token", {"node", "message_id", "content"}) for every LLM output delta
+# and ("node", {"node"}) when a node finishes. Closing the generator cancels the run.
+# At the deadline in config the run is cancelled too, and TimeoutError raised.
+async def graph_events(agent: "CompiledStateGraph", question: HumanMessage, config: dict) -> AsyncIterator[Tuple[str, dict]]:
+    async with aclosing(agent.astream(
+        {"messages": [question]},
+        config=config,
+        stream_mode=["messages", "updates"],
+    )) as stream:
+        while True:
+            # The timeout covers the wait for the next event, not the consumer's handling of it
+            try:
+                async with asyncio.timeout(remaining(config)):
+                    mode, chunk = await anext(stream)
+            except StopAsyncIteration:
+                return
+            if mode == "messages":
+                message, metadata = chunk
+                if isinstance(message, AIMessage) and isinstance(message.content, str) and message.content:
+                    # Report the top level node, e.g. "supervisor" rather than its inner "agent" node
+                    node = metadata.get("langgraph_checkpoint_ns", "").split(":")[0] or metadata.get("langgraph_node")
+                    yield "token", {"node": node, "message_id": message.id, "content": message.content}
+            else:
+                for node in chunk:
+                    yield "node", {"node": node}
+
+# Loads the chatbot once, in a worker thread so the event loop keeps serving /health meanwhile
+class ChatbotLoader:
+    def __init__(self, load: Callable[[], "Chatbot"], startup: Optional[StartupTimer] = None):
+        self.load = load
+        self.startup = startup
+        self.task: Optional[asyncio.Future] = None
+        self.chatbot: Optional["Chatbot"] = None
+        self.error: Optional[Exception] = None
+
+    def _load(self) -> "Chatbot":
+        try:
+            self.chatbot = self.load()
+        except Exception as e:
+            self.error = e
+            logger.exception("Chatbot failed to load")
+            raise
+        if self.startup is not None:
+            self.startup.ready()
+        return self.chatbot
+
+    # A failed load is retried by the next request
+    def start(self) -> asyncio.Future:
+        if self.task is None or (self.task.done() and self.chatbot is None):
+            self.error = None
+            self.task = asyncio.ensure_future(asyncio.to_thread(self._load))
+            # The error is logged and reported on /health, do not warn about it again
+            self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self.task
+
+    # Requests arriving before the chatbot is loaded wait for it
+    async def get(self) -> "Chatbot":
+        if self.chatbot is not None:
+            return self.chatbot
+        return await asyncio.shield(self.start())
+
+    def status(self) -> str:
+        if self.chatbot is not None:
+            return "ready"
+        if self.error is not None:
+            return "failed"
+        return "loading" if self.task is not None else "idle"
+
+# Outgoing messages of one WebSocket connection, at most maxsize of them:
+# - token deltas of the same message waiting to be sent are merged, so a slow client gets fewer, larger deltas
+# - other messages wait for room, pausing the turn that sends them (backpressure)
+# - a client that has not made room within timeout seconds is given up on: the buffer closes as overflowed
+class SendBuffer:
+    def __init__(self, maxsize: int = 256, timeout: Optional[float] = 30.0):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.messages: deque = deque()
+        self.changed = asyncio.Condition()
+        self.closed = False
+        self.overflowed = False
+        self.coalesced = 0
+
+    async def put(self, message: dict) -> None:
+        async with self.changed:
+            if self.closed:
+                return
+            last = self.messages[-1] if self.messages else None
+            if (
+                message["type"] == "token" and last is not None and last["type"] == "token"
+                and (last["thread_id"], last["message_id"]) == (message["thread_id"], message["message_id"])
+            ):
+                last["content"] += message["content"]
+                self.coalesced += 1
+                return
+            try:
+                await asyncio.wait_for(self.changed.wait_for(lambda: len(self.messages) < self.maxsize or self.closed), self.timeout)
+            except asyncio.TimeoutError:
+                self.overflowed = self.closed = True
+                self.changed.notify_all()
+                return
+            if not self.closed:
+                self.messages.append(message)
+                self.changed.notify_all()
+
+    # Next message to send, None once closed (pending messages of an overflowed buffer are dropped)
+    async def get(self) -> Optional[dict]:
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.messages or self.closed)
+            if self.overflowed or not self.messages:
+                return None
+            message = self.messages.popleft()
+            self.changed.notify_all()
+            return message
+
+    async def close(self) -> None:
+        async with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+# HTTP and WebSocket API of a chatbot. load_chatbot builds it: at startup in the background when
+# STARTUP_WARMUP=1 (default), otherwise on the first request. /health reports readiness meanwhile.
+# Graph runs go through admission control (ADMISSION_CONTROL=1), which accounts for the LLM's rate_limiter if given.
+def create_app(
+    load_chatbot: Callable[[], "Chatbot"],
+    startup: Optional[StartupTimer] = None,
+    rate_limiter: Optional[LLMRateLimiter] = None,
+) -> FastAPI:
+    loader = ChatbotLoader(load_chatbot, startup)
+    admission = get_admission_controller(rate_limiter)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if os.getenv("STARTUP_WARMUP", "1") == "1":
+            loader.start()
+        yield
+        # Write the chat history still queued before the process exits
+        if loader.chatbot is not None and loader.chatbot.history is not None:
+            await asyncio.to_thread(loader.chatbot.history.close)
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.loader = loader
+
+    # Requests slower than TRACE_SLOW_REQUEST_SECONDS log their trace at WARNING level, 0 disables it
+    slow_request_seconds = float(os.getenv("TRACE_SLOW_REQUEST_SECONDS", "30")) or None
+    # Deadline of a request: its own timeout, at most REQUEST_TIMEOUT_SECONDS (0 leaves requests without a limit of the server's)
+    max_request_seconds = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "120")) or None
+
+    def request_timeout(request: QuestionRequest) -> Optional[float]:
+        if max_request_seconds is None:
+            return request.timeout
+        return min(request.timeout or max_request_seconds, max_request_seconds)
+
+    # Per request metrics; the callback handler times every node, LLM call and tool call of the run
+    def request_metrics(endpoint: str) -> RequestMetrics:
+        return RequestMetrics(endpoint, slow_request_seconds)
+
+    # Admit the request before any work is done: rejected ones get 429/503 with Retry-After right away
+    def admit(endpoint: str, user_id: str) -> Optional[Ticket]:
+        if admission is None:
+            return None
+        try:
+            return admission.enqueue(user_id)
+        except Rejected as e:
+            REQUESTS_TOTAL.inc(endpoint=endpoint, status="rejected")
+            raise HTTPException(status_code=e.status_code, detail=e.reason, headers=e.headers)
+
+    # Waits for the request's slot, the queue wait is part of the request's latency and counts against its deadline.
+    # The graph run starts in its body: a TimeoutError before then means the run never started.
+    @asynccontextmanager
+    async def slot(ticket: Optional[Ticket], config: dict):
+        if ticket is None:
+            yield
+            return
+        async with asyncio.timeout(remaining(config)):
+            await ticket.__aenter__()
+        try:
+            yield
+        finally:
+            await ticket.__aexit__(None, None, None)
+
+    @app.get("/")
+    async def redirect_root_to_docs():
+        return RedirectResponse("/docs")
+
+    # Readiness: 200 once the chatbot is loaded, 503 while loading or after a failed load
+    @app.get("/health")
+    async def health():
+        status = loader.status()
+        body = {"status": status}
+        if startup is not None:
+            body["startup"] = startup.report()
+        if loader.error is not None:
+            body["error"] = str(loader.error)
+        return JSONResponse(body, status_code=200 if status == "ready" else 503)
+
+    # Invoke the graph, return last answer from chatbot.
+    # At the request's deadline the run is cancelled, and the best partial answer returned with "timed_out": true.
+    @app.post("/generate")
+    async def stream_graph_updates(request: QuestionRequest):
+        ticket = admit("generate", request.user_id)
+        with request_metrics("generate") as metrics:
+            try:
+                config = run_config(request, metrics, request_timeout(request))
+                chatbot = await loader.get()
+                agent = chatbot.agent
+                steps = []
+                question = question_message(request.question)
+                started = False
+                try:
+                    async with asyncio.timeout(remaining(config)), slot(ticket, config):
+                        started = True
+                        async for step in agent.astream(
+                            {"messages": [question]},
+                            config=config,
+                            stream_mode="values",  #Use stream_mode "values" for real application. Use stream_mode "debug" for debug.
+                        ):
+                            if logger.isEnabledFor(logging.DEBUG):
+                                logger.debug("step: %s", step)
+                            steps.append(step)
+                    response = {"result": final_answer(steps[-1]['messages'])}
+                except TimeoutError:
+                    metrics.status = "timeout"
+                    response = {"result": await timed_out_answer(chatbot, config, question.id if started else None), "timed_out": True}
+                await record_turn(chatbot, request, response["result"])
+                if request.trace:
+                    response["trace"] = metrics.handler.trace()
+                return response
+            except Exception as e:
+                logger.exception("Graph run failed")
+                raise HTTPException(status_code=500, detail=str(e))
+
+    # Invoke the graph, stream LLM token deltas and node transitions as Server-Sent Events
+    @app.post("/generate/stream")
+    async def stream_graph_events(request: QuestionRequest, http_request: Request):
+        ticket = admit("generate_stream", request.user_id)
+
+        async def event_stream():
+            with request_metrics("generate_stream") as metrics:
+                config = run_config(request, metrics, request_timeout(request))
+                try:
+                    chatbot = await loader.get()
+                    agent = chatbot.agent
+                except Exception as e:
+                    metrics.status = "error"
+                    yield sse_event("error", {"detail": str(e)})
+                    return
+                # The graph only advances when the client has consumed the previous event (backpressure).
+                # If the client goes away, closing the generator cancels in-flight LLM and tool calls.
+                # At the deadline the run is cancelled, and "end" carries the best partial answer with "timed_out": true.
+                end = {}
+                question = question_message(request.question)
+                started = False
+                try:
+                    async with slot(ticket, config), aclosing(graph_events(agent, question, config)) as events:
+                        started = True
+                        async for event, data in events:
+                            if await http_request.is_disconnected():
+                                metrics.status = "disconnected"
+                                return
+                            yield sse_event(event, data)
+                except TimeoutError:
+                    metrics.status = "timeout"
+                    end = {"result": await timed_out_answer(chatbot, config, question.id if started else None), "timed_out": True}
+                except Exception as e:
+                    logger.exception("Graph run failed")
+                    metrics.status = "error"
+                    yield sse_event("error", {"detail": str(e)})
+                    return
+                if not end:
+                    state = await agent.aget_state(config)
+                    end = {"result": final_answer(state.values["messages"])}
+                await record_turn(chatbot, request, end["result"])
+                if request.trace:
+                    end["trace"] = metrics.handler.trace()
+                yield sse_event("end", end)
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    # Page of a thread's chat history, oldest message first; pass the returned "before" to get the page before it
+    @app.get("/history/{thread_id}")
+    async def history(thread_id: str, limit: int = 50, before: Optional[int] = None):
+        chatbot = await loader.get()
+        if chatbot.history is None:
+            raise HTTPException(status_code=404, detail="Chat history is off")
+        page = await asyncio.to_thread(chatbot.history.read, thread_id, min(max(limit, 1), 500), before)
+        return {"messages": [{"role": message.type, "content": message.content} for message in page.messages], "before": page.before}
+
+    # Cache and shortcut counters, to measure their effect
+    @app.get("/stats")
+    async def stats():
+        stats = (await loader.get()).stats()
+        if admission is not None:
+            stats["admission"] = admission.stats()
+        return stats
+
+    # Prometheus text format; the counters of /stats are exported as gauges once the chatbot is loaded
+    collect_stats = stats_collector("chatbot_cache_stat", lambda: loader.chatbot.stats() if loader.chatbot is not None else {})
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(collect_stats), media_type="text/plain; version=0.0.4")
+
+    # WebSocket settings: heartbeat interval, send buffer size and how long a slow client may keep it full
+    ws_heartbeat_seconds = float(os.getenv("WS_HEARTBEAT_SECONDS", "20")) or None
+    ws_send_buffer = int(os.getenv("WS_SEND_BUFFER", "256"))
+    ws_send_timeout = float(os.getenv("WS_SEND_TIMEOUT", "30")) or None
+
+    # Persistent chat session: the client sends any number of questions, each answered by a turn streaming
+    # "start", "token" and "node" deltas and ending with "end", "error" or "cancelled"; every message carries its thread_id.
+    # Turns of different threads run concurrently, {"type": "cancel", "thread_id": ...} stops one.
+    # {"type": "ping"} is answered with "pong", and the server sends "ping" every WS_HEARTBEAT_SECONDS.
+    @app.websocket("/ws/generate")
+    async def websocket_generator(ws: WebSocket):
+        await ws.accept()
+        buffer = SendBuffer(ws_send_buffer, ws_send_timeout)
+        turns: Dict[str, asyncio.Task] = {}
+
+        async def sender():
+            try:
+                while (message := await buffer.get()) is not None:
+                    await ws.send_json(message)
+            except Exception:
+                # Client gone, the receive loop ends too
+                pass
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(ws_heartbeat_seconds)
+                await buffer.put({"type": "ping"})
+
+        async def turn(req: QuestionRequest):
+            thread_id = req.thread_id
+            try:
+                ticket = admit("ws_generate", req.user_id)
+            except HTTPException as e:
+                await buffer.put({"type": "error", "thread_id": thread_id, "detail": e.detail, "status_code": e.status_code, "retry_after": int(e.headers["Retry-After"])})
+                return
+            with request_metrics("ws_generate") as metrics:
+                try:
+                    config = run_config(req, metrics, request_timeout(req))
+                    chatbot = await loader.get()
+                    agent = chatbot.agent
+                    await buffer.put({"type": "start", "thread_id": thread_id})
+                    question = question_message(req.question)
+                    started = False
+                    try:
+                        async with slot(ticket, config), aclosing(graph_events(agent, question, config)) as events:
+                            started = True
+                            async for event, data in events:
+                                await buffer.put({"type": event, "thread_id": thread_id, **data})
+                        state = await agent.aget_state(config)
+                        end = {"type": "end", "thread_id": thread_id, "result": final_answer(state.values["messages"])}
+                    except TimeoutError:
+                        metrics.status = "timeout"
+                        end = {"type": "end", "thread_id": thread_id, "result": await timed_out_answer(chatbot, config, question.id if started else None), "timed_out": True}
+                    await record_turn(chatbot, req, end["result"])
+                    if req.trace:
+                        end["trace"] = metrics.handler.trace()
+                    await buffer.put(end)
+                except asyncio.CancelledError:
+                    metrics.status = "cancelled"
+                    await buffer.put({"type": "cancelled", "thread_id": thread_id})
+                except Exception as e:
+                    logger.exception("Graph run failed")
+                    metrics.status = "error"
+                    await buffer.put({"type": "error", "thread_id": thread_id, "detail": str(e)})
+
+        async def receive(text: str):
+            try:
+                data = json.loads(text)
+                kind = data.get("type", "question")
+            except (ValueError, AttributeError):
+                await buffer.put({"type": "error", "detail": "Messages must be JSON objects"})
+                return
+            if kind == "ping":
+                await buffer.put({"type": "pong"})
+            elif kind == "cancel":
+                task = turns.get(data.get("thread_id"))
+                if task is not None:
+                    task.cancel()
+            elif kind == "question":
+                try:
+                    req = QuestionRequest(**data)
+                except ValidationError as e:
+                    await buffer.put({"type": "error", "thread_id": data.get("thread_id"), "detail": str(e)})
+                    return
+                # One turn at a time per thread, its history would interleave otherwise
+                if req.thread_id in turns:
+                    await buffer.put({"type": "error", "thread_id": req.thread_id, "detail": "A turn of this thread is in progress", "status_code": 409})
+                    return
+                task = turns[req.thread_id] = asyncio.create_task(turn(req))
+                task.add_done_callback(lambda task, thread_id=req.thread_id: turns.get(thread_id) is task and turns.pop(thread_id))
+            else:
+                await buffer.put({"type": "error", "detail": f"Unknown message type {kind!r}"})
+
+        sending = asyncio.create_task(sender())
+        beating = asyncio.create_task(heartbeat()) if ws_heartbeat_seconds else None
+        try:
+            while True:
+                receiving = asyncio.ensure_future(ws.receive_text())
+                await asyncio.wait({receiving, sending}, return_when=asyncio.FIRST_COMPLETED)
+                # The sender stops when the client is gone or too slow
+                if not receiving.done():
+                    receiving.cancel()
+                    break
+                try:
+                    text = receiving.result()
+                except WebSocketDisconnect:
+                    break
+                await receive(text)
+        finally:
+            # Turns end with the connection, nothing is sent anymore
+            await buffer.close()
+            for task in list(turns.values()):
+                task.cancel()
+            await asyncio.gather(*turns.values(), return_exceptions=True)
+            if beating is not None:
+                beating.cancel()
+            sending.cancel()
+            if buffer.overflowed:
+                WS_SLOW_CONSUMERS.inc()
+                # 1008: policy violation, the client did not keep up with its messages
+                with suppress(Exception):
+                    await ws.close(code=1008, reason="Client too slow")
+
+    return app
@@ -0,0 +1,31 @@
+# Offline build step, run once when building the Docker image: prebuilds what the server would otherwise
+# build on its first start (Chinook.db, the schema index artifact, the embedding model and the blog vectorstore).
+# Usage: python build_artifacts.py [--skip-vectorstore]   (from the directory the server runs in)
+import json
+import logging
+import argparse
+from tools.metrics import StartupTimer
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuild the chatbot's artifacts")
+    parser.add_argument("--skip-vectorstore", action="store_true", help="Do not download the embedding model nor build the blog vectorstore")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    timer = StartupTimer()
+    with timer.phase("chinook_db"):
+        from tools.chinook_db import download_chinook_db, get_schema_index
+        download_chinook_db()
+    with timer.phase("schema_index"):
+        # Saved to SCHEMA_INDEX_ARTIFACT, loaded instead of rebuilt while Chinook.db is unchanged
+        get_schema_index()
+    if not args.skip_vectorstore:
+        with timer.phase("vectorstore"):
+            # Downloads the embedding model into the HuggingFace cache and builds lilianwen_db
+            from tools.lilianweng_vectorstore import get_vectorstore
+            get_vectorstore()
+    timer.ready()
+    print(json.dumps(timer.report(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import json
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.tools.base import BaseTool
+from langgraph.graph.state import CompiledStateGraph
+from agents.context import ContextManager, get_context_manager
+from agents.deadline import Deadlines, get_deadlines
+from agents.router import EmbeddingRouter, get_router
+from agents.speculation import Speculator, get_speculator
+from agents.sql import SQLAgent
+from graph import build_graph
+from tools.answer_cache import SemanticAnswerCache, get_answer_cache
+from tools.chat_history import ChatHistory, get_chat_history
+from tools.checkpointer import get_checkpointer
+from tools.chinook_db import get_sql_db_tool, get_schema_index, get_sql_validator
+from tools.embedding_service import EmbeddingService
+from tools.llm_cache import SqliteLLMCache
+from tools.metrics import StartupTimer
+from tools.schema_index import SchemaIndex
+from tools.search_cache import CachedSearchTool, SearchCache
+from tools.sql_validator import SQLValidator
+
+# The compiled graph and the components the API reports on
+@dataclass
+class Chatbot:
+    agent: CompiledStateGraph
+    db_tools: List[BaseTool]
+    sql_validator: Optional[SQLValidator] = None
+    answer_cache: Optional[SemanticAnswerCache] = None
+    router: Optional[EmbeddingRouter] = None
+    embedding_service: Optional[EmbeddingService] = None
+    context: Optional[ContextManager] = None
+    llm_cache: Optional[SqliteLLMCache] = None
+    search_cache: Optional[SearchCache] = None
+    speculator: Optional[Speculator] = None
+    history: Optional[ChatHistory] = None
+    deadlines: Optional[Deadlines] = None
+
+    # Cache and shortcut counters, to measure their effect
+    def stats(self) -> dict:
+        query_tool = next(tool for tool in self.db_tools if tool.name == "sql_db_query")
+        stats = {"sql_query_cache": query_tool.cache.stats()}
+        if query_tool.formatter is not None:
+            stats["sql_results"] = query_tool.formatter.stats()
+        if self.sql_validator is not None:
+            stats["sql_validator"] = self.sql_validator.stats()
+        if self.answer_cache is not None:
+            stats["answer_cache"] = self.answer_cache.stats()
+        if self.router is not None:
+            stats["router"] = self.router.stats()
+        if self.embedding_service is not None:
+            stats["embedding_service"] = self.embedding_service.stats()
+        if self.context is not None:
+            stats["context"] = self.context.stats()
+        if self.llm_cache is not None:
+            stats["llm_cache"] = self.llm_cache.stats()
+        if self.search_cache is not None:
+            stats["search_cache"] = self.search_cache.stats()
+        if self.speculator is not None:
+            stats["speculation"] = self.speculator.stats()
+        if self.history is not None:
+            stats["chat_history"] = self.history.stats()
+        if self.deadlines is not None:
+            stats["deadlines"] = self.deadlines.stats()
+        return stats
+
+# SQL agents of other databases, from SQL_DATABASES: a JSON list of {"name", "path", "description"}, e.g.
+# [{"name": "sales_agent", "path": "/data/sales.db", "description": "the sales database of the shop"}]
+# Each gets its own connection pool, query cache, schema index and validator, as set for Chinook.
+def get_sql_agents(llm: BaseChatModel, speculator: Optional[Speculator] = None, deadlines: Optional[Deadlines] = None) -> List[SQLAgent]:
+    agents = []
+    for config in json.loads(os.getenv("SQL_DATABASES", "[]")):
+        tools, db = get_sql_db_tool(llm, config["path"])
+        agents.append(SQLAgent(
+            llm, tools, db,
+            name=config["name"],
+            description=config["description"],
+            schema_index=SchemaIndex(config["path"]) if os.getenv("SQL_SCHEMA_MODE", "index") == "index" else None,
+            sql_validator=get_sql_validator(config["path"]) if os.getenv("SQL_STATIC_CHECK", "1") == "1" else None,
+            context=get_context_manager("sql_agent") if os.getenv("CONTEXT_MANAGEMENT", "1") == "1" else None,
+            speculator=speculator,
+            deadlines=deadlines,
+        ))
+    return agents
+
+# Build the chatbot from its external dependencies (LLM, embeddings, retriever and research agent, with its web search tool),
+# everything else is configured by environment variables. Phases are timed by startup if given.
+def build_chatbot(
+    llm: BaseChatModel,
+    embedding: Embeddings,
+    retriever_tool: BaseTool,
+    research_agent: CompiledStateGraph,
+    startup: Optional[StartupTimer] = None,
+    web_search: Optional[BaseTool] = None,
+) -> Chatbot:
+    phase = startup.phase if startup is not None else lambda name: nullcontext()
+
+    # SQL
+    with phase("sql_db"):
+        db_tools, db = get_sql_db_tool(llm)
+    # SQL_SCHEMA_MODE=index uses the precomputed schema index, SQL_SCHEMA_MODE=llm lets the LLM pick tables
+    with phase("schema_index"):
+        schema_index = get_schema_index() if os.getenv("SQL_SCHEMA_MODE", "index") == "index" else None
+    # SQL_STATIC_CHECK=1 validates generated queries locally and only asks the LLM to check flagged ones
+    with phase("sql_validator"):
+        sql_validator = get_sql_validator() if os.getenv("SQL_STATIC_CHECK", "1") == "1" else None
+    # SPECULATIVE_PREFETCH=1 starts the retrieval and the schema index lookups on the question while the supervisor decides
+    speculator = get_speculator() if os.getenv("SPECULATIVE_PREFETCH", "1") == "1" else None
+    # Per-node timeouts (NODE_TIMEOUTS) within the request's deadline, and the SQL agents' query cap (SQL_MAX_QUERIES)
+    deadlines = get_deadlines()
+    with phase("sql_databases"):
+        sql_agents = get_sql_agents(llm, speculator, deadlines)
+
+    # Checkpointer helps remember chat history
+    # Backend (bounded SQLite by default, Postgres or in-memory) is chosen by the CHECKPOINTER environment variable
+    with phase("checkpointer"):
+        checkpointer = get_checkpointer()
+
+    # Questions and answers of every thread, written behind the requests; CHAT_HISTORY selects the backend (SQLite by default, Postgres or off)
+    with phase("chat_history"):
+        history = get_chat_history()
+
+    # Semantic cache of final answers, in front of the supervisor
+    with phase("answer_cache"):
+        answer_cache = get_answer_cache(embedding) if os.getenv("ANSWER_CACHE", "1") == "1" else None
+
+    # Embedding router, sends obvious questions straight to an agent without the supervisor's routing LLM call
+    with phase("router"):
+        router = get_router(embedding) if os.getenv("ROUTER", "1") == "1" else None
+
+    # CONTEXT_MANAGEMENT=1 keeps the supervisor's and the SQL agent's prompts within a token budget,
+    # older turns of the supervisor's conversation are summarized in the background
+    supervisor_context = sql_context = None
+    if os.getenv("CONTEXT_MANAGEMENT", "1") == "1":
+        supervisor_context = get_context_manager("supervisor", llm)
+        sql_context = get_context_manager("sql_agent")
+
+    with phase("graph"):
+        agent = build_graph(
+            llm, retriever_tool, research_agent, db_tools, db,
+            checkpointer=checkpointer,
+            schema_index=schema_index,
+            sql_validator=sql_validator,
+            answer_cache=answer_cache,
+            router=router,
+            router_threshold=float(os.getenv("ROUTER_THRESHOLD", "0.8")),
+            # SUPERVISOR_PARALLEL=1 lets the supervisor dispatch several agents in one turn, each limited to AGENT_TIMEOUT seconds
+            parallel_agents=os.getenv("SUPERVISOR_PARALLEL", "1") == "1",
+            agent_timeout=float(os.getenv("AGENT_TIMEOUT", "120")) or None,
+            supervisor_context=supervisor_context,
+            sql_context=sql_context,
+            sql_agents=sql_agents,
+            speculator=speculator,
+            deadlines=deadlines,
+        )
+    # Query embedding cache and batching, when the embedding model is wrapped by get_embedding_service
+    embedding_service = embedding if isinstance(embedding, EmbeddingService) else None
+    # LLM response cache, when the model was created with get_llm_cache
+    llm_cache = llm.cache if isinstance(llm.cache, SqliteLLMCache) else None
+    # Web search cache, when the research agent's search tool was wrapped by get_search_tool
+    search_cache = web_search.cache if isinstance(web_search, CachedSearchTool) else None
+    return Chatbot(agent, db_tools, sql_validator, answer_cache, router, embedding_service, supervisor_context, llm_cache, search_cache, speculator, history, deadlines)
@@ -0,0 +1,129 @@
+from typing import List, Optional, Sequence
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.tools.base import BaseTool
+from langchain_community.utilities import SQLDatabase
+from langgraph.graph import StateGraph, START, MessagesState, END
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.prebuilt import ToolNode
+from tools.answer_cache import SemanticAnswerCache
+from tools.schema_index import SchemaIndex
+from tools.sql_validator import SQLValidator
+from agents.sql import SQLAgent
+from agents.answer_cache import create_answer_cache_nodes, route_after_supervisor
+from agents.branch import create_branch_node, merge_branches
+from agents.context import ContextManager
+from agents.deadline import Deadlines
+from agents.retriever import get_retriever_entry_node, route_after_retriever
+from agents.router import EmbeddingRouter, create_router_node
+from agents.speculation import Speculator, create_speculation_node
+from agents.state import ChatState, dual_node
+from agents.supervisor import create_task_description_handoff_tool, create_supervisor_agent_with_description
+
+# Retriever agent: task description -> retriever tool call -> retrieved documents
+# (prefetched by the speculator if given, then the retrieve ToolNode is skipped)
+def build_retriever_agent(retriever_tool: BaseTool, speculator: Optional[Speculator] = None) -> CompiledStateGraph:
+    builder = StateGraph(MessagesState)
+    builder.add_node("retriever", get_retriever_entry_node(retriever_tool, speculator))
+    builder.add_node("retrieve", ToolNode([retriever_tool]))
+    builder.add_edge(START, "retriever")
+    if speculator is not None:
+        speculator.register("retriever", lambda question: retriever_tool.invoke({"query": question}))
+        builder.add_conditional_edges("retriever", route_after_retriever)
+    else:
+        builder.add_edge("retriever", "retrieve")
+    return builder.compile(name="retriever")
+
+def build_graph(
+    llm: BaseChatModel,
+    retriever_tool: BaseTool,
+    research_agent: CompiledStateGraph,
+    db_tools: List[BaseTool],
+    db: SQLDatabase,
+    checkpointer: Optional[BaseCheckpointSaver] = None,
+    schema_index: Optional[SchemaIndex] = None,
+    sql_validator: Optional[SQLValidator] = None,
+    answer_cache: Optional[SemanticAnswerCache] = None,
+    router: Optional[EmbeddingRouter] = None,
+    router_threshold: float = 0.8,
+    parallel_agents: bool = False,
+    agent_timeout: Optional[float] = None,
+    supervisor_context: Optional[ContextManager] = None,
+    sql_context: Optional[ContextManager] = None,
+    sql_agents: Sequence[SQLAgent] = (),
+    speculator: Optional[Speculator] = None,
+    deadlines: Optional[Deadlines] = None,
+) -> CompiledStateGraph:
+    # SQL agent of Chinook, and of the other databases in sql_agents
+    sql_agent = SQLAgent(llm, db_tools, db, schema_index=schema_index, sql_validator=sql_validator, context=sql_context, speculator=speculator, deadlines=deadlines)
+
+    # Handoffs tools
+    assign_to_research_agent_with_description = create_task_description_handoff_tool(
+        agent_name="research_agent",
+        description="Assign task to a researcher agent.",
+    )
+
+    assign_to_retriever_agent_with_description = create_task_description_handoff_tool(
+        agent_name="retriever",
+        description="Assign task to a rag agent.",
+    )
+
+    assign_to_sql_agent_with_description = create_task_description_handoff_tool(
+        agent_name="sql_agent",
+        description="Assign task to a rag agent.",
+    )
+    supervisor_handoffs_tools = [assign_to_research_agent_with_description,
+                                 assign_to_retriever_agent_with_description,
+                                 assign_to_sql_agent_with_description]
+    supervisor_handoffs_tools += [
+        create_task_description_handoff_tool(agent_name=agent.name, description=f"Assign task to a sql agent of {agent.description}.")
+        for agent in sql_agents
+    ]
+
+    # Supervisor agent
+    supervisor_agent_with_description = create_supervisor_agent_with_description(
+        llm, supervisor_handoffs_tools, parallel=parallel_agents, context=supervisor_context,
+        extra_agents=[(agent.name, agent.description) for agent in sql_agents],
+    ) # Change tools here
+
+    # Define the graph
+    builder = StateGraph(ChatState)
+    builder.add_node(
+        supervisor_agent_with_description,
+        destinations=("research_agent", "retriever", "sql_agent", *(agent.name for agent in sql_agents), END),
+    )
+
+    # Agents run as branches: every handoff of a supervisor turn runs concurrently (within a timeout and the request's deadline),
+    # then merge_branches hands all the results back to the supervisor at once
+    for agent in (research_agent, build_retriever_agent(retriever_tool, speculator), sql_agent.graph, *(agent.graph for agent in sql_agents)):
+        run_branch, arun_branch = create_branch_node(agent, agent_timeout, deadlines)
+        builder.add_node(agent.name, dual_node(agent.name, run_branch, arun_branch))
+        builder.add_edge(agent.name, "merge_branches")
+    builder.add_node(merge_branches)
+    builder.add_edge("merge_branches", "supervisor")
+
+    # Entry: [check_answer_cache] -> [route_question] -> supervisor
+    entry = "supervisor"
+    if router is not None:
+        # Obvious questions go straight to an agent without the supervisor's routing LLM call
+        route, aroute = create_router_node(router, router_threshold)
+        builder.add_node(
+            "route_question", dual_node("route_question", route, aroute),
+            destinations=("supervisor", "research_agent", "retriever", "sql_agent"),
+        )
+        entry = "route_question"
+    if answer_cache is not None:
+        # Near-duplicate questions are answered from the semantic cache without calling the supervisor
+        (check, acheck), (store, astore) = create_answer_cache_nodes(answer_cache, next_node=entry)
+        builder.add_node("check_answer_cache", dual_node("check_answer_cache", check, acheck), destinations=(entry, END))
+        builder.add_node("store_answer", dual_node("store_answer", store, astore))
+        builder.add_conditional_edges("supervisor", route_after_supervisor)
+        builder.add_edge("store_answer", END)
+        entry = "check_answer_cache"
+    builder.add_edge(START, entry)
+    if speculator is not None:
+        # Runs next to the entry node: the agents' first lookups start while the supervisor (or cache, router) decides
+        builder.add_node("speculate", create_speculation_node(speculator))
+        builder.add_edge(START, "speculate")
+
+    return builder.compile(checkpointer=checkpointer)
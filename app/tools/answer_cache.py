@@ -0,0 +1,153 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Default lifetime in seconds of a cached answer, by the agent that produced it.
+# Web research goes stale quickly, the Chinook database and the blog posts do not.
+# Answers the supervisor gave on its own ("direct") depend on who is asking and are never cached.
+DEFAULT_TTLS = {
+    "research": 15 * 60,
+    "sql": 24 * 60 * 60,
+    "blog": 24 * 60 * 60,
+}
+
+# Final answers keyed by question embedding, stored in SQLite and searched in memory.
+# A question whose cosine similarity to a cached one is at least `threshold` reuses its answer.
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        path: str,
+        embedding: Embeddings,
+        threshold: float = 0.95,
+        ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = 10000,
+    ):
+        self.embedding = embedding
+        self.threshold = threshold
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                source TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            """
+        )
+        # Expired entries, and entries of sources that are no longer cached
+        self.conn.execute(
+            f"DELETE FROM answers WHERE expires_at < ? OR source NOT IN ({', '.join('?' * len(self.ttls))})",
+            (time.time(), *self.ttls),
+        )
+        self.conn.commit()
+        rows = self.conn.execute("SELECT id, embedding, expires_at, last_used FROM answers").fetchall()
+        # In-memory copy of the rows needed for lookup: normalized embeddings matrix plus parallel arrays
+        self.ids = [row[0] for row in rows]
+        self.expires_at = [row[2] for row in rows]
+        self.last_used = [row[3] for row in rows]
+        self.matrix = (
+            np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+            if rows else None
+        )
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    # Index of the most similar live entry, or None below the threshold
+    def _nearest(self, vector: np.ndarray) -> Optional[int]:
+        if self.matrix is None or not len(self.ids):
+            return None
+        scores = self.matrix @ vector
+        scores[np.asarray(self.expires_at) < time.time()] = -1.0
+        best = int(np.argmax(scores))
+        return best if scores[best] >= self.threshold else None
+
+    def lookup(self, question: str) -> Optional[str]:
+        vector = self._embed(question)
+        with self.lock:
+            best = self._nearest(vector)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.last_used[best] = time.time()
+            self.conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (self.last_used[best], self.ids[best]))
+            self.conn.commit()
+            row = self.conn.execute("SELECT answer FROM answers WHERE id = ?", (self.ids[best],)).fetchone()
+            return row[0] if row else None
+
+    def store(self, question: str, answer: str, source: str) -> None:
+        if source not in self.ttls:
+            return
+        vector = self._embed(question)
+        now = time.time()
+        with self.lock:
+            # A near duplicate of the new question is replaced rather than kept twice
+            best = self._nearest(vector)
+            if best is not None:
+                self._delete(best)
+            expires_at = now + self.ttls[source]
+            cursor = self.conn.execute(
+                "INSERT INTO answers (question, answer, source, embedding, expires_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (question, answer, source, vector.tobytes(), expires_at, now),
+            )
+            self.ids.append(cursor.lastrowid)
+            self.expires_at.append(expires_at)
+            self.last_used.append(now)
+            self.matrix = vector[None, :] if self.matrix is None else np.vstack([self.matrix, vector])
+            # Least recently used entries go first
+            while len(self.ids) > self.max_entries:
+                self._delete(int(np.argmin(self.last_used)))
+                self.evictions += 1
+            self.conn.commit()
+
+    def _delete(self, index: int) -> None:
+        self.conn.execute("DELETE FROM answers WHERE id = ?", (self.ids[index],))
+        del self.ids[index], self.expires_at[index], self.last_used[index]
+        self.matrix = np.delete(self.matrix, index, axis=0)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.ids),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Answer cache stored next to the app, configured from environment variables
+def get_answer_cache(embedding: Embeddings) -> SemanticAnswerCache:
+    base_dir = os.path.dirname(os.path.abspath(__file__))  # this gives /code/app/tools
+    app_dir = os.path.abspath(os.path.join(base_dir, '..'))  # move one level up to /code/app
+    ttls = {
+        source: float(os.environ[f"ANSWER_CACHE_TTL_{source.upper()}"])
+        for source in DEFAULT_TTLS
+        if f"ANSWER_CACHE_TTL_{source.upper()}" in os.environ
+    }
+    return SemanticAnswerCache(
+        os.getenv("ANSWER_CACHE_DB", os.path.join(app_dir, "answer_cache.sqlite")),
+        embedding,
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+        ttls=ttls,
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000")),
+    )
@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import atexit
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class HistoryRecord:
+    thread_id: str
+    user_id: str
+    message: str  # JSON of the message, as langchain's messages_to_dict
+    created: float = field(default_factory=time.time)
+
+# A page of a thread's history, oldest message first; before is the cursor of the previous page (None at the start)
+@dataclass
+class HistoryPage:
+    messages: List[BaseMessage]
+    before: Optional[int]
+
+def _to_page(rows: Sequence[Tuple[int, str]], limit: int) -> HistoryPage:
+    # Rows come newest first, one more than the page to know whether an older page exists
+    more = len(rows) > limit
+    rows = list(reversed(rows[:limit]))
+    messages = messages_from_dict([json.loads(message) for _, message in rows])
+    return HistoryPage(messages, rows[0][0] if more else None)
+
+# Chat history in a local SQLite file (WAL mode), for development and tests.
+# Messages get increasing ids in the order they are written, pages are read by id.
+class SqliteChatHistoryStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                thread_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chat_history_thread ON chat_history (thread_id, id);
+            """
+        )
+
+    # One transaction per batch, records in order
+    def write(self, records: Sequence[HistoryRecord]) -> None:
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO chat_history (thread_id, user_id, message, created) VALUES (?, ?, ?, ?)",
+                    [(record.thread_id, record.user_id, record.message, record.created) for record in records],
+                )
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def read(self, thread_id: str, limit: int = 50, before: Optional[int] = None) -> HistoryPage:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, message FROM chat_history WHERE thread_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (thread_id, before if before is not None else 2**63 - 1, limit + 1),
+            ).fetchall()
+        return _to_page(rows, limit)
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+# Chat history in Postgres, over a psycopg_pool connection pool with autocommit and dict rows
+class PostgresChatHistoryStore:
+    def __init__(self, pool: Any):
+        self.pool = pool
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_history (
+                    id BIGSERIAL PRIMARY KEY,
+                    thread_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    message JSONB NOT NULL,
+                    created DOUBLE PRECISION NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS chat_history_thread ON chat_history (thread_id, id)")
+
+    def write(self, records: Sequence[HistoryRecord]) -> None:
+        with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO chat_history (thread_id, user_id, message, created) VALUES (%s, %s, %s::jsonb, %s)",
+                [(record.thread_id, record.user_id, record.message, record.created) for record in records],
+            )
+
+    def read(self, thread_id: str, limit: int = 50, before: Optional[int] = None) -> HistoryPage:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, message::text AS message FROM chat_history WHERE thread_id = %s AND id < %s ORDER BY id DESC LIMIT %s",
+                (thread_id, before if before is not None else 2**63 - 1, limit + 1),
+            ).fetchall()
+        return _to_page([(row["id"], row["message"]) for row in rows], limit)
+
+    def close(self) -> None:
+        self.pool.close()
+
+# Chat history writes off the request path (write-behind):
+# - append only puts the messages on a bounded in-process queue; when it is full they are dropped and counted
+# - one background thread takes them off in batches (up to batch_size, or what arrived within flush_interval)
+#   and writes each batch in one transaction, retried with exponential backoff up to max_retries times
+# - a single writer working in queue order keeps every thread's messages in order, a failed batch is retried before the next one
+# - read waits until the thread's queued messages are written (read your writes), close flushes the queue
+# With write_behind=False, append writes on the caller's thread instead (the synchronous baseline).
+class ChatHistory:
+    def __init__(
+        self,
+        store: Any,
+        write_behind: bool = True,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.05,
+        max_retries: int = 5,
+        retry_backoff: float = 0.1,
+    ):
+        self.store = store
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # None stops the worker
+        self.queue: "queue.Queue[Optional[HistoryRecord]]" = queue.Queue(maxsize=max_queue)
+        # Messages of each thread queued and not written yet
+        self.pending: Dict[str, int] = defaultdict(int)
+        self.written_cond = threading.Condition()
+        self.closed = False
+        self.appended = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.dropped = 0
+        self.write_seconds = 0.0
+        self.worker: Optional[threading.Thread] = None
+        if write_behind:
+            self.worker = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+            self.worker.start()
+
+    def append(self, thread_id: str, user_id: str, messages: Sequence[BaseMessage]) -> None:
+        records = [HistoryRecord(thread_id, user_id, json.dumps(message)) for message in messages_to_dict(messages)]
+        self.appended += len(records)
+        if not self.write_behind:
+            self._write(records)
+            return
+        for record in records:
+            with self.written_cond:
+                if self.closed:
+                    self.dropped += 1
+                    continue
+                try:
+                    self.queue.put_nowait(record)
+                except queue.Full:
+                    self.dropped += 1
+                    logger.error("Chat history queue is full, message of thread %s dropped", thread_id)
+                    continue
+                self.pending[thread_id] += 1
+
+    # From the event loop: a synchronous write runs in a worker thread, but still on the request path
+    async def aappend(self, thread_id: str, user_id: str, messages: Sequence[BaseMessage]) -> None:
+        if self.write_behind:
+            self.append(thread_id, user_id, messages)
+        else:
+            await asyncio.to_thread(self.append, thread_id, user_id, messages)
+
+    # Write one batch, retrying with exponential backoff; returns False if it was given up on
+    def _write(self, records: List[HistoryRecord]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                self.store.write(records)
+            except Exception:
+                if attempt == self.max_retries:
+                    self.failed += len(records)
+                    logger.exception("Chat history batch of %d messages failed %d times, dropped", len(records), attempt + 1)
+                    return False
+                self.retries += 1
+                time.sleep(self.retry_backoff * 2**attempt)
+                continue
+            self.write_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.written += len(records)
+            return True
+        return False
+
+    def _run(self) -> None:
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write(batch)
+            with self.written_cond:
+                for record in batch:
+                    self.pending[record.thread_id] -= 1
+                    if not self.pending[record.thread_id]:
+                        del self.pending[record.thread_id]
+                self.written_cond.notify_all()
+            if stop:
+                return
+
+    # Wait until the thread's queued messages (or all of them) are written, at most timeout seconds
+    def flush(self, thread_id: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        with self.written_cond:
+            return self.written_cond.wait_for(lambda: not (self.pending.get(thread_id) if thread_id is not None else self.pending), timeout)
+
+    def read(self, thread_id: str, limit: int = 50, before: Optional[int] = None) -> HistoryPage:
+        self.flush(thread_id, timeout=5.0)
+        return self.store.read(thread_id, limit, before)
+
+    # Write what is queued and stop the worker
+    def close(self, timeout: Optional[float] = 30.0) -> None:
+        with self.written_cond:
+            if self.closed:
+                return
+            self.closed = True
+        if self.worker is not None:
+            self.queue.put(None)
+            self.worker.join(timeout)
+        self.store.close()
+
+    def stats(self) -> dict:
+        return {
+            "appended": self.appended,
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+            "mean_batch_size": self.written / self.batches if self.batches else 0.0,
+            "write_seconds": self.write_seconds,
+        }
+
+# Select the chat history backend from environment variables:
+# CHAT_HISTORY=sqlite (default) | postgres | off
+def get_chat_history() -> Optional[ChatHistory]:
+    backend = os.getenv("CHAT_HISTORY", "sqlite").lower()
+    if backend == "off":
+        return None
+    if backend == "postgres":
+        from psycopg.rows import dict_row
+        from psycopg_pool import ConnectionPool
+
+        conn_info = os.getenv("CHAT_HISTORY_POSTGRES_URL") or os.getenv("DATABASE_URL")
+        store = PostgresChatHistoryStore(ConnectionPool(conn_info, max_size=int(os.getenv("CHAT_HISTORY_POOL_SIZE", "4")), kwargs={"autocommit": True, "row_factory": dict_row}))
+    elif backend == "sqlite":
+        app_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+        store = SqliteChatHistoryStore(os.getenv("CHAT_HISTORY_DB", os.path.join(app_dir, "chat_history.sqlite")))
+    else:
+        raise ValueError(f"Unknown CHAT_HISTORY backend: {backend}")
+    history = ChatHistory(
+        store,
+        write_behind=os.getenv("CHAT_HISTORY_WRITE_BEHIND", "1") == "1",
+        max_queue=int(os.getenv("CHAT_HISTORY_MAX_QUEUE", "10000")),
+        batch_size=int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "256")),
+        flush_interval=float(os.getenv("CHAT_HISTORY_FLUSH_MS", "50")) / 1000,
+    )
+    atexit.register(history.close)
+    return history
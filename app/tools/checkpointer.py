@@ -0,0 +1,447 @@
+import os
+import time
+import atexit
+import random
+import asyncio
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+logger = logging.getLogger(__name__)
+
+# Settings of BoundedSqliteSaver's retention, which the other backends do not have
+RETENTION_SETTINGS = ("CHECKPOINT_MAX_PER_THREAD", "CHECKPOINT_THREAD_TTL", "CHECKPOINT_COMPACTION_INTERVAL")
+
+# Run the sync saver methods in the default executor so checkpoint I/O never blocks the event loop
+class ThreadedAsyncSaverMixin:
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+# Checkpointer backed by a local SQLite file (WAL mode).
+# Writes are committed in batches, and old checkpoints are pruned by a background compaction thread:
+# - max_checkpoints_per_thread: newest root checkpoints kept per thread; subgraph checkpoints are dropped once their run is over
+# - thread_ttl: seconds a thread may stay idle before it is deleted (None keeps threads forever)
+class BoundedSqliteSaver(ThreadedAsyncSaverMixin, BaseCheckpointSaver[str]):
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_checkpoints_per_thread: Optional[int] = 20,
+        thread_ttl: Optional[float] = None,
+        flush_interval: float = 0.05,
+        flush_batch_size: int = 64,
+        compaction_interval: Optional[float] = 300.0,
+        serde: Optional[SerializerProtocol] = None,
+    ) -> None:
+        super().__init__(serde=serde)
+        self.jsonplus_serde = JsonPlusSerializer()
+        self.path = path
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.thread_ttl = thread_ttl
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.compaction_interval = compaction_interval
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        self.pending_writes = 0
+        self.setup()
+
+        # Background workers: commit batched writes and compact old checkpoints
+        self._closed = threading.Event()
+        self._workers = [threading.Thread(target=self._flush_loop, name="checkpoint-flush", daemon=True)]
+        if compaction_interval:
+            self._workers.append(threading.Thread(target=self._compaction_loop, name="checkpoint-compaction", daemon=True))
+        for worker in self._workers:
+            worker.start()
+
+    def setup(self) -> None:
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA auto_vacuum=INCREMENTAL;
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT,
+                value BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS threads_updated_at ON threads (updated_at);
+            """
+        )
+
+    # Reads share the writer connection, so they see writes that are not committed yet
+    @contextmanager
+    def cursor(self, write: bool = False) -> Iterator[sqlite3.Cursor]:
+        with self.lock:
+            if write and not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            cur = self.conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+                if write:
+                    self.pending_writes += 1
+                    if self.pending_writes >= self.flush_batch_size:
+                        self._commit()
+
+    def _commit(self) -> None:
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.pending_writes = 0
+
+    def flush(self) -> None:
+        with self.lock:
+            self._commit()
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def _compaction_loop(self) -> None:
+        while not self._closed.wait(self.compaction_interval):
+            self.compact()
+
+    def _load_tuple(self, cur: sqlite3.Cursor, row: tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata = row
+        cur.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            self.serde.loads_typed((type_, checkpoint)),
+            self.jsonplus_serde.loads(metadata) if metadata is not None else {},
+            (
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id
+                else None
+            ),
+            [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value in cur.fetchall()],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata"
+        with self.cursor() as cur:
+            if checkpoint_id := get_checkpoint_id(config):
+                cur.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+            else:
+                cur.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                )
+            row = cur.fetchone()
+            return self._load_tuple(cur, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(str(config["configurable"]["thread_id"]))
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+        with self.cursor() as cur:
+            rows = cur.execute(query, params).fetchall()
+            tuples = []
+            for row in rows:
+                item = self._load_tuple(cur, row)
+                # Metadata filter is applied in Python, as with MemorySaver
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                tuples.append(item)
+                if limit and len(tuples) >= limit:
+                    break
+        yield from tuples
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        serialized_metadata = self.jsonplus_serde.dumps(get_checkpoint_metadata(config, metadata))
+        with self.cursor(write=True) as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    serialized_checkpoint,
+                    serialized_metadata,
+                ),
+            )
+            cur.execute(
+                "INSERT OR REPLACE INTO threads (thread_id, updated_at) VALUES (?, ?)",
+                (thread_id, time.time()),
+            )
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        query = (
+            "INSERT OR REPLACE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            if all(w[0] in WRITES_IDX_MAP for w in writes)
+            else "INSERT OR IGNORE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        with self.cursor(write=True) as cur:
+            cur.executemany(
+                query,
+                [
+                    (
+                        str(config["configurable"]["thread_id"]),
+                        str(config["configurable"]["checkpoint_ns"]),
+                        str(config["configurable"]["checkpoint_id"]),
+                        task_id,
+                        WRITES_IDX_MAP.get(channel, idx),
+                        channel,
+                        *self.serde.dumps_typed(value),
+                    )
+                    for idx, (channel, value) in enumerate(writes)
+                ],
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.cursor(write=True) as cur:
+            for table in ("checkpoints", "writes", "threads"):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (str(thread_id),))
+
+    # Apply retention policies and give the freed pages back to the OS
+    def compact(self) -> dict:
+        stats = {"expired_threads": 0, "pruned_checkpoints": 0}
+        with self.cursor(write=True) as cur:
+            if self.thread_ttl is not None:
+                expired = [
+                    row[0]
+                    for row in cur.execute(
+                        "SELECT thread_id FROM threads WHERE updated_at < ?",
+                        (time.time() - self.thread_ttl,),
+                    ).fetchall()
+                ]
+                for thread_id in expired:
+                    for table in ("checkpoints", "writes", "threads"):
+                        cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                stats["expired_threads"] = len(expired)
+            # Subgraphs (supervisor, agents) checkpoint under their own namespace, a new one per run.
+            # They are only needed to resume that run, which is over once the root namespace has moved past it.
+            cur.execute(
+                """
+                DELETE FROM checkpoints WHERE checkpoint_ns != '' AND (thread_id, checkpoint_ns) IN (
+                    SELECT c.thread_id, c.checkpoint_ns FROM checkpoints c
+                    WHERE c.checkpoint_ns != ''
+                    GROUP BY c.thread_id, c.checkpoint_ns
+                    HAVING MAX(c.checkpoint_id) < (
+                        SELECT MAX(r.checkpoint_id) FROM checkpoints r
+                        WHERE r.thread_id = c.thread_id AND r.checkpoint_ns = ''
+                    )
+                )
+                """
+            )
+            stats["pruned_checkpoints"] = cur.rowcount
+            if self.max_checkpoints_per_thread is not None:
+                # Root history per thread, and the window of each subgraph run still in progress
+                cur.execute(
+                    """
+                    DELETE FROM checkpoints WHERE rowid IN (
+                        SELECT rowid FROM (
+                            SELECT rowid, ROW_NUMBER() OVER (
+                                PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                            ) AS rank FROM checkpoints
+                        ) WHERE rank > ?
+                    )
+                    """,
+                    (self.max_checkpoints_per_thread,),
+                )
+                stats["pruned_checkpoints"] += cur.rowcount
+            cur.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                    AND c.checkpoint_ns = writes.checkpoint_ns
+                    AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+        with self.lock:
+            self._commit()
+            self.conn.execute("PRAGMA incremental_vacuum")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return stats
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        for worker in self._workers:
+            worker.join()
+        with self.lock:
+            self._commit()
+            self.conn.close()
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        next_v = current_v + 1
+        next_h = random.random()
+        return f"{next_v:032}.{next_h:016}"
+
+
+# Select the checkpointer from environment variables:
+# CHECKPOINTER=sqlite (default) | postgres | memory
+# Retention (CHECKPOINT_MAX_PER_THREAD, CHECKPOINT_THREAD_TTL) is applied by the SQLite backend only:
+# postgres is langgraph's plain PostgresSaver and keeps every checkpoint, prune it with a job of your own.
+def get_checkpointer() -> BaseCheckpointSaver:
+    backend = os.getenv("CHECKPOINTER", "sqlite").lower()
+    if backend == "memory":
+        return MemorySaver() # In-Memory Saver, for demo only
+
+    if backend == "postgres":
+        # Requires langgraph-checkpoint-postgres and psycopg_pool
+        if configured := [name for name in RETENTION_SETTINGS if os.getenv(name)]:
+            logger.warning("%s only apply to CHECKPOINTER=sqlite, Postgres checkpoints are kept without retention", ", ".join(configured))
+        from psycopg.rows import dict_row
+        from psycopg_pool import ConnectionPool
+        from langgraph.checkpoint.postgres import PostgresSaver
+
+        class PooledPostgresSaver(ThreadedAsyncSaverMixin, PostgresSaver):
+            pass
+
+        conn_info = os.getenv("CHECKPOINT_POSTGRES_URL") or os.getenv("DATABASE_URL")
+        pool = ConnectionPool(conn_info, max_size=int(os.getenv("CHECKPOINT_POOL_SIZE", "10")), kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row})
+        saver = PooledPostgresSaver(pool)
+        saver.setup()
+        atexit.register(pool.close)
+        return saver
+
+    if backend == "sqlite":
+        base_dir = os.path.dirname(os.path.abspath(__file__))  # this gives /code/app/tools
+        app_dir = os.path.abspath(os.path.join(base_dir, '..'))  # move one level up to /code/app
+        thread_ttl = os.getenv("CHECKPOINT_THREAD_TTL")
+        saver = BoundedSqliteSaver(
+            os.getenv("CHECKPOINT_DB", os.path.join(app_dir, "checkpoints.sqlite")),
+            max_checkpoints_per_thread=int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "20")),
+            thread_ttl=float(thread_ttl) if thread_ttl else None,
+            compaction_interval=float(os.getenv("CHECKPOINT_COMPACTION_INTERVAL", "300")),
+        )
+        atexit.register(saver.close)
+        return saver
+
+    raise ValueError(f"Unknown CHECKPOINTER backend: {backend}")
@@ -1,28 +1,146 @@
 import os
-from typing import List, Tuple
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, Union
 import requests
+from pydantic import BaseModel, Field
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
+from langchain_core.callbacks import CallbackManagerForToolRun
 from langchain_core.tools.base import BaseTool
 from langchain_core.language_models.chat_models import BaseChatModel
+from tools.query_cache import QueryResultCache
+from tools.schema_index import SchemaIndex
+from tools.sql_results import SQLResultFormatter, get_result_formatter
+from tools.sql_validator import SQLValidator
 
-def get_sql_db_tool(llm: BaseChatModel) -> Tuple[List[BaseTool], SQLDatabase]:
-    # Download db if not exist
-    if not os.path.exists("Chinook.db"):
+logger = logging.getLogger(__name__)
+
+# Words users say for Chinook tables that do not appear in the schema
+CHINOOK_TABLE_ALIASES = {
+    "Track": ["song", "music", "tune", "length", "duration", "composer"],
+    "Artist": ["band", "singer", "musician"],
+    "Album": ["record"],
+    "Invoice": ["sale", "purchase", "order", "revenue", "spent", "bought"],
+    "InvoiceLine": ["sold", "sale", "revenue"],
+    "Customer": ["client", "buyer"],
+    "Employee": ["staff", "agent", "representative"],
+    "MediaType": ["format"],
+}
+
+# Download db if not exist
+def download_chinook_db(path: str = "Chinook.db") -> None:
+    if not os.path.exists(path):
         url = "https://storage.googleapis.com/benchmarks-artifacts/chinook/Chinook.db"
 
         response = requests.get(url)
 
         if response.status_code == 200:
             # Open a local file in binary write mode
-            with open("Chinook.db", "wb") as file:
+            with open(path, "wb") as file:
                 # Write the content of the response (the file) to the local file
                 file.write(response.content)
-            print("File downloaded and saved as Chinook.db")
+            logger.info("File downloaded and saved as %s", path)
         else:
-            print(f"Failed to download the file. Status code: {response.status_code}")   
+            logger.error("Failed to download the file. Status code: %s", response.status_code)
+
+# SQL tools of a SQLite file (Chinook.db by default, downloaded if missing), with their own connection pool and result cache.
+# With SQL_RESULT_FORMAT=compact, results come in pages within a row and byte budget, and sql_db_next_page returns the next ones.
+def get_sql_db_tool(llm: BaseChatModel, path: str = "Chinook.db") -> Tuple[List[BaseTool], SQLDatabase]:
+    if path == "Chinook.db":
+        download_chinook_db()
     # Load up db         
-    db = SQLDatabase.from_uri("sqlite:///Chinook.db")
+    engine = create_read_only_engine(path)
+    db = SQLDatabase(engine)
     toolkit = SQLDatabaseToolkit(db=db, llm=llm)
     tools = toolkit.get_tools()
-    return tools, db
\ No newline at end of file
+
+    # Cache query results, reconnect the pool if the file is replaced
+    cache = QueryResultCache(
+        path,
+        max_bytes=int(os.getenv("SQL_CACHE_MAX_BYTES", str(16 * 2**20))),
+        on_invalidate=engine.dispose,
+    )
+    formatter = get_result_formatter(engine)
+    tools = [
+        CachedQuerySQLDatabaseTool(db=db, cache=cache, formatter=formatter, description=tool.description + (PAGED_RESULTS if formatter else ""))
+        if tool.name == "sql_db_query" else tool
+        for tool in tools
+    ]
+    if formatter is not None:
+        tools.append(SQLNextPageTool(cache=cache, formatter=formatter))
+    return tools, db
+
+# Pooled read-only engine for a SQLite file that is never written by the app:
+# mode=ro and immutable=1 skip locking and change detection, mmap avoids read() copies
+def create_read_only_engine(path: str, pool_size: Optional[int] = None, mmap_size: int = 256 * 2**20):
+    engine = create_engine(
+        f"sqlite:///file:{path}?mode=ro&immutable=1&uri=true",
+        poolclass=QueuePool,
+        pool_size=pool_size or int(os.getenv("SQL_POOL_SIZE", "8")),
+        max_overflow=0,
+        connect_args={"check_same_thread": False},
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA mmap_size={mmap_size}")
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return engine
+
+# Static checks of generated queries against Chinook.db, used to skip the check_query LLM call
+def get_sql_validator(path: str = "Chinook.db") -> SQLValidator:
+    return SQLValidator(path)
+
+PAGED_RESULTS = (
+    " Results are tab separated lines under a 'column:TYPE' header, at most one page of rows at a time;"
+    " the last line tells how many rows were shown and gives a cursor for the next page if there are more."
+)
+
+# sql_db_query with an LRU result cache in front of the database, and results rendered by formatter if given
+class CachedQuerySQLDatabaseTool(QuerySQLDatabaseTool):
+    cache: QueryResultCache
+    formatter: Optional[SQLResultFormatter] = None
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> Union[str, Sequence[Dict[str, Any]]]:
+        # Error messages are returned to the LLM but never cached
+        return self.cache.get_or_compute(
+            query,
+            (lambda: self.formatter.run(query)) if self.formatter is not None else (lambda: self.db.run_no_throw(query)),
+            should_cache=lambda result: not str(result).startswith("Error:"),
+        )
+
+class _NextPageInput(BaseModel):
+    cursor: str = Field(..., description="Cursor given at the end of a truncated sql_db_query or sql_db_next_page result.")
+
+# Next page of a truncated query result, through the same result cache (cursors are deterministic)
+class SQLNextPageTool(BaseTool):
+    name: str = "sql_db_next_page"
+    description: str = "Input is a cursor from the end of a truncated query result, output is the next page of rows of that query."
+    args_schema: Type[BaseModel] = _NextPageInput
+    cache: QueryResultCache
+    formatter: SQLResultFormatter
+
+    def _run(self, cursor: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        return self.cache.get_or_compute(
+            f"-- cursor {cursor.strip()}",
+            lambda: self.formatter.next_page(cursor),
+            should_cache=lambda result: not result.startswith("Error:"),
+        )
+
+# Precomputed schema of Chinook.db, used instead of the list_tables / call_get_schema round trip.
+# The built index is kept in SCHEMA_INDEX_ARTIFACT (prebuilt by build_artifacts.py), set it empty to always rebuild.
+def get_schema_index(path: str = "Chinook.db") -> SchemaIndex:
+    base_dir = os.path.dirname(os.path.abspath(__file__))  # this gives /code/app/tools
+    app_dir = os.path.abspath(os.path.join(base_dir, '..'))  # move one level up to /code/app
+    artifact_path = os.getenv("SCHEMA_INDEX_ARTIFACT", os.path.join(app_dir, "artifacts", "schema_index.pkl"))
+    return SchemaIndex(path, aliases=CHINOOK_TABLE_ALIASES, artifact_path=artifact_path or None)
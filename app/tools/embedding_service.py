@@ -0,0 +1,182 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from tools.metrics import EMBEDDING_BATCH_SIZE
+
+@dataclass
+class _Request:
+    texts: List[str]
+    query: bool
+    future: Future = field(default_factory=Future)
+
+# Embeddings wrapper in front of the embedding model:
+# - query embeddings are kept in an LRU cache keyed by whitespace-normalized text,
+#   and identical queries in flight share one computation
+# - requests arriving within max_wait seconds of each other are embedded in one forward pass (up to max_batch texts)
+# - the model runs on a dedicated thread; aembed_query/aembed_documents await it without blocking the event loop
+class EmbeddingService(Embeddings):
+    def __init__(
+        self,
+        embedding: Embeddings,
+        cache_size: int = 4096,
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+        batch_queries: bool = True,
+    ):
+        self.embedding = embedding
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        # False when the model embeds queries differently from documents (e.g. with an instruction prompt):
+        # queries are then embedded one at a time with embed_query, on the same thread
+        self.batch_queries = batch_queries
+        self.cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.inflight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.requests: "queue.Queue[_Request]" = queue.Queue()
+        self.worker: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.embedded = 0
+        self.max_batch_seen = 0
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return " ".join(text.split())
+
+    def _submit(self, request: _Request) -> Future:
+        if self.worker is None:
+            with self.lock:
+                if self.worker is None:
+                    self.worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                    self.worker.start()
+        self.requests.put(request)
+        return request.future
+
+    # Cached vector of the query, or the future computing it
+    def _query(self, text: str) -> Future:
+        key = self._key(text)
+        with self.lock:
+            vector = self.cache.get(key)
+            if vector is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(vector)
+                return future
+            self.misses += 1
+            future = self.inflight.get(key)
+            if future is not None:
+                return future
+            request = _Request([text], query=True)
+            self.inflight[key] = request.future
+        request.future.add_done_callback(lambda future: self._cache(key, future))
+        return self._submit(request)
+
+    def _cache(self, key: str, future: Future) -> None:
+        with self.lock:
+            self.inflight.pop(key, None)
+            if future.exception() is None:
+                self.cache[key] = future.result()
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+    # Worker thread: one batch per loop, requests of the other kind wait for the next batch
+    def _run(self) -> None:
+        pending: Optional[_Request] = None
+        while True:
+            first = pending or self.requests.get()
+            pending = None
+            batch = [first]
+            size = len(first.texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request.query != first.query:
+                    pending = request
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            self._embed(batch)
+
+    def _embed(self, batch: List[_Request]) -> None:
+        texts = [text for request in batch for text in request.texts]
+        try:
+            if batch[0].query and not self.batch_queries:
+                vectors = [self.embedding.embed_query(text) for text in texts]
+            else:
+                vectors = self.embedding.embed_documents(texts)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        with self.lock:
+            self.batches += 1
+            self.embedded += len(texts)
+            self.max_batch_seen = max(self.max_batch_seen, len(texts))
+        EMBEDDING_BATCH_SIZE.observe(len(texts), kind="query" if batch[0].query else "documents")
+        start = 0
+        for request in batch:
+            request.future.set_result(vectors[start:start + len(request.texts)] if not request.query else vectors[start])
+            start += len(request.texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._query(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self._query(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._submit(_Request(list(texts), query=False)).result()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return await asyncio.wrap_future(self._submit(_Request(list(texts), query=False)))
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.cache),
+                "batches": self.batches,
+                "mean_batch_size": self.embedded / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+            }
+
+# Models whose embed_query is embed_documents of one text can batch queries with documents' forward pass
+def _embeds_queries_as_documents(embedding: Embeddings) -> bool:
+    query_kwargs = getattr(embedding, "query_encode_kwargs", None)
+    return not query_kwargs or query_kwargs == getattr(embedding, "encode_kwargs", None)
+
+def get_embedding_service(embedding: Embeddings) -> Embeddings:
+    # EMBEDDING_SERVICE=0 uses the model directly
+    if os.getenv("EMBEDDING_SERVICE", "1") != "1":
+        return embedding
+    return EmbeddingService(
+        embedding,
+        cache_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+        max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "32")),
+        max_wait=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")) / 1000,
+        batch_queries=_embeds_queries_as_documents(embedding),
+    )
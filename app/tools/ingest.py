@@ -0,0 +1,265 @@
+# Incremental ingestion of documents into a vectorstore: fetch concurrently, then split -> deduplicate -> embed -> upsert
+# one document at a time, in batches. A manifest of content hashes lets later runs re-embed changed and new documents
+# only, and remove the chunks of deleted ones.
+# Usage (from app/): python -m tools.ingest [--source-dir DIR] [--urls URL ...] [--rebuild]
+import os
+import json
+import glob
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_text_splitters import TextSplitter
+from tools.embedding_service import EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+BLOG_URLS = [
+    "https://lilianweng.github.io/posts/2024-11-28-reward-hacking/",
+    "https://lilianweng.github.io/posts/2024-07-07-hallucination/",
+    "https://lilianweng.github.io/posts/2024-04-12-diffusion-video/",
+]
+
+# One document to ingest: its id (URL or file path) and how to load it
+@dataclass
+class Source:
+    id: str
+    load: Callable[[], List[Document]]
+
+def web_sources(urls: Sequence[str]) -> List[Source]:
+    from langchain_community.document_loaders import WebBaseLoader
+    return [Source(url, WebBaseLoader(url).load) for url in urls]
+
+# Offline source: HTML (text extracted like WebBaseLoader does), Markdown and text files of a directory
+def local_sources(directory: str, patterns: Sequence[str] = ("*.html", "*.htm", "*.md", "*.txt")) -> List[Source]:
+    def loader(path: str) -> Callable[[], List[Document]]:
+        def load() -> List[Document]:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            if path.endswith((".html", ".htm")):
+                from bs4 import BeautifulSoup
+                text = BeautifulSoup(text, "html.parser").get_text()
+            return [Document(page_content=text, metadata={"source": path})]
+        return load
+
+    paths = sorted({path for pattern in patterns for path in glob.glob(os.path.join(directory, "**", pattern), recursive=True)})
+    return [Source(path, loader(path)) for path in paths]
+
+# Embedding calls per batch: enough texts to keep every core busy, bounded to keep memory flat
+def default_batch_size() -> int:
+    return int(os.getenv("INGEST_BATCH_SIZE", "0")) or min(256, 16 * (os.cpu_count() or 1))
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# Chunk ids are content hashes, so identical chunks of different documents are stored once
+def chunk_id(chunk: Document) -> str:
+    return _hash(" ".join(chunk.page_content.split()))[:32]
+
+# Overlapping splits repeat every token about chunk_overlap / chunk_size times. Keep the fewest chunks
+# still covering each document (greedy interval cover on the start_index of each chunk), then drop exact duplicates.
+def dedup_chunks(chunks: List[Document], gap: int = 2) -> List[Document]:
+    if chunks and all("start_index" in chunk.metadata for chunk in chunks):
+        # start_index restarts at 0 for every document
+        documents: Dict[str, List[Document]] = {}
+        for chunk in chunks:
+            key = json.dumps({k: v for k, v in chunk.metadata.items() if k != "start_index"}, sort_keys=True, default=str)
+            documents.setdefault(key, []).append(chunk)
+        chunks = [chunk for document in documents.values() for chunk in _cover(document, gap)]
+    seen, unique = set(), []
+    for chunk in chunks:
+        if (id := chunk_id(chunk)) not in seen:
+            seen.add(id)
+            unique.append(chunk)
+    return unique
+
+def _cover(chunks: List[Document], gap: int) -> List[Document]:
+    spans = sorted(((chunk.metadata["start_index"], chunk.metadata["start_index"] + len(chunk.page_content), chunk) for chunk in chunks), key=lambda span: span[0])
+    kept, covered, i = [], 0, 0
+    while i < len(spans):
+        # Among the chunks starting inside the covered text (give or take the whitespace the splitter strips),
+        # keep the one reaching furthest
+        best = spans[i]
+        i += 1
+        while i < len(spans) and spans[i][0] <= covered + gap:
+            if spans[i][1] > best[1]:
+                best = spans[i]
+            i += 1
+        if best[1] > covered:
+            kept.append(best[2])
+            covered = best[1]
+    return kept
+
+# Content hash and chunk ids of every ingested source, with the settings they were embedded with
+class Manifest:
+    def __init__(self, path: str, settings: dict):
+        self.path = path
+        self.settings = settings
+        self.sources: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            # Other splitter or embedding settings: every document is re-embedded
+            if data.get("settings") == settings:
+                self.sources = data.get("sources", {})
+
+    # Chunk ids still used by another source than source_id
+    def referenced_ids(self, exclude: str) -> set:
+        return {id for source, entry in self.sources.items() if source != exclude for id in entry["chunk_ids"]}
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"settings": self.settings, "sources": self.sources}, f)
+        os.replace(tmp_path, self.path)
+
+# Whether the manifest at path lists ingested sources; a store without one was never ingested (or was built before manifests)
+def has_sources(path: str) -> bool:
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        return bool(json.load(f).get("sources"))
+
+def embedding_settings(vectorstore: VectorStore) -> dict:
+    embedding = vectorstore.embeddings
+    if isinstance(embedding, EmbeddingService):
+        embedding = embedding.embedding
+    return {"embedding": f"{type(embedding).__name__}:{getattr(embedding, 'model_name', getattr(embedding, 'model', ''))}"}
+
+# Fetch sources concurrently, at most `workers` documents loaded ahead of the one being embedded
+def fetch(sources: Sequence[Source], workers: int) -> Iterator[Tuple[Source, Optional[List[Document]], Optional[Exception]]]:
+    def load(source: Source):
+        try:
+            return source, source.load(), None
+        except Exception as e:
+            return source, None, e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for source in sources:
+            pending.append(executor.submit(load, source))
+            if len(pending) > workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+# Fetch every source up front, for a (re)build: the store is only replaced once there is something to put in it.
+# Raises if no source could be fetched.
+def fetch_all(sources: Sequence[Source], workers: int = 8) -> List[Source]:
+    fetched = []
+    for source, documents, error in fetch(sources, workers):
+        if error is not None:
+            logger.warning("Could not fetch %s: %s", source.id, error)
+            continue
+        fetched.append(Source(source.id, lambda documents=documents: documents))
+    if not fetched:
+        raise RuntimeError(f"Could not fetch any of the {len(sources)} sources, the vectorstore was not built")
+    return fetched
+
+def ingest(
+    sources: Sequence[Source],
+    vectorstore: VectorStore,
+    manifest_path: str,
+    splitter: TextSplitter,
+    batch_size: Optional[int] = None,
+    workers: int = 8,
+    delete_missing: bool = True,
+) -> dict:
+    batch_size = batch_size or default_batch_size()
+    settings = {
+        **embedding_settings(vectorstore),
+        "splitter": type(splitter).__name__,
+        "chunk_size": getattr(splitter, "_chunk_size", None),
+        "chunk_overlap": getattr(splitter, "_chunk_overlap", None),
+    }
+    manifest = Manifest(manifest_path, settings)
+    stats = {"unchanged": 0, "added": 0, "updated": 0, "deleted": 0, "failed": 0, "chunks": 0, "chunks_embedded": 0, "chunks_deduplicated": 0, "chunks_deleted": 0}
+
+    for source, documents, error in fetch(sources, workers):
+        if error is not None:
+            # A source that cannot be fetched keeps its previous chunks
+            logger.warning("Could not fetch %s: %s", source.id, error)
+            stats["failed"] += 1
+            continue
+        content_hash = _hash("\n".join(document.page_content for document in documents))
+        previous = manifest.sources.get(source.id)
+        if previous is not None and previous["hash"] == content_hash:
+            stats["unchanged"] += 1
+            continue
+
+        chunks = splitter.split_documents(documents)
+        unique = dedup_chunks(chunks)
+        stats["chunks"] += len(chunks)
+        stats["chunks_deduplicated"] += len(chunks) - len(unique)
+        ids = [chunk_id(chunk) for chunk in unique]
+        # Chunks already stored for this or another source keep their vectors
+        stored = manifest.referenced_ids(exclude="") if previous is None else manifest.referenced_ids(exclude=source.id) | set(previous["chunk_ids"])
+        new = [(id, chunk) for id, chunk in zip(ids, unique) if id not in stored]
+        for start in range(0, len(new), batch_size):
+            batch = new[start:start + batch_size]
+            vectorstore.add_documents([chunk for _, chunk in batch], ids=[id for id, _ in batch])
+        stats["chunks_embedded"] += len(new)
+
+        if previous is not None:
+            stale = set(previous["chunk_ids"]) - set(ids) - manifest.referenced_ids(exclude=source.id)
+            if stale:
+                vectorstore.delete(ids=sorted(stale))
+            stats["chunks_deleted"] += len(stale)
+        stats["updated" if previous is not None else "added"] += 1
+        manifest.sources[source.id] = {"hash": content_hash, "chunk_ids": ids}
+        # Saved after every document, an interrupted run resumes where it stopped
+        manifest.save()
+
+    if delete_missing:
+        current = {source.id for source in sources}
+        for source_id in [source_id for source_id in manifest.sources if source_id not in current]:
+            entry = manifest.sources.pop(source_id)
+            stale = set(entry["chunk_ids"]) - manifest.referenced_ids(exclude=source_id)
+            if stale:
+                vectorstore.delete(ids=sorted(stale))
+            stats["chunks_deleted"] += len(stale)
+            stats["deleted"] += 1
+        manifest.save()
+    return stats
+
+def get_splitter(chunk_size: int = 100, chunk_overlap: int = 50) -> TextSplitter:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    # start_index lets dedup_chunks drop the chunks fully covered by their neighbours
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+
+def main():
+    from tools.lilianweng_vectorstore import get_vectorstore, get_persist_directory, rebuild_vectorstore
+
+    parser = argparse.ArgumentParser(description="Ingest blog posts into the vectorstore")
+    parser.add_argument("--urls", nargs="*", default=BLOG_URLS, help="Web pages to ingest")
+    parser.add_argument("--source-dir", help="Ingest the HTML, Markdown and text files of this directory instead of the web pages")
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks per embedding batch, default sized to the CPU")
+    parser.add_argument("--workers", type=int, default=8, help="Documents fetched concurrently")
+    parser.add_argument("--rebuild", action="store_true", help="Replace the vectorstore and its manifest with a new one")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    sources = local_sources(args.source_dir) if args.source_dir else web_sources(args.urls)
+    splitter = get_splitter(args.chunk_size, args.chunk_overlap)
+    # A store without a manifest has chunks under random ids, which an update would duplicate: it is rebuilt
+    if args.rebuild or not has_sources(os.path.join(get_persist_directory(), "manifest.json")):
+        _, stats = rebuild_vectorstore(sources, splitter, batch_size=args.batch_size, workers=args.workers)
+    else:
+        stats = ingest(
+            sources, get_vectorstore(ingest_missing=False),
+            os.path.join(get_persist_directory(), "manifest.json"),
+            splitter,
+            batch_size=args.batch_size,
+            workers=args.workers,
+        )
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
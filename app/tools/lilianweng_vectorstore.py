@@ -1,45 +1,64 @@
 import os
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import shutil
+from typing import Optional, Sequence, Tuple
+from langchain_core.embeddings import Embeddings
 from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_text_splitters import TextSplitter
+from tools.embedding_service import get_embedding_service
+from tools.ingest import BLOG_URLS, Source, fetch_all, get_splitter, has_sources, ingest, web_sources
 
-def get_vectorstore() -> VectorStore:
-    embedding = HuggingFaceEmbeddings()
-    
+# VECTORSTORE=chroma (default) uses Chroma; VECTORSTORE=numpy keeps the index in process, memory-mapped
+def get_backend() -> str:
+    return os.getenv("VECTORSTORE", "chroma")
+
+def get_persist_directory() -> str:
     # Get the directory of the current file or use the base app directory
     base_dir = os.path.dirname(os.path.abspath(__file__))  # this gives /code/app/tools
     app_dir = os.path.abspath(os.path.join(base_dir, '..'))  # move one level up to /code/app
-    persist_directory = os.path.join(app_dir, 'lilianwen_db')
-    
-    # Create vectorstore if not exist, else load vectorstore
-    if not os.path.exists(persist_directory):
-        # Download data
-        urls = [
-            "https://lilianweng.github.io/posts/2024-11-28-reward-hacking/",
-            "https://lilianweng.github.io/posts/2024-07-07-hallucination/",
-            "https://lilianweng.github.io/posts/2024-04-12-diffusion-video/",
-        ]
-        docs = [WebBaseLoader(url).load() for url in urls]
-        docs_list = [item for sublist in docs for item in sublist]
+    return os.path.join(app_dir, 'lilianwen_db' if get_backend() == "chroma" else 'lilianwen_index')
 
-        # Split text
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            chunk_size=100, chunk_overlap=50
-        )
-        doc_splits = text_splitter.split_documents(docs_list)
+def get_manifest_path() -> str:
+    return os.path.join(get_persist_directory(), "manifest.json")
 
-        # Store text in vector store
-        vectorstore = Chroma.from_documents(
-            documents=doc_splits,
-            embedding=embedding,
-            persist_directory=persist_directory
-        )
-    else:
-        # Load vectorstore from path
-        vectorstore = Chroma(
+def get_embedding() -> Embeddings:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    # Query cache and micro-batching in front of the model, shared with the router and the answer cache
+    return get_embedding_service(HuggingFaceEmbeddings())
+
+def open_vectorstore(embedding: Embeddings) -> VectorStore:
+    persist_directory = get_persist_directory()
+    if get_backend() == "chroma":
+        from langchain_chroma import Chroma
+        return Chroma(
             embedding_function=embedding,
             persist_directory=persist_directory,
         )
-    return vectorstore
\ No newline at end of file
+    from tools.numpy_vectorstore import NumpyVectorStore
+    # int8 takes a quarter of the memory of float32 for a small recall cost, float16 half of it but scores slower
+    return NumpyVectorStore(embedding, persist_directory, dtype=os.getenv("VECTORSTORE_DTYPE", "float32"))
+
+# Replaces the vectorstore with one built from sources. They are fetched first: when none can be fetched it raises,
+# and the store on disk is left as it was. Returns the new store and the ingest stats.
+def rebuild_vectorstore(
+    sources: Sequence[Source],
+    splitter: Optional[TextSplitter] = None,
+    embedding: Optional[Embeddings] = None,
+    batch_size: Optional[int] = None,
+    workers: int = 8,
+) -> Tuple[VectorStore, dict]:
+    fetched = fetch_all(sources, workers)
+    shutil.rmtree(get_persist_directory(), ignore_errors=True)
+    vectorstore = open_vectorstore(embedding or get_embedding())
+    stats = ingest(fetched, vectorstore, get_manifest_path(), splitter or get_splitter(), batch_size=batch_size, workers=workers)
+    stats["failed"] = len(sources) - len(fetched)
+    return vectorstore, stats
+
+# Loads the vectorstore, building it from the blog posts first if its manifest is missing or empty: never built,
+# a first build that fetched nothing, or a store from before manifests, whose random chunk ids an update would duplicate.
+# Run `python -m tools.ingest` to update an existing one: only changed posts are re-embedded.
+def get_vectorstore(ingest_missing: bool = True) -> VectorStore:
+    embedding = get_embedding()
+    if ingest_missing and not has_sources(get_manifest_path()):
+        vectorstore, _ = rebuild_vectorstore(web_sources(BLOG_URLS), embedding=embedding)
+        return vectorstore
+    return open_vectorstore(embedding)
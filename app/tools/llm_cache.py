@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Optional
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+MODES = ("read_through", "record", "replay")
+
+# Per message fields that differ between runs of the same conversation: ids assigned by the graph,
+# provider metadata and token usage
+VOLATILE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+class LLMCacheMiss(LookupError):
+    pass
+
+# The cache key: a hash of the model string (model name and parameters, bound tools and tool_choice)
+# and of the messages without their volatile fields
+def cache_key(prompt: str, llm_string: str) -> str:
+    messages = json.loads(prompt)
+    for message in messages:
+        kwargs = message.get("kwargs", {})
+        for field in VOLATILE_FIELDS:
+            kwargs.pop(field, None)
+    # Object reprs in the model string carry memory addresses
+    llm_string = re.sub(r"0x[0-9a-fA-F]+", "0x", llm_string)
+    return hashlib.sha256(f"{llm_string}\0{json.dumps(messages, sort_keys=True)}".encode()).hexdigest()
+
+# Cache of LLM responses in a SQLite file, set as the chat model's cache. Modes:
+# - read_through: answer from the cache, call the model and store its response on a miss
+# - record: always call the model and store its responses (to refresh recordings)
+# - replay: only answer from the cache, a miss raises LLMCacheMiss (runs without network)
+# Entries expire after ttl seconds (except in replay mode); past max_bytes, least recently used entries are evicted.
+class SqliteLLMCache(BaseCache):
+    def __init__(self, path: str, mode: str = "read_through", ttl: Optional[float] = None, max_bytes: int = 256 * 2**20):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed);
+            """
+        )
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.mode == "record":
+            return None
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.mode != "replay" and self.ttl is not None and row[1] < now - self.ttl:
+                self._delete(key)
+                row = None
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+        if row is None:
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"No recorded LLM response for this prompt (key {key}) in {self.path}")
+            return None
+        generations = loads(row[0])
+        for generation in generations:
+            # Graph state keys messages by id, a response served twice must not replace the earlier one
+            generation.message.id = None
+            generation.message.response_metadata = {**generation.message.response_metadata, "llm_cache": "hit"}
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode == "replay":
+            return
+        key = cache_key(prompt, llm_string)
+        value = dumps(return_val)
+        now = time.time()
+        with self.lock:
+            self._delete(key)
+            self.conn.execute("INSERT INTO llm_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now))
+            self.size += len(value)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _delete(self, key: str) -> None:
+        row = self.conn.execute("DELETE FROM llm_cache WHERE key = ? RETURNING size", (key,)).fetchone()
+        if row is not None:
+            self.size -= row[0]
+
+    # Least recently used entries first, down to 90% of max_bytes so eviction does not run on every insert
+    def _evict(self) -> None:
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            entries = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {
+                "mode": self.mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": self.size,
+                "evictions": self.evictions,
+            }
+
+def get_llm_cache() -> Optional[SqliteLLMCache]:
+    # LLM_CACHE=off calls the model every time
+    mode = os.getenv("LLM_CACHE", "read_through")
+    if mode == "off":
+        return None
+    app_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    return SqliteLLMCache(
+        os.getenv("LLM_CACHE_DB", os.path.join(app_dir, "llm_cache.sqlite")),
+        mode=mode,
+        ttl=float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400")) or None,
+        max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 2**20),
+    )
@@ -0,0 +1,326 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a cached lookup to a slow multi-agent answer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(name, value) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+# Minimal Prometheus metrics: counters, gauges and histograms with labels, rendered in the text exposition format
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"]
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    # Per label set: [count per bucket..., count, sum]
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def _render_value(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        lines = [
+            f"{self.name}_bucket{_format_labels(self.labels, key, ('le', str(bound)))} {count}"
+            for bound, count in zip(self.buckets, value)
+        ]
+        lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', '+Inf'))} {value[-2]}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {value[-2]}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {value[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    # Collectors render metrics computed at scrape time, e.g. cache counters
+    def render(self, *collectors: Callable[[], List[str]]) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram("chatbot_request_seconds", "End to end request latency.", ["endpoint"]))
+REQUEST_QUEUE_SECONDS = REGISTRY.register(Histogram("chatbot_request_queue_seconds", "Time from request arrival to the first graph node.", ["endpoint"]))
+REQUESTS_TOTAL = REGISTRY.register(Counter("chatbot_requests_total", "Requests by endpoint and outcome.", ["endpoint", "status"]))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge("chatbot_requests_in_flight", "Requests being processed.", ["endpoint"]))
+NODE_SECONDS = REGISTRY.register(Histogram("chatbot_node_seconds", "Wall time per graph node, e.g. sql_agent/generate_query.", ["node"]))
+LLM_SECONDS = REGISTRY.register(Histogram("chatbot_llm_seconds", "Wall time per LLM call.", ["node"]))
+LLM_TOKENS = REGISTRY.register(Counter("chatbot_llm_tokens_total", "LLM tokens by node and kind (prompt, completion).", ["node", "kind"]))
+TOOL_SECONDS = REGISTRY.register(Histogram("chatbot_tool_seconds", "Tool execution time.", ["tool"]))
+TOOL_ERRORS = REGISTRY.register(Counter("chatbot_tool_errors_total", "Tool calls that raised.", ["tool"]))
+EMBEDDING_BATCH_SIZE = REGISTRY.register(Histogram("chatbot_embedding_batch_size", "Texts per embedding model call.", ["kind"], buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)))
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge("chatbot_admission_queue_depth", "Requests waiting for a slot."))
+ADMISSION_RUNNING = REGISTRY.register(Gauge("chatbot_admission_running", "Requests holding a slot."))
+ADMISSION_QUEUE_SECONDS = REGISTRY.register(Histogram("chatbot_admission_queue_seconds", "Time a request waited for a slot."))
+ADMISSION_REJECTED = REGISTRY.register(Counter("chatbot_admission_rejected_total", "Requests rejected by admission control.", ["reason"]))
+WS_SLOW_CONSUMERS = REGISTRY.register(Counter("chatbot_ws_slow_consumers_total", "WebSocket connections closed because the client did not keep up with its messages."))
+LLM_RATE_WAIT_SECONDS = REGISTRY.register(Histogram("chatbot_llm_rate_wait_seconds", "Time an LLM call waited for the provider's rate limits."))
+NODE_TIMEOUTS = REGISTRY.register(Counter("chatbot_node_timeouts_total", "Node calls stopped by their timeout or the request's deadline.", ["node"]))
+CANCELLED = REGISTRY.register(Counter("chatbot_cancelled_total", "Node, LLM and tool runs cancelled in flight, e.g. at a deadline or when the client left.", ["kind", "name"]))
+STARTUP_SECONDS = REGISTRY.register(Gauge("chatbot_startup_seconds", "Time spent in each startup phase.", ["phase"]))
+
+# Flat stats dicts (answer cache, query cache, ...) as gauges: name{component="...",stat="..."}
+def stats_collector(name: str, get_stats: Callable[[], Dict[str, Dict[str, float]]]) -> Callable[[], List[str]]:
+    def collect() -> List[str]:
+        lines = [f"# HELP {name} Cache and shortcut counters, as served on /stats.", f"# TYPE {name} gauge"]
+        for component, stats in get_stats().items():
+            for stat, value in stats.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"{name}{_format_labels(('component', 'stat'), (component, stat))} {value}")
+        return lines
+    return collect
+
+# Path of the graph node making a call, e.g. "sql_agent/generate_query" or "supervisor/agent"
+def _node_path(metadata: Optional[dict]) -> str:
+    metadata = metadata or {}
+    namespace = metadata.get("langgraph_checkpoint_ns")
+    if namespace:
+        return "/".join(part.split(":")[0] for part in namespace.split("|"))
+    return metadata.get("langgraph_node", "unknown")
+
+# Usage of one LLM call, from usage_metadata (langchain_core) or the provider's token_usage
+def token_usage(response: LLMResult) -> Tuple[int, int]:
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not (prompt_tokens or completion_tokens) and response.llm_output:
+        usage = response.llm_output.get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+# Callback handler of one request: records node, LLM and tool timings into the registry, and keeps
+# the spans of the request so slow requests can be traced
+class MetricsCallbackHandler(BaseCallbackHandler):
+    # Recording is cheap, run in the caller's thread rather than in an executor
+    run_inline = True
+
+    def __init__(self, endpoint: str, start: Optional[float] = None):
+        self.endpoint = endpoint
+        self.start = start if start is not None else time.perf_counter()
+        self.first_node_at: Optional[float] = None
+        self.runs: Dict[UUID, Tuple[str, str, float]] = {}  # run id -> (kind, name, start)
+        self.node_tasks: set = set()  # checkpoint namespaces of the node runs already timed
+        self.spans: List[dict] = []
+        self.lock = threading.Lock()
+
+    def _begin(self, run_id: UUID, kind: str, name: str) -> None:
+        now = time.perf_counter()
+        with self.lock:
+            self.runs[run_id] = (kind, name, now)
+            if kind == "node" and self.first_node_at is None:
+                self.first_node_at = now
+                REQUEST_QUEUE_SECONDS.observe(now - self.start, endpoint=self.endpoint)
+
+    def _end(self, run_id: UUID, **extra: Any) -> Optional[Tuple[str, str, float]]:
+        now = time.perf_counter()
+        with self.lock:
+            run = self.runs.pop(run_id, None)
+            if run is None:
+                return None
+            kind, name, started = run
+            if extra.get("error") == "CancelledError":
+                CANCELLED.inc(kind=kind, name=name)
+            self.spans.append({
+                "kind": kind,
+                "name": name,
+                "start_ms": round((started - self.start) * 1000, 1),
+                "duration_ms": round((now - started) * 1000, 1),
+                **extra,
+            })
+        return kind, name, now - started
+
+    # Graph nodes are the chain runs named after their langgraph_node, labelled with their path in the graph.
+    # A task can start several runs of that name (nested in a subgraph node, again when a handoff's
+    # ParentCommand is applied): only the first one per task, by checkpoint namespace, is timed.
+    def on_chain_start(self, serialized: Optional[dict], inputs: Any, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        if not metadata or kwargs.get("name") != metadata.get("langgraph_node"):
+            return
+        task = metadata.get("langgraph_checkpoint_ns")
+        with self.lock:
+            if task in self.node_tasks:
+                return
+            self.node_tasks.add(task)
+        self._begin(run_id, "node", _node_path(metadata))
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if (run := self._end(run_id)) is not None:
+            NODE_SECONDS.observe(run[2], node=run[1])
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # Handoffs end the supervisor with a ParentCommand, which still counts as the node's time
+        if (run := self._end(run_id, error=type(error).__name__)) is not None:
+            NODE_SECONDS.observe(run[2], node=run[1])
+
+    def on_chat_model_start(self, serialized: Optional[dict], messages: Any, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._begin(run_id, "llm", _node_path(metadata))
+
+    def on_llm_start(self, serialized: Optional[dict], prompts: Any, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._begin(run_id, "llm", _node_path(metadata))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        prompt_tokens, completion_tokens = token_usage(response)
+        if (run := self._end(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)) is not None:
+            LLM_SECONDS.observe(run[2], node=run[1])
+            LLM_TOKENS.inc(prompt_tokens, node=run[1], kind="prompt")
+            LLM_TOKENS.inc(completion_tokens, node=run[1], kind="completion")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if (run := self._end(run_id, error=type(error).__name__)) is not None:
+            LLM_SECONDS.observe(run[2], node=run[1])
+
+    def on_tool_start(self, serialized: Optional[dict], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._begin(run_id, "tool", kwargs.get("name") or (serialized or {}).get("name", "unknown"))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if (run := self._end(run_id)) is not None:
+            TOOL_SECONDS.observe(run[2], tool=run[1])
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if (run := self._end(run_id, error=type(error).__name__)) is not None:
+            TOOL_SECONDS.observe(run[2], tool=run[1])
+            TOOL_ERRORS.inc(tool=run[1])
+
+    def trace(self) -> dict:
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {
+            "endpoint": self.endpoint,
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "queue_ms": round((self.first_node_at - self.start) * 1000, 1) if self.first_node_at is not None else None,
+            "spans": spans,
+        }
+
+# Request level metrics around one graph run: latency, outcome, in-flight requests.
+# Requests slower than slow_request_seconds log their trace at WARNING level.
+class RequestMetrics:
+    def __init__(self, endpoint: str, slow_request_seconds: Optional[float] = None):
+        self.endpoint = endpoint
+        self.slow_request_seconds = slow_request_seconds
+        self.start = time.perf_counter()
+        self.handler = MetricsCallbackHandler(endpoint, self.start)
+        self.status = "ok"
+
+    def __enter__(self) -> "RequestMetrics":
+        REQUESTS_IN_FLIGHT.inc(endpoint=self.endpoint)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        elapsed = time.perf_counter() - self.start
+        REQUESTS_IN_FLIGHT.dec(endpoint=self.endpoint)
+        if exc_type is not None and self.status == "ok":
+            self.status = "error"
+        REQUESTS_TOTAL.inc(endpoint=self.endpoint, status=self.status)
+        REQUEST_SECONDS.observe(elapsed, endpoint=self.endpoint)
+        if self.slow_request_seconds is not None and elapsed >= self.slow_request_seconds:
+            logger.warning("Slow request on %s (%.2fs): %s", self.endpoint, elapsed, self.handler.trace())
+
+# Startup breakdown: how long each phase (model loading, vectorstore, schema index, graph, ...) took,
+# served on /health and /metrics and logged at INFO level
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready_seconds: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = round(elapsed, 3)
+            STARTUP_SECONDS.set(elapsed, phase=name)
+            logger.info("Startup: %s took %.3fs", name, elapsed)
+
+    def ready(self) -> None:
+        self.ready_seconds = round(time.perf_counter() - self.start, 3)
+        logger.info("Startup: ready after %.3fs", self.ready_seconds)
+
+    def report(self) -> dict:
+        return {"phases": dict(self.phases), "ready_seconds": self.ready_seconds}
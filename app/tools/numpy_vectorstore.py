@@ -0,0 +1,266 @@
+import os
+import json
+import mmap
+import shutil
+import uuid
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# float16 and int8 rows are converted to float32 and scored this many at a time: small blocks stay in the CPU cache
+BLOCK_ROWS = 512
+
+# One immutable version of the index. On disk it is a generation directory:
+#   vectors.npy      normalized embeddings, n x dim, float32, float16 or int8
+#   scales.npy       per row scale of int8 vectors (score = int8 row . query * scale)
+#   offsets.npy      n + 1 byte offsets of the rows of documents.jsonl
+#   documents.jsonl  {"id", "text", "metadata"} per row
+# The arrays and documents are memory-mapped, so uvicorn workers share their pages.
+class _Index:
+    def __init__(self, vectors: np.ndarray, scales: Optional[np.ndarray], offsets: np.ndarray, documents: Any):
+        self.vectors = vectors
+        self.scales = scales
+        self.offsets = offsets
+        self.documents = documents
+        self._rows: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def empty(cls, dim: int = 0, dtype: str = "float32") -> "_Index":
+        return cls(np.zeros((0, dim), dtype=DTYPES[dtype]), None, np.zeros(1, dtype=np.int64), b"")
+
+    @classmethod
+    def load(cls, directory: str) -> "_Index":
+        offsets = np.load(os.path.join(directory, "offsets.npy"))
+        if len(offsets) == 1:
+            # Empty files cannot be memory-mapped
+            vectors = np.load(os.path.join(directory, "vectors.npy"))
+            return cls(vectors, None, offsets, b"")
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        scales_path = os.path.join(directory, "scales.npy")
+        scales = np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+        with open(os.path.join(directory, "documents.jsonl"), "rb") as f:
+            documents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(vectors, scales, offsets, documents)
+
+    def record(self, row: int) -> dict:
+        return json.loads(self.documents[self.offsets[row]:self.offsets[row + 1]])
+
+    def document(self, row: int) -> Document:
+        record = self.record(row)
+        return Document(id=record["id"], page_content=record["text"], metadata=record["metadata"])
+
+    # Row of every id, parsed from the documents on first use
+    def rows(self) -> Dict[str, int]:
+        if self._rows is None:
+            self._rows = {self.record(row)["id"]: row for row in range(len(self))}
+        return self._rows
+
+    # float32 copy of the normalized vectors (dequantized for int8)
+    def dense(self) -> np.ndarray:
+        vectors = np.asarray(self.vectors, dtype=np.float32)
+        return vectors * self.scales[:, None] if self.scales is not None else vectors
+
+    # Top k rows and cosine similarities of every query (m x dim, normalized)
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(self))
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        if self.vectors.dtype == np.float32:
+            # One matrix product over the whole mapped matrix
+            scores = queries @ self.vectors.T
+        else:
+            scores = np.empty((len(queries), len(self)), dtype=np.float32)
+            for start in range(0, len(self), BLOCK_ROWS):
+                block = self.vectors[start:start + BLOCK_ROWS].astype(np.float32)
+                scores[:, start:start + len(block)] = queries @ block.T
+            if self.scales is not None:
+                scores *= self.scales
+        rows = np.argpartition(-scores, k - 1, axis=1)[:, :k] if len(self) > k else np.broadcast_to(np.arange(len(self)), (len(queries), len(self)))
+        scores = np.take_along_axis(scores, rows, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+# Symmetric per row quantization: the largest component of each row maps to +-127
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+# In-process vector store: exact cosine search with one matrix product per query batch, over a memory-mapped
+# matrix. Meant for corpora that fit on one machine (up to a few million chunks); writes rewrite the index.
+class NumpyVectorStore(VectorStore):
+    def __init__(self, embedding: Embeddings, path: Optional[str] = None, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype!r}, expected one of {', '.join(DTYPES)}")
+        self.embedding = embedding
+        self.path = path
+        self.dtype = dtype
+        self.lock = threading.Lock()
+        self._generation: Optional[str] = None
+        self._current_mtime: Optional[int] = None
+        self.index = _Index.empty(dtype=dtype)
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._refresh()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    # Pick up a generation written by another process (e.g. `python -m tools.ingest` while the server runs)
+    def _refresh(self) -> None:
+        if self.path is None:
+            return
+        current = os.path.join(self.path, "CURRENT")
+        try:
+            mtime = os.stat(current).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._current_mtime:
+            return
+        for _ in range(3):
+            with open(current) as f:
+                generation = f.read().strip()
+            if generation == self._generation:
+                break
+            try:
+                self.index = _Index.load(os.path.join(self.path, generation))
+                self._generation = generation
+                break
+            except FileNotFoundError:
+                # Replaced by a newer generation while loading
+                continue
+        self._current_mtime = mtime
+
+    def _write(self, records: List[dict], vectors: np.ndarray) -> None:
+        lines = [json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in records]
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum([len(line) for line in lines], out=offsets[1:])
+        scales = None
+        if self.dtype == "int8":
+            vectors, scales = _quantize(vectors)
+        else:
+            vectors = vectors.astype(DTYPES[self.dtype])
+        if self.path is None:
+            self.index = _Index(vectors, scales, offsets, b"".join(lines))
+            return
+
+        # New generation directory, then an atomic switch of CURRENT: readers see the old or the new index, never a mix
+        generation = f"gen-{uuid.uuid4().hex[:12]}"
+        directory = os.path.join(self.path, generation)
+        os.makedirs(directory)
+        np.save(os.path.join(directory, "vectors.npy"), vectors)
+        if scales is not None:
+            np.save(os.path.join(directory, "scales.npy"), scales)
+        np.save(os.path.join(directory, "offsets.npy"), offsets)
+        with open(os.path.join(directory, "documents.jsonl"), "wb") as f:
+            f.writelines(lines)
+        tmp_path = os.path.join(self.path, "CURRENT.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(generation)
+        os.replace(tmp_path, os.path.join(self.path, "CURRENT"))
+        self._current_mtime = None
+        self._refresh()
+        # Processes still reading an old generation keep their mapping of the deleted files
+        for name in os.listdir(self.path):
+            if name.startswith("gen-") and name != generation:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def _records(self) -> Tuple[List[dict], np.ndarray]:
+        index = self.index
+        return [index.record(row) for row in range(len(index))], index.dense()
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        ids = kwargs.get("ids") or [document.id or str(uuid.uuid4()) for document in documents]
+        if len(ids) != len(documents):
+            raise ValueError("ids and documents must have the same length")
+        vectors = _normalize(np.asarray(self.embedding.embed_documents([document.page_content for document in documents]), dtype=np.float32))
+        with self.lock:
+            self._refresh()
+            records, existing = self._records()
+            if len(records) and existing.shape[1] != vectors.shape[1]:
+                raise ValueError(f"Embedding size {vectors.shape[1]} does not match the index ({existing.shape[1]})")
+            # Upsert: documents with an existing id replace it
+            replaced = set(ids)
+            keep = [row for row, record in enumerate(records) if record["id"] not in replaced]
+            records = [records[row] for row in keep] + [
+                {"id": id, "text": document.page_content, "metadata": document.metadata}
+                for id, document in zip(ids, documents)
+            ]
+            self._write(records, np.concatenate([existing[keep], vectors]) if len(keep) else vectors)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self.lock:
+            self._refresh()
+            records, vectors = self._records()
+            deleted = set(ids)
+            keep = [row for row, record in enumerate(records) if record["id"] not in deleted]
+            if len(keep) == len(records):
+                return False
+            self._write([records[row] for row in keep], vectors[keep] if keep else np.zeros((0, vectors.shape[1]), dtype=np.float32))
+        return True
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        self._refresh()
+        index = self.index
+        rows = index.rows()
+        return [index.document(rows[id]) for id in ids if id in rows]
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        return _normalize(np.asarray(self.embedding.embed_documents(queries) if len(queries) > 1 else [self.embedding.embed_query(queries[0])], dtype=np.float32))
+
+    def _results(self, vectors: np.ndarray, k: int) -> List[List[Tuple[Document, float]]]:
+        self._refresh()
+        index = self.index
+        rows, scores = index.search(vectors, k)
+        return [[(index.document(row), float(score)) for row, score in zip(query_rows, query_scores)] for query_rows, query_scores in zip(rows, scores)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self._results(self._embed_queries([query]), k)[0]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self._results(_normalize(np.asarray([embedding], dtype=np.float32)), k)[0]]
+
+    # Several queries in one embedding call and one matrix product
+    def batch_similarity_search_with_score(self, queries: List[str], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        if not queries:
+            return []
+        return self._results(self._embed_queries(queries), k)
+
+    # Scores are cosine similarities already
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        path: Optional[str] = None,
+        dtype: str = "float32",
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding, path=path, dtype=dtype)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
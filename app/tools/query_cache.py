@@ -0,0 +1,117 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Optional, Tuple
+
+# Collapse whitespace outside string literals and drop the trailing semicolon,
+# so formatting differences between generated queries map to one cache entry
+def normalize_sql(query: str) -> str:
+    parts = re.split(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")", query.strip())
+    normalized = "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+    return normalized.strip().rstrip(";").strip()
+
+# LRU cache of query results for a read-only database file.
+# - Bounded by the total size in bytes of the cached results
+# - Cleared when the database file changes (mtime/size), on_invalidate is called so pools can reconnect
+# - Concurrent identical queries are collapsed into a single execution
+class QueryResultCache:
+    def __init__(self, path: str, max_bytes: int = 16 * 2**20, on_invalidate: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.on_invalidate = on_invalidate
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.in_flight: dict[str, Future] = {}
+        self.size = 0
+        self.signature = self._stat()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _check_file(self) -> None:
+        signature = self._stat()
+        if signature != self.signature:
+            self.signature = signature
+            self.entries.clear()
+            self.size = 0
+            self.invalidations += 1
+            if self.on_invalidate:
+                self.on_invalidate()
+
+    # Return the cached result, or run compute once for all concurrent callers.
+    # Results rejected by should_cache (e.g. error messages) are returned but not stored.
+    def get_or_compute(self, query: str, compute: Callable[[], str], should_cache: Callable[[str], bool] = lambda result: True) -> str:
+        key = normalize_sql(query)
+        with self.lock:
+            self._check_file()
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            future = self.in_flight.get(key)
+            if future is not None:
+                # Another caller is already running this query, wait for its result
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                future = self.in_flight[key] = Future()
+                owner = True
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self.lock:
+                self.in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+        # Store before leaving in_flight, so no caller can slip in and run the query again
+        if should_cache(result):
+            self._store(key, result)
+        with self.lock:
+            self.in_flight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def _store(self, key: str, result: str) -> None:
+        size = len(key.encode()) + len(str(result).encode())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = result
+            self.size += size
+            while self.size > self.max_bytes:
+                old_key, old_result = self.entries.popitem(last=False)
+                self.size -= len(old_key.encode()) + len(str(old_result).encode())
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,310 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+from tools.metrics import (
+    ADMISSION_REJECTED, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_SECONDS, ADMISSION_RUNNING, LLM_RATE_WAIT_SECONDS, token_usage,
+)
+
+# Refills `rate` units per second up to `capacity`. Reservations may overdraw it: the balance goes negative
+# and later reservations wait until it is paid back, so concurrent callers are paced one after the other.
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` is available
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+# Run id of the LLM call about to be rate limited, set by the usage handler when the call starts
+_llm_run: ContextVar[Optional[UUID]] = ContextVar("llm_run", default=None)
+
+# Client side model of the LLM provider's requests and tokens per minute limits, used as the chat model's
+# rate_limiter: every call waits for its share instead of failing with a rate limit error.
+# The tokens of a call are only known once it is done: each call reserves the running average, and
+# usage_handler (a callback of the model) settles what that call reserved with its actual usage.
+class LLMRateLimiter(BaseRateLimiter):
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        burst_seconds: float = 10.0,
+        tokens_per_call: float = 1000.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60 * burst_seconds)) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, max(tokens_per_call, tokens_per_minute / 60 * burst_seconds)) if tokens_per_minute else None
+        self.tokens_per_call = tokens_per_call
+        self.lock = threading.Lock()
+        # Tokens reserved by each call in flight, by run id; bounded, in case a call never reports its end
+        self.reserved: "OrderedDict[UUID, float]" = OrderedDict()
+        self.max_reserved = 10000
+        self.usage_handler = _UsageHandler(self)
+
+    # Seconds a call arriving now would wait
+    def wait_time(self) -> float:
+        with self.lock:
+            return self._wait_time(time.monotonic())
+
+    def _wait_time(self, now: float) -> float:
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(self.tokens_per_call, now))
+        return max(waits)
+
+    # Reserve a call: returns the seconds to wait before making it
+    def _reserve(self) -> float:
+        with self.lock:
+            wait = self._wait_time(time.monotonic())
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(self.tokens_per_call)
+                if (run_id := _llm_run.get()) is not None:
+                    self.reserved[run_id] = self.tokens_per_call
+                    while len(self.reserved) > self.max_reserved:
+                        self.reserved.popitem(last=False)
+        LLM_RATE_WAIT_SECONDS.observe(wait)
+        return wait
+
+    # Settle the tokens call run_id reserved with the tokens it used
+    def record(self, run_id: UUID, tokens: int) -> None:
+        with self.lock:
+            reserved = self.reserved.pop(run_id, None)
+            if reserved is None:
+                return
+            self.tokens.level += reserved - tokens
+            self.tokens_per_call = 0.8 * self.tokens_per_call + 0.2 * tokens
+
+    # A call that failed, or did not report its usage, keeps what it reserved
+    def release(self, run_id: UUID) -> None:
+        with self.lock:
+            self.reserved.pop(run_id, None)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if not blocking and self.wait_time() > 0:
+            return False
+        if (wait := self._reserve()) > 0:
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if not blocking and self.wait_time() > 0:
+            return False
+        if (wait := self._reserve()) > 0:
+            await asyncio.sleep(wait)
+        return True
+
+# Runs inline, in the caller's context: the run id set when a call starts is the one its rate limiter reserves under.
+# Calls answered by the LLM cache never reach the rate limiter, and have nothing to settle.
+class _UsageHandler(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self, limiter: LLMRateLimiter):
+        self.limiter = limiter
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, **kwargs: Any) -> None:
+        _llm_run.set(run_id)
+
+    def on_llm_start(self, serialized: dict, prompts: list, *, run_id: UUID, **kwargs: Any) -> None:
+        _llm_run.set(run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        prompt_tokens, completion_tokens = token_usage(response)
+        if prompt_tokens or completion_tokens:
+            self.limiter.record(run_id, prompt_tokens + completion_tokens)
+        else:
+            self.limiter.release(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.limiter.release(run_id)
+
+# Raised when a request is not admitted: 429 when its user has too many requests waiting, 503 when the server does
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+# Admission control in front of graph runs, on the event loop:
+# - at most max_concurrency runs at once, and max_per_user per user
+# - waiting requests are served round robin across users, so a burst from one user does not delay the others
+# - requests are rejected up front when their user already has max_queue_per_user waiting (429), when
+#   max_queue are waiting, or when the expected wait (queue and LLM rate limit) is over max_wait seconds (503)
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_per_user: int = 4,
+        max_queue: int = 256,
+        max_queue_per_user: int = 16,
+        max_wait: Optional[float] = 60.0,
+        rate_limiter: Optional[LLMRateLimiter] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self.rate_limiter = rate_limiter
+        self.running: Dict[str, int] = {}
+        self.total_running = 0
+        # Users with waiting requests in arrival order, and when each user waiting or running was last
+        # granted a slot: the next slot goes to the user served longest ago, users who just arrived first
+        self.queues: Dict[str, Deque[asyncio.Future]] = {}
+        self.last_served: Dict[str, int] = {}
+        self.grants = 0
+        self.queued = 0
+        # Moving average of a run's duration, to estimate waits
+        self.run_seconds = 5.0
+
+    def _expected_wait(self, ahead: int, slots: int) -> float:
+        wait = ahead / slots * self.run_seconds
+        if self.rate_limiter is not None:
+            wait += self.rate_limiter.wait_time()
+        return wait
+
+    # Admit or reject a request now; the returned ticket waits for a slot when entered
+    def enqueue(self, user_id: str) -> "Ticket":
+        user_queued = len(self.queues.get(user_id, ()))
+        if user_queued >= self.max_queue_per_user:
+            self._reject(429, "too_many_requests", self._expected_wait(user_queued + 1, self.max_per_user))
+        if self.queued >= self.max_queue:
+            self._reject(503, "queue_full", self._expected_wait(self.queued + 1, self.max_concurrency))
+        if self.max_wait is not None and self.total_running >= self.max_concurrency:
+            wait = self._expected_wait(self.queued + 1, self.max_concurrency)
+            if wait > self.max_wait:
+                self._reject(503, "overloaded", wait)
+        return Ticket(self, user_id)
+
+    def _reject(self, status_code: int, reason: str, retry_after: float) -> None:
+        ADMISSION_REJECTED.inc(reason=reason)
+        raise Rejected(status_code, reason, retry_after)
+
+    async def _acquire(self, user_id: str) -> None:
+        future = asyncio.get_running_loop().create_future()
+        if user_id not in self.queues:
+            self.queues[user_id] = deque()
+            self.last_served.setdefault(user_id, -1)
+        self.queues[user_id].append(future)
+        self.queued += 1
+        ADMISSION_QUEUE_DEPTH.set(self.queued)
+        self._dispatch()
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Client gone while waiting, or the slot was granted as it was cancelled
+            if future.done() and not future.cancelled():
+                self._release(user_id)
+            else:
+                self._remove(user_id, future)
+            raise
+        ADMISSION_QUEUE_SECONDS.observe(time.perf_counter() - start)
+
+    def _remove(self, user_id: str, future: asyncio.Future) -> None:
+        queue = self.queues.get(user_id)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.queued -= 1
+            if not queue:
+                del self.queues[user_id]
+                if user_id not in self.running:
+                    del self.last_served[user_id]
+            ADMISSION_QUEUE_DEPTH.set(self.queued)
+
+    # Grant free slots to the waiting requests, one user at a time in round robin order
+    def _dispatch(self) -> None:
+        while self.total_running < self.max_concurrency:
+            users = [user for user in self.queues if self.running.get(user, 0) < self.max_per_user]
+            if not users:
+                return
+            user_id = min(users, key=self.last_served.__getitem__)
+            queue = self.queues[user_id]
+            future = queue.popleft()
+            self.queued -= 1
+            self.grants += 1
+            self.last_served[user_id] = self.grants
+            if not queue:
+                del self.queues[user_id]
+            self.running[user_id] = self.running.get(user_id, 0) + 1
+            self.total_running += 1
+            future.set_result(None)
+            ADMISSION_QUEUE_DEPTH.set(self.queued)
+            ADMISSION_RUNNING.set(self.total_running)
+
+    def _release(self, user_id: str, seconds: Optional[float] = None) -> None:
+        self.running[user_id] -= 1
+        if not self.running[user_id]:
+            del self.running[user_id]
+            if user_id not in self.queues:
+                del self.last_served[user_id]
+        self.total_running -= 1
+        if seconds is not None:
+            self.run_seconds = 0.9 * self.run_seconds + 0.1 * seconds
+        ADMISSION_RUNNING.set(self.total_running)
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {"running": self.total_running, "queued": self.queued, "users_waiting": len(self.queues), "run_seconds": self.run_seconds}
+
+# Slot of one request: `async with ticket:` waits for the slot and frees it at the end of the run
+class Ticket:
+    def __init__(self, controller: AdmissionController, user_id: str):
+        self.controller = controller
+        self.user_id = user_id
+        self.start: Optional[float] = None
+
+    async def __aenter__(self) -> "Ticket":
+        await self.controller._acquire(self.user_id)
+        self.start = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.controller._release(self.user_id, time.perf_counter() - self.start)
+
+# Provider limits, e.g. LLM_RATE_LIMIT_RPM=30 LLM_RATE_LIMIT_TPM=12000 for Groq's free tier; unset means no pacing
+def get_llm_rate_limiter() -> Optional[LLMRateLimiter]:
+    rpm = float(os.getenv("LLM_RATE_LIMIT_RPM", "0")) or None
+    tpm = float(os.getenv("LLM_RATE_LIMIT_TPM", "0")) or None
+    if rpm is None and tpm is None:
+        return None
+    return LLMRateLimiter(rpm, tpm)
+
+def get_admission_controller(rate_limiter: Optional[LLMRateLimiter] = None) -> Optional[AdmissionController]:
+    # ADMISSION_CONTROL=0 runs every request at once
+    if os.getenv("ADMISSION_CONTROL", "1") != "1":
+        return None
+    return AdmissionController(
+        max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16")),
+        max_per_user=int(os.getenv("ADMISSION_MAX_PER_USER", "4")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "256")),
+        max_queue_per_user=int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "16")),
+        max_wait=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "60")) or None,
+        rate_limiter=rate_limiter,
+    )
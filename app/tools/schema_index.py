@@ -0,0 +1,268 @@
+import os
+import re
+import pickle
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+# Words that say nothing about which table a question needs
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "and", "or", "is", "are", "was", "were",
+    "what", "which", "who", "how", "many", "much", "most", "least", "top", "with", "per", "each",
+    "all", "any", "does", "do", "has", "have", "their", "there", "that", "this", "me", "show", "list",
+    "give", "find", "average", "total", "number", "count", "database", "table", "tables", "id",
+}
+
+# Lower case words only, used to find column values quoted in a question ("AC/DC" -> "ac dc")
+def normalize_value(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+def tokenize(text: str) -> List[str]:
+    # Split CamelCase identifiers and plain text the same way, then drop plural "s"
+    words = re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+", text)
+    tokens = []
+    for word in words:
+        word = word.lower()
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+@dataclass
+class TableInfo:
+    name: str
+    ddl: str
+    columns: List[Tuple[str, str]]
+    foreign_keys: List[Tuple[str, str, str]]  # (column, referenced table, referenced column)
+    sample_rows: List[tuple]
+    tokens: Dict[str, float] = field(default_factory=dict)
+    values: Set[str] = field(default_factory=set)  # normalized text values, e.g. artist names
+
+# What lookups read, built together and swapped in as one object: a lookup during a rebuild sees the old index or the new one
+@dataclass
+class _Snapshot:
+    tables: Dict[str, TableInfo]
+    neighbours: Dict[str, set]  # foreign keys as an undirected graph, used to find join paths
+    values: Dict[str, Set[str]]  # text values to the tables holding them, e.g. "ac dc" -> {"Artist"}
+    content_hash: Optional[str] = None
+
+    @classmethod
+    def of(cls, tables: Dict[str, TableInfo], content_hash: Optional[str] = None) -> "_Snapshot":
+        neighbours = {name: set() for name in tables}
+        for name, table in tables.items():
+            for _, ref, _ in table.foreign_keys:
+                if ref in neighbours and ref != name:
+                    neighbours[name].add(ref)
+                    neighbours[ref].add(name)
+        values = {}
+        for name, table in tables.items():
+            for value in table.values:
+                values.setdefault(value, set()).add(name)
+        return cls(tables, neighbours, values, content_hash)
+
+# Schema of a read-only SQLite database, built once and reused for every question.
+# The index is rebuilt only when the database file changes (mtime/size first, then content hash).
+# With artifact_path, the built index is saved there and loaded instead of rebuilt while the database is unchanged.
+class SchemaIndex:
+    def __init__(
+        self,
+        path: str,
+        sample_rows: int = 3,
+        aliases: Optional[Dict[str, List[str]]] = None,
+        max_values_per_column: int = 5000,
+        max_value_words: int = 6,
+        artifact_path: Optional[str] = None,
+    ):
+        self.path = path
+        self.artifact_path = artifact_path
+        self.sample_rows = sample_rows
+        self.aliases = aliases or {}
+        self.max_values_per_column = max_values_per_column
+        self.max_value_words = max_value_words
+        self.snapshot = _Snapshot.of({})
+        self.stat_signature = None
+        self.lock = threading.Lock()
+        self.refresh()
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _hash(self) -> str:
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # Rebuild when the file changed, return True if a rebuild happened
+    def refresh(self) -> bool:
+        signature = self._stat()
+        if signature == self.stat_signature:
+            return False
+        with self.lock:
+            if signature == self.stat_signature:
+                return False
+            content_hash = self._hash()
+            rebuilt = content_hash != self.snapshot.content_hash
+            if rebuilt:
+                tables = self._load_artifact(content_hash)
+                if tables is None:
+                    tables = self._build()
+                    self._save_artifact(content_hash, tables)
+                self.snapshot = _Snapshot.of(tables, content_hash)
+            # Set last: after a failed rebuild the next lookup tries again
+            self.stat_signature = signature
+            return rebuilt
+
+    # The artifact is only valid for the same database content and build settings
+    def _artifact_key(self, content_hash: str) -> tuple:
+        aliases = tuple(sorted((name, tuple(words)) for name, words in self.aliases.items()))
+        return content_hash, self.sample_rows, aliases, self.max_values_per_column, self.max_value_words
+
+    def _load_artifact(self, content_hash: str) -> Optional[Dict[str, TableInfo]]:
+        if not self.artifact_path or not os.path.exists(self.artifact_path):
+            return None
+        try:
+            with open(self.artifact_path, "rb") as f:
+                key, tables = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            return None
+        return tables if key == self._artifact_key(content_hash) else None
+
+    def _save_artifact(self, content_hash: str, tables: Dict[str, TableInfo]) -> None:
+        if not self.artifact_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.artifact_path)), exist_ok=True)
+            # Write then rename, so concurrent workers never read a partial file
+            tmp_path = f"{self.artifact_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((self._artifact_key(content_hash), tables), f)
+            os.replace(tmp_path, self.artifact_path)
+        except OSError:
+            pass  # Read-only image: keep the index in memory only
+
+    def _build(self) -> Dict[str, TableInfo]:
+        tables = {}
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            ).fetchall()
+            for name, ddl in rows:
+                columns = [(col[1], col[2]) for col in conn.execute(f'PRAGMA table_info("{name}")')]
+                foreign_keys = [(fk[3], fk[2], fk[4]) for fk in conn.execute(f'PRAGMA foreign_key_list("{name}")')]
+                sample_rows = conn.execute(f'SELECT * FROM "{name}" LIMIT {self.sample_rows}').fetchall()
+                table = TableInfo(name, ddl, columns, foreign_keys, sample_rows)
+                # Table name and aliases weigh more than column names.
+                # Compound names share the weight, so "track" favours Track over PlaylistTrack.
+                name_tokens = tokenize(name)
+                for token in name_tokens:
+                    table.tokens[token] = 3.0 / len(name_tokens)
+                for alias in self.aliases.get(name, []):
+                    for token in tokenize(alias):
+                        table.tokens[token] = 3.0
+                for column, _ in columns:
+                    for token in tokenize(column):
+                        table.tokens.setdefault(token, 1.0)
+                # Names of things users ask about (artists, genres, playlists, ...), which never appear in the schema.
+                # Values made of stopwords only or longer than a phrase are never quoted in questions.
+                for column, type_ in columns:
+                    if not re.search(r"CHAR|TEXT|CLOB", type_.upper()):
+                        continue
+                    for (value,) in conn.execute(f'SELECT DISTINCT "{column}" FROM "{name}" LIMIT {self.max_values_per_column}'):
+                        normalized = normalize_value(str(value or ""))
+                        if len(normalized) >= 3 and tokenize(str(value)) and len(normalized.split()) <= self.max_value_words:
+                            table.values.add(normalized)
+                tables[name] = table
+        finally:
+            conn.close()
+        return tables
+
+    # Pick the tables a question is about by lexical overlap, plus the tables joining them
+    def select_tables(self, question: str, k: int = 4, weak_score: float = 3.0) -> List[str]:
+        self.refresh()
+        snapshot = self.snapshot
+        tables = snapshot.tables
+        question_tokens = set(tokenize(question))
+        scores = {
+            name: sum(weight for token, weight in table.tokens.items() if token in question_tokens)
+            for name, table in tables.items()
+        }
+        best = max(scores.values(), default=0)
+        # Values quoted in the question ("tracks by AC/DC") bring in the tables holding them
+        value_tables = self._value_tables(snapshot, question)
+        if best == 0 and not value_tables:
+            return list(tables)
+        # Keep the strongest matches only, weak column-name hits are usually just foreign keys
+        selected = [name for name, score in sorted(scores.items(), key=lambda item: -item[1]) if score > best / 2][:k] if best else []
+        for name in value_tables:
+            if name not in selected:
+                selected.append(name)
+
+        # No table name or alias matched, only columns: include the directly related tables too
+        if best < weak_score:
+            for name in list(selected):
+                for neighbour in sorted(snapshot.neighbours[name]):
+                    if neighbour not in selected:
+                        selected.append(neighbour)
+
+        # Add the tables on the shortest foreign key path between selected tables, e.g. PlaylistTrack
+        for source in list(selected):
+            for target in list(selected):
+                if source < target:
+                    for name in self._join_path(snapshot, source, target):
+                        if name not in selected:
+                            selected.append(name)
+        return selected
+
+    # Tables holding a value that appears word for word in the question
+    def _value_tables(self, snapshot: _Snapshot, question: str) -> List[str]:
+        values = snapshot.values
+        words = normalize_value(question).split()
+        found = set()
+        for start in range(len(words)):
+            for end in range(start + 1, min(start + self.max_value_words, len(words)) + 1):
+                found.update(values.get(" ".join(words[start:end]), ()))
+        return sorted(found)
+
+    # Intermediate tables joining two tables through foreign keys (breadth-first search)
+    def _join_path(self, snapshot: _Snapshot, source: str, target: str, max_hops: int = 3) -> List[str]:
+        neighbours = snapshot.neighbours
+        previous = {source: None}
+        frontier = [source]
+        for _ in range(max_hops):
+            next_frontier = []
+            for name in frontier:
+                for neighbour in sorted(neighbours[name]):
+                    if neighbour not in previous:
+                        previous[neighbour] = name
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+            if target in previous:
+                break
+        if target not in previous:
+            return []
+        path = []
+        name = previous[target]
+        while name != source:
+            path.append(name)
+            name = previous[name]
+        return path
+
+    # Same layout as SQLDatabase.get_table_info: DDL followed by sample rows
+    def get_table_info(self, table_names: List[str]) -> str:
+        tables = self.snapshot.tables
+        infos = []
+        # Tables selected just before a rebuild that dropped them are left out
+        for name in (name for name in table_names if name in tables):
+            table = tables[name]
+            header = "\t".join(column for column, _ in table.columns)
+            rows = "\n".join("\t".join(str(value)[:100] for value in row) for row in table.sample_rows)
+            infos.append(f"\n{table.ddl.strip()}\n\n/*\n{len(table.sample_rows)} rows from {name} table:\n{header}\n{rows}\n*/")
+        return "\n\n".join(infos)
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.tools.base import BaseTool
+
+logger = logging.getLogger(__name__)
+
+# Lowercase, collapse whitespace and drop trailing punctuation, so "What is  RAG?" and "what is rag" share an entry
+def normalize_search_query(query: str) -> str:
+    return " ".join(query.lower().split()).rstrip("?!.").strip()
+
+# Tavily reports failures as {"error": ...}, they are returned to the agent but never cached
+def is_search_result(result: Any) -> bool:
+    return not (isinstance(result, dict) and "error" in result)
+
+@dataclass
+class _Entry:
+    value: Any
+    fetched: float
+    # Seconds the search took, saved by every hit on this entry
+    latency: float
+
+# Cache of web search results in front of the search API.
+# - fresh for ttl seconds; for stale seconds after that an entry is still served, and refreshed in the background
+# - LRU of max_entries in memory, and optionally a SQLite file read on memory misses (kept across restarts)
+# - concurrent identical searches share one API call, from threads and coroutines alike
+class SearchCache:
+    def __init__(
+        self,
+        ttl: float = 900,
+        stale: float = 3600,
+        max_entries: int = 1024,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self.path = path
+        self.clock = clock
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.in_flight: Dict[str, Future] = {}
+        self.refresh_tasks: Set[asyncio.Task] = set()
+        self.lock = threading.Lock()
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.conn.executescript(
+                """
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    fetched REAL NOT NULL,
+                    latency REAL NOT NULL
+                );
+                """
+            )
+            self.conn.execute("DELETE FROM search_cache WHERE fetched < ?", (self.clock() - ttl - stale,))
+        self.hits = 0
+        self.stale_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self.search_seconds = 0.0
+
+    def _get(self, key: str) -> Optional[_Entry]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+        if self.conn is None:
+            return None
+        row = self.conn.execute("SELECT value, fetched, latency FROM search_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.disk_hits += 1
+        entry = _Entry(json.loads(row[0]), row[1], row[2])
+        self._put(key, entry, persist=False)
+        return entry
+
+    def _put(self, key: str, entry: _Entry, persist: bool = True) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        if persist and self.conn is not None:
+            try:
+                value = json.dumps(entry.value)
+            except TypeError:
+                return
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, fetched, latency) VALUES (?, ?, ?, ?)",
+                (key, value, entry.fetched, entry.latency),
+            )
+
+    def _delete(self, key: str) -> None:
+        self.entries.pop(key, None)
+        if self.conn is not None:
+            self.conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+
+    # Decide under the lock how a search is served: (cached value or None, future of the search, whether to run it).
+    # A stale entry is returned together with a refresh to run in the background, unless one is already running.
+    def _begin(self, key: str) -> Tuple[Optional[_Entry], Optional[Future], bool]:
+        with self.lock:
+            entry = self._get(key)
+            age = self.clock() - entry.fetched if entry is not None else None
+            if entry is not None and age > self.ttl + self.stale:
+                self._delete(key)
+                entry = None
+            if entry is not None:
+                self.saved_seconds += entry.latency
+                if age <= self.ttl:
+                    self.hits += 1
+                    return entry, None, False
+                self.stale_hits += 1
+                if key in self.in_flight:
+                    return entry, None, False
+                self.refreshes += 1
+                future = self.in_flight[key] = Future()
+                return entry, future, True
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            self.misses += 1
+            future = self.in_flight[key] = Future()
+            return None, future, True
+
+    def _finish(self, key: str, future: Future, value: Any, latency: float, should_cache: Callable[[Any], bool]) -> None:
+        # Stored before leaving in_flight, so no caller can slip in and search again
+        with self.lock:
+            self.search_seconds += latency
+            if should_cache(value):
+                self._put(key, _Entry(value, self.clock(), latency))
+            self.in_flight.pop(key, None)
+        future.set_result(value)
+
+    def _fail(self, key: str, future: Future, error: BaseException) -> None:
+        with self.lock:
+            self.in_flight.pop(key, None)
+        future.set_exception(error)
+
+    def _search(self, key: str, future: Future, search: Callable[[], Any], should_cache: Callable[[Any], bool]) -> Any:
+        start = time.perf_counter()
+        try:
+            value = search()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._finish(key, future, value, time.perf_counter() - start, should_cache)
+        return value
+
+    async def _asearch(self, key: str, future: Future, asearch: Callable[[], Awaitable[Any]], should_cache: Callable[[Any], bool]) -> Any:
+        start = time.perf_counter()
+        try:
+            value = await asearch()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._finish(key, future, value, time.perf_counter() - start, should_cache)
+        return value
+
+    def _refresh(self, key: str, future: Future, search: Callable[[], Any], should_cache: Callable[[Any], bool]) -> None:
+        try:
+            self._search(key, future, search, should_cache)
+        except Exception:
+            self.refresh_errors += 1
+            logger.warning("Background refresh of search %r failed", key, exc_info=True)
+
+    async def _arefresh(self, key: str, future: Future, asearch: Callable[[], Awaitable[Any]], should_cache: Callable[[Any], bool]) -> None:
+        try:
+            await self._asearch(key, future, asearch, should_cache)
+        except Exception:
+            self.refresh_errors += 1
+            logger.warning("Background refresh of search %r failed", key, exc_info=True)
+
+    # Cached result of the search, or run search once for all concurrent callers
+    def get_or_search(self, key: str, search: Callable[[], Any], should_cache: Callable[[Any], bool] = is_search_result) -> Any:
+        entry, future, owner = self._begin(key)
+        if entry is not None:
+            if owner:
+                threading.Thread(target=self._refresh, args=(key, future, search, should_cache), name="search-refresh", daemon=True).start()
+            return entry.value
+        if not owner:
+            return future.result()
+        return self._search(key, future, search, should_cache)
+
+    async def aget_or_search(self, key: str, asearch: Callable[[], Awaitable[Any]], should_cache: Callable[[Any], bool] = is_search_result) -> Any:
+        entry, future, owner = self._begin(key)
+        if entry is not None:
+            if owner:
+                task = asyncio.create_task(self._arefresh(key, future, asearch, should_cache))
+                self.refresh_tasks.add(task)
+                task.add_done_callback(self.refresh_tasks.discard)
+            return entry.value
+        if not owner:
+            # Shielded: a caller giving up (its deadline passed, its client left) must not cancel the search the others wait for
+            try:
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                # The caller running the search was cancelled rather than this one: search again
+                if asyncio.current_task().cancelling() or not future.done():
+                    raise
+                return await self.aget_or_search(key, asearch, should_cache)
+        return await self._asearch(key, future, asearch, should_cache)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM search_cache")
+
+    def stats(self) -> dict:
+        with self.lock:
+            served = self.hits + self.stale_hits + self.coalesced
+            lookups = served + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "hit_rate": served / lookups if lookups else 0.0,
+                # Latency of the cached searches, not paid again by the hits
+                "saved_seconds": self.saved_seconds,
+                "search_seconds": self.search_seconds,
+            }
+
+# Web search tool with a SearchCache in front: same name, description and arguments as the wrapped tool,
+# so the research agent's prompt and tool calls do not change. Arguments other than the query are part of the key.
+class CachedSearchTool(BaseTool):
+    tool: BaseTool
+    cache: SearchCache
+
+    @classmethod
+    def wrap(cls, tool: BaseTool, cache: SearchCache) -> "CachedSearchTool":
+        return cls(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.get_input_schema(),
+            handle_tool_error=tool.handle_tool_error,
+            tool=tool,
+            cache=cache,
+        )
+
+    @staticmethod
+    def _key(args: dict) -> str:
+        options = {name: value for name, value in args.items() if name != "query"}
+        return normalize_search_query(args["query"]) + (json.dumps(options, sort_keys=True, default=str) if options else "")
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None, **kwargs: Any) -> Any:
+        args = {"query": query, **{name: value for name, value in kwargs.items() if value is not None}}
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        return self.cache.get_or_search(self._key(args), lambda: self.tool.invoke(args, config))
+
+    async def _arun(self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None, **kwargs: Any) -> Any:
+        args = {"query": query, **{name: value for name, value in kwargs.items() if value is not None}}
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        return await self.cache.aget_or_search(self._key(args), lambda: self.tool.ainvoke(args, config))
+
+def get_search_tool(web_search: BaseTool) -> BaseTool:
+    # SEARCH_CACHE=0 calls the search API every time
+    if os.getenv("SEARCH_CACHE", "1") != "1":
+        return web_search
+    cache = SearchCache(
+        ttl=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "900")),
+        stale=float(os.getenv("SEARCH_CACHE_STALE_SECONDS", "3600")),
+        max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024")),
+        path=os.getenv("SEARCH_CACHE_DB") or None,
+    )
+    return CachedSearchTool.wrap(web_search, cache)
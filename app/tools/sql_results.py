@@ -0,0 +1,149 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from tools.query_cache import normalize_sql
+
+# SQLite storage classes of Python values, the column types shown to the LLM
+def value_type(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool) or isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "BLOB"
+    return "TEXT"
+
+# One cell of a TSV line: NULL spelled out, floats rounded, tabs and newlines escaped, long text cut
+def format_cell(value: Any, max_chars: int = 100) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, float):
+        text = repr(round(value, 4))
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        text = f"<{len(value)} bytes>"
+    else:
+        text = str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+# Compact rendering of a page of rows: a "name:TYPE" header line, one tab separated line per row and a footer
+# saying how many rows were shown and, if there are more, the cursor to page through them
+def render_page(columns: Sequence[str], types: Sequence[Optional[str]], lines: List[str], offset: int, more: bool, budget: str, cursor: Optional[str]) -> str:
+    if not columns:
+        return "-- The statement returned no result set"
+    header = "\t".join(f"{column}:{kind or 'NULL'}" for column, kind in zip(columns, types))
+    first, last = offset + 1, offset + len(lines)
+    if not more:
+        footer = f"-- {last} rows" if offset == 0 else f"-- rows {first}-{last}, end of result"
+    else:
+        shown = f"first {len(lines)} rows" if offset == 0 else f"rows {first}-{last}"
+        footer = f"-- {shown} shown, more rows follow ({budget} budget). sql_db_next_page with cursor \"{cursor}\" returns the next ones, or narrow the query."
+    return "\n".join([header, *lines, footer])
+
+# Runs queries for the SQL agent and renders their results compactly, within a hard budget of rows and bytes per page.
+# Rows are read from the cursor one at a time and reading stops at the budget, so large results are never materialized.
+# A truncated page ends with a cursor: a short handle of (query, next row) that sql_db_next_page resolves,
+# re-running the query and skipping the rows already shown (handles are deterministic, pages are cacheable).
+class SQLResultFormatter:
+    def __init__(self, engine: Engine, max_rows: int = 20, max_bytes: int = 2048, max_cell_chars: int = 100, max_cursors: int = 4096):
+        self.engine = engine
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_cell_chars = max_cell_chars
+        self.max_cursors = max_cursors
+        self.cursors: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.truncated = 0
+        self.rows = 0
+        self.bytes = 0
+
+    @staticmethod
+    def cursor_handle(query: str, offset: int) -> str:
+        return "c" + hashlib.sha1(f"{offset}\0{normalize_sql(query)}".encode()).hexdigest()[:10]
+
+    def _register(self, query: str, offset: int) -> str:
+        handle = self.cursor_handle(query, offset)
+        with self.lock:
+            self.cursors[handle] = (query, offset)
+            self.cursors.move_to_end(handle)
+            while len(self.cursors) > self.max_cursors:
+                self.cursors.popitem(last=False)
+        return handle
+
+    def resolve(self, handle: str) -> Optional[Tuple[str, int]]:
+        with self.lock:
+            return self.cursors.get(handle.strip().strip('"'))
+
+    # The page of rows of query starting at row offset, rendered; errors are returned as "Error: ..." like SQLDatabase.run_no_throw
+    def run(self, query: str, offset: int = 0) -> str:
+        try:
+            with self.engine.connect() as connection:
+                result = connection.exec_driver_sql(query)
+                if not result.returns_rows:
+                    return render_page([], [], [], offset, False, "", None)
+                columns = list(result.keys())
+                types: List[Optional[str]] = [None] * len(columns)
+                lines: List[str] = []
+                size = 0
+                more = False
+                budget = "row"
+                rows = iter(result)
+                for _ in range(offset):
+                    if next(rows, None) is None:
+                        break
+                for row in rows:
+                    if len(lines) == self.max_rows:
+                        more = True
+                        break
+                    line = "\t".join(format_cell(value, self.max_cell_chars) for value in row)
+                    # At least one row per page, whatever its size
+                    if lines and size + len(line) + 1 > self.max_bytes:
+                        more, budget = True, "byte"
+                        break
+                    lines.append(line)
+                    size += len(line) + 1
+                    for i, value in enumerate(row):
+                        if types[i] is None:
+                            types[i] = value_type(value)
+                result.close()
+        except SQLAlchemyError as e:
+            return f"Error: {e}"
+        cursor = self._register(query, offset + len(lines)) if more else None
+        with self.lock:
+            self.pages += 1
+            self.truncated += more
+            self.rows += len(lines)
+            self.bytes += size
+        return render_page(columns, types, lines, offset, more, budget, cursor)
+
+    def next_page(self, handle: str) -> str:
+        cursor = self.resolve(handle)
+        if cursor is None:
+            return f"Error: unknown or expired cursor {handle!r}, run the query again with sql_db_query."
+        return self.run(*cursor)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "pages": self.pages,
+                "truncated_pages": self.truncated,
+                "rows": self.rows,
+                "bytes": self.bytes,
+                "cursors": len(self.cursors),
+            }
+
+def get_result_formatter(engine: Engine) -> Optional[SQLResultFormatter]:
+    # SQL_RESULT_FORMAT=repr returns whole results as the Python repr of their rows, as SQLDatabase.run does
+    if os.getenv("SQL_RESULT_FORMAT", "compact") != "compact":
+        return None
+    return SQLResultFormatter(
+        engine,
+        max_rows=int(os.getenv("SQL_RESULT_MAX_ROWS", "20")),
+        max_bytes=int(os.getenv("SQL_RESULT_MAX_BYTES", "2048")),
+    )
@@ -0,0 +1,171 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Set, Tuple
+
+# Statements the SQL agent must never run
+FORBIDDEN_KEYWORDS = (
+    "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", "REPLACE", "TRUNCATE",
+    "ATTACH", "DETACH", "PRAGMA", "VACUUM", "REINDEX", "GRANT", "REVOKE",
+)
+
+# Blank out string literals and comments, so keyword rules only look at SQL code
+def strip_literals(query: str) -> str:
+    query = re.sub(r"--[^\n]*|/\*.*?\*/", " ", query, flags=re.S)
+    return re.sub(r"'(?:[^']|'')*'", "''", query)
+
+# An identifier, bare or double-quoted
+IDENTIFIER = r'(?:"(?:[^"]|"")*"|\w+)'
+
+def _unquote(identifier: str) -> str:
+    return identifier[1:-1].replace('""', '"') if identifier.startswith('"') else identifier
+
+# Names the query defines itself: column and table aliases, CTE names and their column lists
+def defined_names(code: str) -> Set[str]:
+    names = re.findall(rf"\bAS\s+({IDENTIFIER})", code, flags=re.I)
+    # Table aliases without AS: FROM Track "t", JOIN Album a
+    names += re.findall(rf"\b(?:FROM|JOIN)\s+{IDENTIFIER}\s+(?!(?:ON|USING|WHERE|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|GROUP|ORDER|LIMIT|HAVING|UNION|WINDOW)\b)({IDENTIFIER})", code, flags=re.I)
+    for columns in re.findall(rf"{IDENTIFIER}\s*\(([^()]*)\)\s*AS\s*\(", code, flags=re.I):
+        names += re.findall(IDENTIFIER, columns)
+    # CTE names: WITH [RECURSIVE] name [(columns)] AS (, name [(columns)] AS (
+    names += re.findall(rf"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*({IDENTIFIER})\s*(?:\([^()]*\)\s*)?AS\s*\(", code, flags=re.I)
+    return {_unquote(name).lower() for name in names}
+
+# Local checks for a generated SQLite query, run before asking the LLM to double check it.
+# validate() returns the list of issues; an empty list means check_query can be skipped.
+# Results are memoized per query, so check_query reuses the issues should_continue found,
+# and everything is reloaded when the database file changes (mtime/size).
+class SQLValidator:
+    def __init__(self, path: str, max_results: int = 1024):
+        self.path = path
+        self.max_results = max_results
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.passed = 0
+        self.flagged = 0
+        self.results: "OrderedDict[str, List[str]]" = OrderedDict()
+        self.signature = None
+        self.generation = 0
+        self._check_file()
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _check_file(self) -> None:
+        signature = self._stat()
+        if signature == self.signature:
+            return
+        with self.lock:
+            if signature == self.signature:
+                return
+            # immutable=1 connections never see changes, every thread reconnects to the new file
+            self.generation += 1
+            conn = self._connection()
+            self.names = self._schema_names(conn)
+            self.join_pairs = self._join_pairs(conn)
+            self.results.clear()
+            self.signature = signature
+
+    # One read-only connection per thread, sqlite3 connections are not shared across threads
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.generation != self.generation:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True)
+            self.local.conn = conn
+            self.local.generation = self.generation
+        return conn
+
+    def _schema_names(self, conn: sqlite3.Connection) -> Set[str]:
+        names = set()
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"):
+            names.add(table.lower())
+            names.update(col[1].lower() for col in conn.execute(f'PRAGMA table_info("{table}")'))
+        return names
+
+    # Column pairs that are valid join keys: same name or a declared foreign key
+    def _join_pairs(self, conn: sqlite3.Connection) -> Set[Tuple[str, str]]:
+        pairs = set()
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"):
+            for fk in conn.execute(f'PRAGMA foreign_key_list("{table}")'):
+                column, ref_column = fk[3].lower(), fk[4].lower()
+                pairs.add((column, ref_column))
+                pairs.add((ref_column, column))
+        return pairs
+
+    def validate(self, query: str) -> List[str]:
+        self._check_file()
+        with self.lock:
+            if query in self.results:
+                self.results.move_to_end(query)
+                return list(self.results[query])
+        issues = self._validate(query)
+        with self.lock:
+            self.results[query] = issues
+            while len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+        return list(issues)
+
+    def _validate(self, query: str) -> List[str]:
+        issues = []
+        code = strip_literals(query).strip().rstrip(";").strip()
+        upper = code.upper()
+
+        # Read-only, single statement
+        if ";" in code:
+            issues.append("Only a single SQL statement is allowed.")
+        if not re.match(r"^(SELECT|WITH)\b", upper):
+            issues.append("Only SELECT queries are allowed.")
+        for keyword in FORBIDDEN_KEYWORDS:
+            # REPLACE(...) is also a string function
+            if re.search(rf"\b{keyword}\b(?!\s*\()", upper):
+                issues.append(f"DML/DDL statement {keyword} is not allowed.")
+        if issues:
+            return issues
+
+        # Tables, columns, functions and syntax, checked by SQLite against the real schema
+        try:
+            self._connection().execute(f"EXPLAIN QUERY PLAN {query.strip().rstrip(';')}").fetchall()
+        except sqlite3.Error as e:
+            issues.append(f"SQLite rejected the query: {e}")
+
+        # Lint rules from the check_query prompt
+        if re.search(r"\bNOT\s+IN\s*\(\s*SELECT\b", upper):
+            issues.append("NOT IN with a subquery returns no rows if the subquery yields NULL; consider NOT EXISTS.")
+        if re.search(r"\bUNION\b(?!\s+ALL\b)", upper):
+            issues.append("UNION removes duplicates; check whether UNION ALL was intended.")
+        if re.search(r"\bBETWEEN\b", upper):
+            issues.append("BETWEEN is inclusive on both ends; check the range bounds.")
+        # A double-quoted name that is neither in the schema nor defined by the query is taken by SQLite for a string
+        defined = defined_names(code)
+        for quoted in re.findall(r'"((?:[^"]|"")*)"', code):
+            if quoted.replace('""', '"').lower() not in self.names | defined:
+                issues.append(f'"{quoted}" is not an identifier; use single quotes for string literals.')
+        for left, right in re.findall(r"\bON\s+(?:\w+\.)?(\w+)\s*=\s*(?:\w+\.)?(\w+)", code, flags=re.I):
+            left, right = left.lower(), right.lower()
+            if left != right and (left, right) not in self.join_pairs:
+                issues.append(f"Join on {left} = {right} does not follow a foreign key; check the join columns.")
+        return issues
+
+    # True when every query passes, i.e. the LLM check_query call can be skipped
+    def can_skip_llm_check(self, queries: List[str]) -> bool:
+        passed = all(not self.validate(query) for query in queries)
+        with self.lock:
+            if passed:
+                self.passed += 1
+            else:
+                self.flagged += 1
+        return passed
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.passed + self.flagged
+            return {
+                "llm_checks_skipped": self.passed,
+                "llm_checks_run": self.flagged,
+                "skip_rate": self.passed / total if total else 0.0,
+            }
@@ -0,0 +1,73 @@
+# Chat history benchmark: latency that recording a turn (question and answer) adds to a request, with synchronous writes
+# (CHAT_HISTORY_WRITE_BEHIND=0, one transaction on the request path) and with write-behind writes (queued, batched),
+# at increasing concurrency. --store-latency adds a round trip per transaction, as a remote Postgres has.
+# Usage: python benchmarks/chat_history.py [--concurrency 1 16 64] [--requests 512] [--store-latency 0.002]
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage
+from tools.chat_history import ChatHistory, SqliteChatHistoryStore
+
+ANSWER = "Sci Fi & Fantasy has the longest tracks on average, followed by Science Fiction and Drama. " * 3
+
+# SQLite store with a fixed delay per transaction, standing in for the network round trip to a database server
+class RemoteStore(SqliteChatHistoryStore):
+    def __init__(self, path: str, latency: float):
+        super().__init__(path)
+        self.latency = latency
+
+    def write(self, records):
+        time.sleep(self.latency)
+        super().write(records)
+
+async def run_level(history: ChatHistory, concurrency: int, requests: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await history.aappend(f"thread-{i % 100}", "bench", [HumanMessage(f"Question {i}"), AIMessage(ANSWER)])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    # Until everything is on disk
+    history.flush()
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "requests_per_s": requests / elapsed,
+        "durable_s": time.perf_counter() - start,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history, synchronous against write-behind writes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--store-latency", type=float, default=0.002, help="Seconds per write transaction")
+    args = parser.parse_args()
+
+    print(f"{'mode':<12} {'concurrency':>11} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>9} {'durable s':>10} {'batches':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for write_behind in (False, True):
+            mode = "write-behind" if write_behind else "sync"
+            for concurrency in args.concurrency:
+                history = ChatHistory(RemoteStore(os.path.join(workdir, f"{mode}-{concurrency}.sqlite"), args.store_latency), write_behind=write_behind)
+                level = asyncio.run(run_level(history, concurrency, args.requests))
+                batches = history.stats()["batches"]
+                history.close()
+                print(f"{mode:<12} {concurrency:>11} {level['p50_ms']:>8.3f} {level['p99_ms']:>8.3f} {level['requests_per_s']:>9.0f} {level['durable_s']:>10.3f} {batches:>8}")
+
+if __name__ == "__main__":
+    main()
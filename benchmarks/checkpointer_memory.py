@@ -0,0 +1,79 @@
+# Compare process memory of MemorySaver and BoundedSqliteSaver over many synthetic threads.
+# Usage: python benchmarks/checkpointer_memory.py [--threads 10000] [--turns 3]
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+def rss_mb() -> float:
+    # Resident set size of this process, Linux only
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def run_backend(backend: str, threads: int, turns: int) -> dict:
+    from langchain_core.messages import AIMessage
+    from langgraph.graph import StateGraph, START, MessagesState
+    from langgraph.checkpoint.memory import MemorySaver
+    from tools.checkpointer import BoundedSqliteSaver
+
+    # One node graph with a chat-sized reply, enough to exercise checkpoint storage
+    def reply(state: MessagesState):
+        return {"messages": [AIMessage("synthetic answer " * 40)]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node(reply)
+    builder.add_edge(START, "reply")
+
+    if backend == "memory":
+        checkpointer = MemorySaver()
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite")
+        checkpointer = BoundedSqliteSaver(path, max_checkpoints_per_thread=2, compaction_interval=None)
+    graph = builder.compile(checkpointer=checkpointer)
+
+    baseline = rss_mb()
+    start = time.perf_counter()
+    for i in range(threads):
+        config = {"configurable": {"thread_id": f"thread-{i}"}}
+        for turn in range(turns):
+            graph.invoke({"messages": [{"role": "user", "content": f"question {turn} " * 20}]}, config)
+        if backend == "sqlite" and i % 1000 == 999:
+            checkpointer.compact()
+    elapsed = time.perf_counter() - start
+    result = {
+        "backend": backend,
+        "threads": threads,
+        "turns": turns,
+        "rss_growth_mb": round(rss_mb() - baseline, 1),
+        "seconds": round(elapsed, 2),
+    }
+    if backend == "sqlite":
+        checkpointer.close()
+        result["db_size_mb"] = round(os.path.getsize(path) / 2**20, 1)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checkpointer memory benchmark")
+    parser.add_argument("--threads", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--backend", choices=["memory", "sqlite"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, args.threads, args.turns)))
+    else:
+        # Each backend runs in a fresh process so RSS numbers do not interfere
+        for backend in ("memory", "sqlite"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--backend", backend, "--threads", str(args.threads), "--turns", str(args.turns)],
+                capture_output=True, text=True, check=True,
+            )
+            print(out.stdout.strip().splitlines()[-1])
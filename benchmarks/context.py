@@ -0,0 +1,85 @@
+# Context management benchmark: prompt tokens per turn over a scripted conversation on one thread, with and
+# without CONTEXT_MANAGEMENT. Every turn goes through the SQL agent, whose schema and query results used to pile
+# up in the supervisor's history. Tokens are counted by the stand-in model (one per word of its input).
+# Usage: python benchmarks/context.py [--turns 50] [--budget 1500] [--output context.json]
+import os
+import sys
+import json
+import argparse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+from stand_ins import FakeChatModel
+
+QUESTIONS = [
+    "Which genre on average has the longest tracks?",
+    "And which one has the shortest?",
+    "How many tracks does the Rock genre have?",
+    "Who are the top 5 artists by number of albums?",
+    "Which customers spent the most?",
+]
+
+@tool
+def retrieve_blog_posts(query: str) -> str:
+    """Search and return information about Lilian Weng blog posts."""
+    return "No blog posts found."
+
+def run(turns: int, budget: int, context_management: bool) -> list:
+    os.chdir(APP_DIR)  # Chinook.db is opened relative to the app directory
+    from agents.context import ContextManager
+    from graph import build_graph
+    from tools.chinook_db import get_schema_index, get_sql_db_tool
+    from tools.metrics import MetricsCallbackHandler
+
+    llm = FakeChatModel(latency=0)
+    db_tools, db = get_sql_db_tool(llm)
+    supervisor_context = ContextManager(budget, llm=llm, keep_turns=4, summary_trigger=budget // 3) if context_management else None
+    sql_context = ContextManager(budget) if context_management else None
+    agent = build_graph(
+        llm, retrieve_blog_posts, create_react_agent(model=llm, tools=[retrieve_blog_posts], name="research_agent"), db_tools, db,
+        checkpointer=MemorySaver(),
+        schema_index=get_schema_index(),
+        supervisor_context=supervisor_context,
+        sql_context=sql_context,
+    )
+
+    per_turn = []
+    for turn in range(turns):
+        handler = MetricsCallbackHandler("benchmark")
+        config = {"configurable": {"thread_id": "benchmark"}, "callbacks": [handler]}
+        agent.invoke({"messages": [{"role": "user", "content": QUESTIONS[turn % len(QUESTIONS)]}]}, config)
+        llm_spans = [span for span in handler.trace()["spans"] if span["kind"] == "llm"]
+        per_turn.append({
+            "turn": turn + 1,
+            "prompt_tokens": sum(span.get("prompt_tokens", 0) for span in llm_spans),
+            "supervisor_prompt_tokens": sum(span.get("prompt_tokens", 0) for span in llm_spans if span["name"].startswith("supervisor")),
+        })
+        if supervisor_context is not None:
+            # Summaries are computed between turns, as they would be while the user reads the answer
+            supervisor_context.flush()
+    return per_turn
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt tokens per turn with and without context management")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=1500, help="Token budget of the supervisor and the SQL agent")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = {mode: run(args.turns, args.budget, mode == "managed") for mode in ("full_history", "managed")}
+    report = {"config": {"turns": args.turns, "budget": args.budget}, "turns": results}
+    for mode, per_turn in results.items():
+        tokens = [turn["supervisor_prompt_tokens"] for turn in per_turn]
+        checkpoints = [tokens[i - 1] for i in (1, 10, 25, args.turns) if i <= len(tokens)]
+        print(f"{mode:>12}: supervisor prompt tokens at turns 1/10/25/{args.turns}: {checkpoints}, total prompt tokens {sum(turn['prompt_tokens'] for turn in per_turn)}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Request deadline benchmark: latency distribution of questions handed to the research and SQL agents in parallel,
+# when a fraction of the web searches hang (--slow-fraction of them take --slow-latency seconds), without a deadline
+# and with a --timeout second deadline. With the deadline the research agent is stopped, and the supervisor answers
+# from the SQL agent's result. Questions run concurrently, each on its own thread.
+# Usage: python benchmarks/deadlines.py [--questions 40] [--timeout 2] [--slow-fraction 0.1] [--slow-latency 10]
+import os
+import sys
+import time
+import zlib
+import asyncio
+import argparse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+import numpy as np
+from langgraph.checkpoint.memory import MemorySaver
+from stand_ins import FakeChatModel, FakeWebSearch, HashEmbeddings, fake_vectorstore
+
+# Web search whose latency depends on the query: a fixed share of queries hangs
+class FlakyWebSearch(FakeWebSearch):
+    slow_fraction: float = 0.1
+    slow_latency: float = 10.0
+
+    async def _arun(self, query: str) -> str:
+        slow = zlib.crc32(query.encode()) % 1000 < self.slow_fraction * 1000
+        await asyncio.sleep(self.slow_latency if slow else self.latency)
+        return self._results(query)
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency with and without a request deadline")
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--timeout", type=float, default=2.0, help="Request deadline in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Seconds per fake LLM call")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="Seconds per web search")
+    parser.add_argument("--slow-fraction", type=float, default=0.1, help="Share of web searches that hang")
+    parser.add_argument("--slow-latency", type=float, default=10.0, help="Seconds a hanging web search takes")
+    args = parser.parse_args()
+
+    os.chdir(APP_DIR)  # Chinook.db is opened relative to the app directory
+    from agents.deadline import Deadlines, deadline_config
+    from agents.research import create_research_agent
+    from agents.retriever import get_retriever_tool
+    from graph import build_graph
+    from tools.chinook_db import get_schema_index, get_sql_db_tool
+
+    llm = FakeChatModel(latency=args.llm_latency, handoffs=["research_agent", "sql_agent"])
+    retriever_tool = get_retriever_tool(fake_vectorstore(HashEmbeddings()), "retrieve_blog_posts", "Search and return information about Lilian Weng blog posts.")
+    web_search = FlakyWebSearch(latency=args.search_latency, slow_fraction=args.slow_fraction, slow_latency=args.slow_latency)
+    research_agent = create_research_agent(llm, web_search)
+    db_tools, db = get_sql_db_tool(llm)
+    schema_index = get_schema_index()
+    questions = [f"Which genre has the longest tracks, and what is new in rock music this week ({i})?" for i in range(args.questions)]
+
+    async def run(timeout):
+        deadlines = Deadlines()
+        agent = build_graph(
+            llm, retriever_tool, research_agent, db_tools, db,
+            checkpointer=MemorySaver(), schema_index=schema_index, parallel_agents=True, deadlines=deadlines,
+        )
+
+        async def one(i: int, question: str) -> float:
+            start = time.perf_counter()
+            config = {"configurable": {"thread_id": f"{timeout}-{i}", **deadline_config(timeout)}}
+            await agent.ainvoke({"messages": [{"role": "user", "content": question}]}, config)
+            return time.perf_counter() - start
+
+        latencies = await asyncio.gather(*(one(i, question) for i, question in enumerate(questions)))
+        return np.array(latencies) * 1000, deadlines.stats()
+
+    print(f"{'deadline':<9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'stopped':>8}")
+    for timeout in (None, args.timeout):
+        latencies, stats = asyncio.run(run(timeout))
+        label = f"{timeout:g}s" if timeout else "none"
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{label:<9} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f} {latencies.max():>8.0f} {stats['node_timeouts']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# Offline end to end benchmark: the real graph and FastAPI app, with the stand-ins of stand_ins.py for Groq,
+# Tavily and the HuggingFace embeddings, and the bundled app/Chinook.db. Requests go through the ASGI app
+# (no network) at increasing concurrency. Results are written to a JSON file to compare commits.
+# Usage: python benchmarks/e2e.py [--concurrency 1 4 16 64] [--requests 64] [--llm-latency 0.05] [--output e2e.json] [--baseline old.json]
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from stand_ins import FakeChatModel, FakeWebSearch, HashEmbeddings, fake_vectorstore
+
+# Questions sent by the benchmark, one per agent; the fake supervisor hands them over by keyword
+SCENARIOS = {
+    "sql_agent": "Which genre on average has the longest tracks?",
+    "retriever": "What do the blog posts say about reward hacking?",
+    "research_agent": "What is the latest news about open source language models?",
+}
+ROUTES = {"blog": ["retriever"], "news": ["research_agent"]}
+
+def rss_mb() -> float:
+    # Resident set size of this process, Linux only
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Same wiring as app/server.py, with the external services replaced
+def build_app(llm_latency: float, search_latency: float, answer_cache: bool, workdir: str, llm_cache: str = "off", search_cache: bool = False) -> FastAPI:
+    os.environ.setdefault("CHECKPOINT_DB", os.path.join(workdir, "checkpoints.sqlite"))
+    os.environ.setdefault("ANSWER_CACHE_DB", os.path.join(workdir, "answer_cache.sqlite"))
+    os.environ.setdefault("LLM_CACHE_DB", os.path.join(workdir, "llm_cache.sqlite"))
+    os.environ.setdefault("CHAT_HISTORY_DB", os.path.join(workdir, "chat_history.sqlite"))
+    os.environ["ANSWER_CACHE"] = "1" if answer_cache else "0"
+    os.environ["LLM_CACHE"] = llm_cache
+    os.environ["SEARCH_CACHE"] = "1" if search_cache else "0"
+    os.chdir(APP_DIR)  # Chinook.db is opened relative to the app directory
+
+    from api import create_app
+    from tools.metrics import StartupTimer
+
+    startup = StartupTimer()
+
+    def load_chatbot():
+        with startup.phase("imports"):
+            from agents.research import create_research_agent
+            from agents.retriever import get_retriever_tool
+            from chatbot import build_chatbot
+            from tools.embedding_service import get_embedding_service
+            from tools.llm_cache import get_llm_cache
+            from tools.search_cache import get_search_tool
+        llm = FakeChatModel(latency=llm_latency, routes=ROUTES, cache=get_llm_cache())
+        embedding = get_embedding_service(HashEmbeddings())
+        with startup.phase("vectorstore"):
+            vectorstore = fake_vectorstore(embedding)
+            retriever_tool = get_retriever_tool(vectorstore, "retrieve_blog_posts", "Search and return information about Lilian Weng blog posts.")
+        with startup.phase("research_agent"):
+            web_search = get_search_tool(FakeWebSearch(latency=search_latency))
+            research_agent = create_research_agent(llm, web_search)
+        return build_chatbot(llm, embedding, retriever_tool, research_agent, startup, web_search)
+
+    return create_app(load_chatbot, startup)
+
+# Time spent outside LLM and tool calls, per graph node run
+def overhead_per_step(trace: dict) -> Optional[float]:
+    spans = trace["spans"]
+    steps = sum(1 for span in spans if span["kind"] == "node")
+    if not steps:
+        return None
+    waiting = sum(span["duration_ms"] for span in spans if span["kind"] in ("llm", "tool"))
+    return (trace["total_ms"] - waiting) / steps
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, requests: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    questions = list(SCENARIOS.values())
+    latencies: List[float] = []
+    overheads: List[float] = []
+    steps: List[int] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            body = {"question": questions[i % len(questions)], "user_id": f"bench-{i}", "thread_id": f"bench-{concurrency}-{i}", "trace": True}
+            start = time.perf_counter()
+            response = await client.post("/generate", json=body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+                return
+            trace = response.json()["trace"]
+            steps.append(sum(1 for span in trace["spans"] if span["kind"] == "node"))
+            if (overhead := overhead_per_step(trace)) is not None:
+                overheads.append(overhead)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 1),
+            "p95": round(float(np.percentile(latencies, 95)), 1),
+            "p99": round(float(np.percentile(latencies, 99)), 1),
+            "mean": round(float(np.mean(latencies)), 1),
+            "max": round(float(np.max(latencies)), 1),
+        },
+        "overhead_ms_per_step": {
+            "p50": round(float(np.percentile(overheads, 50)), 2) if overheads else None,
+            "p95": round(float(np.percentile(overheads, 95)), 2) if overheads else None,
+        },
+        "steps_per_request": round(float(np.mean(steps)), 1) if steps else None,
+        "rss_mb": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+async def run(concurrency: List[int], requests: int, llm_latency: float, search_latency: float, answer_cache: bool, llm_cache: str = "off", search_cache: bool = False) -> dict:
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir:
+        app = build_app(llm_latency, search_latency, answer_cache, workdir, llm_cache, search_cache)
+        app_seconds = time.perf_counter() - start
+        # The ASGI transport does not run the lifespan, which starts loading the chatbot
+        async with app.router.lifespan_context(app), httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            while (health := await client.get("/health")).status_code == 503 and health.json()["status"] == "loading":
+                await asyncio.sleep(0.01)
+            health = health.json()
+            if health["status"] == "failed":
+                raise RuntimeError(f"Chatbot failed to load: {health.get('error')}")
+            ready_seconds = time.perf_counter() - start
+            # One request per scenario first, so lazy initialization is not measured
+            # (with STARTUP_WARMUP=0 the first one loads the chatbot)
+            first_request = time.perf_counter()
+            for i, question in enumerate(SCENARIOS.values()):
+                await client.post("/generate", json={"question": question, "user_id": "bench", "thread_id": f"warmup-{i}"})
+                if i == 0:
+                    first_request_seconds = time.perf_counter() - first_request
+            phases = (await client.get("/health")).json()["startup"]["phases"]
+            levels = [await run_level(client, level, max(requests, level)) for level in concurrency]
+            stats = (await client.get("/stats")).json()
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "requests": requests,
+            "llm_latency": llm_latency,
+            "search_latency": search_latency,
+            "answer_cache": answer_cache,
+            "llm_cache": llm_cache,
+            "search_cache": search_cache,
+            "python": sys.version.split()[0],
+        },
+        "startup": {
+            "app_seconds": round(app_seconds, 3),
+            "ready_seconds": round(ready_seconds, 3),
+            "first_request_seconds": round(first_request_seconds, 3),
+            "phases": phases,
+        },
+        "rss_mb_before_startup": round(rss_before, 1),
+        "levels": levels,
+        # Hit rate and saved latency of the web search cache
+        "search_cache": stats.get("search_cache"),
+        # Hit rate and latency saved by the speculative prefetch
+        "speculation": stats.get("speculation"),
+    }
+
+# Relative change of throughput and latency against an earlier result file, by concurrency
+def compare(result: dict, baseline: dict) -> Dict[int, dict]:
+    before = {level["concurrency"]: level for level in baseline["levels"]}
+    changes = {}
+    for level in result["levels"]:
+        old = before.get(level["concurrency"])
+        if old is None:
+            continue
+        changes[level["concurrency"]] = {
+            "throughput": f"{(level['throughput_rps'] / old['throughput_rps'] - 1) * 100:+.1f}%",
+            "p95": f"{(level['latency_ms']['p95'] / old['latency_ms']['p95'] - 1) * 100:+.1f}%",
+            "p99": f"{(level['latency_ms']['p99'] / old['latency_ms']['p99'] - 1) * 100:+.1f}%",
+        }
+    return changes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end to end benchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level (at least the concurrency)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="Seconds per fake web search")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache on (off by default, repeated questions would be cache hits)")
+    parser.add_argument("--llm-cache", default="off", choices=["off", "read_through", "record", "replay"],
+                        help="LLM response cache mode (off by default, repeated prompts would be cache hits); set LLM_CACHE_DB to keep the recordings")
+    parser.add_argument("--search-cache", action="store_true", help="Keep the web search cache on (off by default, repeated searches would be cache hits)")
+    parser.add_argument("--output", default=None, help="Result file, default benchmarks/results/e2e-<commit>.json")
+    parser.add_argument("--baseline", default=None, help="Earlier result file to compare with")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.concurrency, args.requests, args.llm_latency, args.search_latency, args.answer_cache, args.llm_cache, args.search_cache))
+    output = args.output or os.path.join(BENCHMARKS_DIR, "results", f"e2e-{result['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    print(f"Written to {output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            print(json.dumps(compare(result, json.load(f)), indent=2))
@@ -0,0 +1,60 @@
+# Offline evaluation of the embedding router: leave-one-out over the labelled examples.
+# Reports, per confidence threshold, how many supervisor LLM calls are saved and how accurate the local routes are.
+# Usage: python benchmarks/router_eval.py [--examples app/data/router_examples.jsonl] [--thresholds 0.5 0.6 0.7 0.8 0.9]
+import os
+import sys
+import json
+import argparse
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from langchain_core.embeddings import Embeddings
+from agents.router import AGENTS, EmbeddingRouter, load_examples
+
+# Every example is embedded once, then looked up for each of the leave-one-out routers
+class PrecomputedEmbeddings(Embeddings):
+    def __init__(self, embedding: Embeddings, texts: List[str]):
+        self.vectors: Dict[str, List[float]] = dict(zip(texts, embedding.embed_documents(texts)))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors[text]
+
+def evaluate(embedding: Embeddings, examples: List[tuple], thresholds: List[float], temperature: float) -> dict:
+    embedding = PrecomputedEmbeddings(embedding, [question for question, _ in examples])
+    predictions = []
+    for i, (question, label) in enumerate(examples):
+        router = EmbeddingRouter(embedding, examples[:i] + examples[i + 1:], temperature=temperature)
+        predicted, confidence = router.route(question)
+        predictions.append((label, predicted, confidence))
+
+    results = []
+    for threshold in thresholds:
+        routed = [(label, predicted) for label, predicted, confidence in predictions if predicted in AGENTS and confidence >= threshold]
+        correct = sum(label == predicted for label, predicted in routed)
+        results.append({
+            "threshold": threshold,
+            "llm_calls_saved": len(routed),
+            "llm_calls_saved_rate": round(len(routed) / len(examples), 3),
+            "routed_accuracy": round(correct / len(routed), 3) if routed else None,
+            "misrouted": len(routed) - correct,
+        })
+    return {
+        "examples": len(examples),
+        "top1_accuracy": round(sum(label == predicted for label, predicted, _ in predictions) / len(examples), 3),
+        "thresholds": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding router offline evaluation")
+    parser.add_argument("--examples", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "data", "router_examples.jsonl"))
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95])
+    parser.add_argument("--temperature", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # Same embedding model as the vectorstore and the server's router
+    from langchain_huggingface import HuggingFaceEmbeddings
+    print(json.dumps(evaluate(HuggingFaceEmbeddings(), load_examples(args.examples), args.thresholds, args.temperature), indent=2))
@@ -0,0 +1,66 @@
+# Speculative prefetch benchmark: latency per question with and without the speculator, for questions the supervisor hands to
+# the retriever, to the SQL agent (schema index) and to the research agent (where the prefetches are wasted).
+# The stand-in embedding model takes --embedding-latency seconds per query, the stand-in LLM --llm-latency per call.
+# Usage: python benchmarks/speculation.py [--questions 20] [--llm-latency 0.1] [--embedding-latency 0.05]
+import os
+import sys
+import time
+import argparse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+import numpy as np
+from langgraph.checkpoint.memory import MemorySaver
+from stand_ins import FakeChatModel, FakeWebSearch, HashEmbeddings, fake_vectorstore
+
+SCENARIOS = {
+    "retriever": "What do the blog posts say about reward hacking?",
+    "sql_agent": "Which genre on average has the longest tracks?",
+    "research_agent": "What is the latest news about open source language models?",
+}
+ROUTES = {"blog": ["retriever"], "news": ["research_agent"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency with and without speculative prefetch")
+    parser.add_argument("--questions", type=int, default=20, help="Questions per scenario, each on a new thread")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Seconds per fake LLM call")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per query embedding")
+    args = parser.parse_args()
+
+    os.chdir(APP_DIR)  # Chinook.db is opened relative to the app directory
+    from agents.research import create_research_agent
+    from agents.retriever import get_retriever_tool
+    from agents.speculation import Speculator
+    from graph import build_graph
+    from tools.chinook_db import get_schema_index, get_sql_db_tool
+
+    llm = FakeChatModel(latency=args.llm_latency, routes=ROUTES)
+    vectorstore = fake_vectorstore(HashEmbeddings(query_latency=args.embedding_latency))
+    retriever_tool = get_retriever_tool(vectorstore, "retrieve_blog_posts", "Search and return information about Lilian Weng blog posts.")
+    research_agent = create_research_agent(llm, FakeWebSearch(latency=0))
+    db_tools, db = get_sql_db_tool(llm)
+    schema_index = get_schema_index()
+
+    latencies = {}
+    speculators = {"off": None, "on": Speculator()}
+    for mode, speculator in speculators.items():
+        agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver(), schema_index=schema_index, speculator=speculator)
+        for name, question in SCENARIOS.items():
+            samples = []
+            for i in range(args.questions):
+                start = time.perf_counter()
+                agent.invoke({"messages": [{"role": "user", "content": question}]}, {"configurable": {"thread_id": f"{mode}-{name}-{i}"}})
+                samples.append(time.perf_counter() - start)
+            latencies[mode, name] = float(np.mean(samples)) * 1000
+
+    print(f"{'handed to':<16} {'off ms':>8} {'on ms':>8} {'saved ms':>9}")
+    for name in SCENARIOS:
+        off, on = latencies["off", name], latencies["on", name]
+        print(f"{name:<16} {off:>8.1f} {on:>8.1f} {off - on:>9.1f}")
+    stats = speculators["on"].stats()
+    print(f"prefetches {stats['started']}, hit rate {stats['hit_rate']:.2f}, saved {stats['saved_seconds']:.2f} s, wasted {stats['wasted_seconds']:.2f} s of worker time")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# SQL agent micro-benchmark: time per call of the LLM nodes (call_get_schema, generate_query, check_query) and per run
+# of the whole SQL subgraph, with the stand-in model answering instantly, so what is measured is the per-call setup
+# (tool lookup, bind_tools, prompt formatting) and LangGraph's own overhead. Also runs on trees from before the
+# SQLAgent class (module globals set through set_llm/set_tools/set_db), to compare both.
+# Usage: python benchmarks/sql_agent.py [--calls 2000] [--runs 200]
+import os
+import sys
+import time
+import argparse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+from langchain_core.messages import AIMessage, HumanMessage
+from stand_ins import FakeChatModel
+
+QUESTION = "Which genre on average has the longest tracks?"
+QUERY = "SELECT g.Name, AVG(t.Milliseconds) FROM Track t JOIN Genre g ON t.GenreId = g.GenreId GROUP BY g.Name ORDER BY 2 DESC LIMIT 5"
+
+# The node functions and the subgraph, from the SQLAgent class or from the module globals
+def load(llm):
+    from tools.chinook_db import get_sql_db_tool
+    import agents.sql as sql
+
+    db_tools, db = get_sql_db_tool(llm)
+    if hasattr(sql, "SQLAgent"):
+        agent = sql.SQLAgent(llm, db_tools, db)
+        return "SQLAgent", {"call_get_schema": agent.call_get_schema, "generate_query": agent.generate_query, "check_query": agent.check_query}, agent.graph
+    from graph import build_sql_agent
+    sql.set_llm(llm)
+    sql.set_tools(db_tools)
+    sql.set_db(db)
+    return "module globals", {"call_get_schema": sql.call_get_schema, "generate_query": sql.generate_query, "check_query": sql.check_query}, build_sql_agent(False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per node overhead of the SQL agent")
+    parser.add_argument("--calls", type=int, default=2000, help="Calls per node")
+    parser.add_argument("--runs", type=int, default=200, help="Runs of the whole subgraph")
+    args = parser.parse_args()
+
+    os.chdir(APP_DIR)  # Chinook.db is opened relative to the app directory
+    llm = FakeChatModel(latency=0)
+    variant, nodes, graph = load(llm)
+    question = {"messages": [HumanMessage(QUESTION)]}
+    query_call = {"messages": [AIMessage("", tool_calls=[{"name": "sql_db_query", "args": {"query": QUERY}, "id": "1", "type": "tool_call"}])]}
+    states = {"call_get_schema": question, "generate_query": question, "check_query": query_call}
+
+    print(f"{variant}:")
+    for name, node in nodes.items():
+        node(states[name])  # warm up
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            node(states[name])
+        print(f"  {name:>16}: {(time.perf_counter() - start) / args.calls * 1e6:8.1f} us per call")
+
+    graph.invoke(question)
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        graph.invoke(question)
+    print(f"  {'subgraph run':>16}: {(time.perf_counter() - start) / args.runs * 1e3:8.2f} ms per run")
+
+if __name__ == "__main__":
+    main()
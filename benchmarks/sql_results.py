@@ -0,0 +1,65 @@
+# Prompt tokens of generate_query after a query ran, with the results rendered as the Python repr of all rows
+# (SQL_RESULT_FORMAT=repr, as SQLDatabase.run does) and in compact pages (SQL_RESULT_FORMAT=compact), on Chinook queries.
+# Tokens are counted approximately (4 characters per token), as the context manager does.
+# Usage: python benchmarks/sql_results.py [--max-rows 20] [--max-bytes 2048]
+import os
+import sys
+import argparse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+from langchain_core.messages import AIMessage, HumanMessage, convert_to_messages
+from langchain_core.messages.utils import count_tokens_approximately
+from stand_ins import FakeChatModel
+
+QUERIES = {
+    "longest genres": "SELECT g.Name, AVG(t.Milliseconds) FROM Track t JOIN Genre g ON t.GenreId = g.GenreId GROUP BY g.Name ORDER BY 2 DESC LIMIT 5",
+    "albums and artists": "SELECT a.Title, ar.Name FROM Album a JOIN Artist ar ON a.ArtistId = ar.ArtistId LIMIT 10",
+    "sales by country": "SELECT c.Country, SUM(i.Total) FROM Invoice i JOIN Customer c ON i.CustomerId = c.CustomerId GROUP BY c.Country ORDER BY 2 DESC",
+    "customers, all columns": "SELECT * FROM Customer LIMIT 5",
+    "all artists": "SELECT Name FROM Artist",
+    "all tracks, no limit": "SELECT * FROM Track",
+}
+
+def prompt_tokens(agent, question: str, query: str, tool) -> tuple:
+    call = AIMessage("", tool_calls=[{"name": "sql_db_query", "args": {"query": query}, "id": "1", "type": "tool_call"}])
+    result = tool.invoke(call.tool_calls[0])
+    state = {"messages": [HumanMessage(question), *agent.lookup_schema({"messages": [HumanMessage(question)]})["messages"], call, result]}
+    return count_tokens_approximately([result]), count_tokens_approximately(convert_to_messages(agent._generate_query_input(state)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt tokens of SQL results, repr against compact pages")
+    parser.add_argument("--max-rows", default="20", help="SQL_RESULT_MAX_ROWS")
+    parser.add_argument("--max-bytes", default="2048", help="SQL_RESULT_MAX_BYTES")
+    args = parser.parse_args()
+
+    os.chdir(APP_DIR)  # Chinook.db is opened relative to the app directory
+    os.environ["SQL_RESULT_MAX_ROWS"] = args.max_rows
+    os.environ["SQL_RESULT_MAX_BYTES"] = args.max_bytes
+    from agents.sql import SQLAgent
+    from tools.chinook_db import get_schema_index, get_sql_db_tool
+
+    llm = FakeChatModel(latency=0)
+    index = get_schema_index()
+    variants = {}
+    for result_format in ("repr", "compact"):
+        os.environ["SQL_RESULT_FORMAT"] = result_format
+        tools, db = get_sql_db_tool(llm)
+        variants[result_format] = (SQLAgent(llm, tools, db, schema_index=index), next(tool for tool in tools if tool.name == "sql_db_query"))
+
+    print(f"{'query':<24} {'result tokens':>22} {'generate_query prompt':>26}")
+    print(f"{'':<24} {'repr':>10} {'compact':>10} {'repr':>12} {'compact':>12}")
+    totals = [0, 0, 0, 0]
+    for name, query in QUERIES.items():
+        (repr_result, repr_prompt), (compact_result, compact_prompt) = (
+            prompt_tokens(agent, f"Question about {name}", query, tool) for agent, tool in variants.values()
+        )
+        for i, value in enumerate((repr_result, compact_result, repr_prompt, compact_prompt)):
+            totals[i] += value
+        print(f"{name:<24} {repr_result:>10} {compact_result:>10} {repr_prompt:>12} {compact_prompt:>12}")
+    print(f"{'total':<24} {totals[0]:>10} {totals[1]:>10} {totals[2]:>12} {totals[3]:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Offline stand-ins for the external services of the chatbot: the Groq chat model, Tavily search and the
+# HuggingFace embedding model. They are deterministic and configurable, for benchmarks and tests.
+import re
+import json
+import time
+import uuid
+import zlib
+import asyncio
+from typing import Any, Dict, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_core.vectorstores import InMemoryVectorStore
+
+# Scripted tool-calling chat model with a fixed latency per call.
+# It plays every LLM role in the graph, depending on the tools it is bound to:
+# - supervisor: hands a new question to the agents in `handoffs` (one tool call each), then answers with the last message.
+#   `routes` overrides the handoffs for questions containing a keyword, e.g. {"blog": ["retriever"]}.
+# - research agent: searches the web once, then answers with the results
+# - call_get_schema / check_query: calls the forced tool
+# - generate_query: runs one query, then answers with its result
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.1
+    query: str = "SELECT g.Name, AVG(t.Milliseconds) FROM Track t JOIN Genre g ON t.GenreId = g.GenreId GROUP BY g.Name ORDER BY 2 DESC LIMIT 5"
+    handoffs: List[str] = ["sql_agent"]
+    routes: Dict[str, List[str]] = {}
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], tool_choice=tool_choice, **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[list] = None, tool_choice: Any = None) -> AIMessage:
+        self.calls += 1
+        response = self._script(messages, tools, tool_choice)
+        # One token per word, like a provider reporting usage
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        output_tokens = len(str(response.content).split()) + len(response.tool_calls)
+        response.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        return response
+
+    def _handoffs(self, question: str) -> List[str]:
+        question = question.lower()
+        return next((agents for keyword, agents in self.routes.items() if keyword in question), self.handoffs)
+
+    def _script(self, messages: List[BaseMessage], tools: Optional[list] = None, tool_choice: Any = None) -> AIMessage:
+        names = [tool["function"]["name"] for tool in tools or []]
+        last = messages[-1]
+        if "transfer_to_sql_agent" in names:
+            if isinstance(last, HumanMessage):
+                return self._tool_calls([(f"transfer_to_{agent}", {"task_description": last.content}) for agent in self._handoffs(last.content)])
+            return AIMessage(content=f"Final answer: {last.content}")
+        if names == ["tavily_search"]:
+            if isinstance(last, ToolMessage):
+                return AIMessage(content=f"Research results: {last.content}")
+            return self._tool_call("tavily_search", {"query": last.content})
+        if names == ["sql_db_schema"]:
+            return self._tool_call("sql_db_schema", {"table_names": "Genre, Track"})
+        if names[:1] == ["sql_db_query"]:
+            if tool_choice:
+                # check_query: reproduce the query from the user message
+                return self._tool_call("sql_db_query", {"query": last.content.split("\n\n-- ")[0]})
+            if isinstance(last, ToolMessage) and last.name == "sql_db_query":
+                return AIMessage(content=f"The result is {last.content}")
+            return self._tool_call("sql_db_query", {"query": self.query})
+        return AIMessage(content="ok")
+
+    @classmethod
+    def _tool_call(cls, name: str, args: dict) -> AIMessage:
+        return cls._tool_calls([(name, args)])
+
+    @staticmethod
+    def _tool_calls(calls: List[tuple]) -> AIMessage:
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:8]}", "type": "tool_call"} for name, args in calls],
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice")))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice")))])
+
+# Local stand-in for TavilySearch: same tool name and result layout, canned results after a fixed latency
+class FakeWebSearch(BaseTool):
+    name: str = "tavily_search"
+    description: str = "A search engine optimized for comprehensive, accurate, and trusted results."
+    latency: float = 0.2
+    max_results: int = 3
+    calls: int = 0
+
+    def _results(self, query: str) -> str:
+        self.calls += 1
+        results = [
+            {
+                "url": f"https://example.com/{zlib.crc32(query.encode()):08x}/{i}",
+                "title": f"Result {i + 1} for {query}",
+                "content": f"Synthetic search result {i + 1} about {query}. " * 4,
+                "score": round(1.0 - i * 0.1, 2),
+            }
+            for i in range(self.max_results)
+        ]
+        return json.dumps({"query": query, "results": results})
+
+    def _run(self, query: str) -> str:
+        time.sleep(self.latency)
+        return self._results(query)
+
+    async def _arun(self, query: str) -> str:
+        await asyncio.sleep(self.latency)
+        return self._results(query)
+
+# Hashed bag of words embedding: deterministic, no model download, and close enough to keep topics apart
+# for the router and the answer cache. query_latency stands for the model's inference time per query.
+class HashEmbeddings(Embeddings):
+    def __init__(self, size: int = 256, query_latency: float = 0.0):
+        self.size = size
+        self.query_latency = query_latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            vector[zlib.crc32(word.encode()) % self.size] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_latency:
+            time.sleep(self.query_latency)
+        return self._embed(text)
+
+BLOG_TOPICS = {
+    "reward-hacking": "Reward hacking occurs when a reinforcement learning agent exploits flaws in the reward function to achieve high reward without learning the intended task.",
+    "hallucination": "Hallucination in large language models refers to the model generating unfaithful, fabricated, inconsistent, or nonsensical content.",
+    "diffusion-video": "Diffusion models for video generation extend image diffusion with temporal consistency across frames.",
+}
+
+# In-memory stand-in for the blog vectorstore, chunks of synthetic posts on the same topics
+def fake_vectorstore(embedding: Embeddings, chunks_per_post: int = 50) -> InMemoryVectorStore:
+    vectorstore = InMemoryVectorStore(embedding)
+    vectorstore.add_documents([
+        Document(page_content=f"{text} Section {i}.", metadata={"source": f"https://lilianweng.github.io/posts/{post}/"})
+        for post, text in BLOG_TOPICS.items()
+        for i in range(chunks_per_post)
+    ])
+    return vectorstore
@@ -0,0 +1,130 @@
+# Vector index benchmark: NumpyVectorStore (float32, float16, int8) against Chroma on synthetic embeddings.
+# Reports build time, query latency, batched query throughput, resident memory and recall@k against exact search.
+# Each backend runs in its own process so resident memory is not shared between them.
+# Usage: python benchmarks/vectorstore.py [--documents 20000] [--dim 768] [--queries 200] [--k 4] [--output vectorstore.json]
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from typing import List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "app")))
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from e2e import rss_mb
+
+BACKENDS = ["numpy-float32", "numpy-float16", "numpy-int8", "chroma"]
+
+# Clustered unit vectors, like sentence embeddings of chunks of a few posts; queries are noisy copies of documents
+def make_corpus(documents: int, dim: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(documents // 200, 1), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=documents)] + 0.7 * rng.standard_normal((documents, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    targets = rng.integers(documents, size=queries)
+    query_vectors = vectors[targets] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32) / np.sqrt(dim) * 4
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, query_vectors
+
+# Texts "doc-<i>" and "query-<i>" stand for the synthetic vectors, so both stores embed the same data
+class ArrayEmbeddings(Embeddings):
+    def __init__(self, vectors: np.ndarray, queries: np.ndarray):
+        self.vectors = vectors
+        self.queries = queries
+
+    def _embed(self, text: str) -> List[float]:
+        kind, i = text.split("-")
+        return (self.vectors if kind == "doc" else self.queries)[int(i)].tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def build(backend: str, embedding: Embeddings, documents: int, directory: str):
+    texts = [f"doc-{i}" for i in range(documents)]
+    ids = [str(i) for i in range(documents)]
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        store = Chroma(embedding_function=embedding, persist_directory=directory, collection_metadata={"hnsw:space": "cosine"})
+        for start in range(0, documents, 5000):
+            store.add_texts(texts[start:start + 5000], ids=ids[start:start + 5000])
+        return store
+    from tools.numpy_vectorstore import NumpyVectorStore
+    NumpyVectorStore.from_texts(texts, embedding, ids=ids, path=directory, dtype=backend.split("-")[1])
+    # Reopened, as a server would: the index is memory-mapped
+    return NumpyVectorStore(embedding, directory, dtype=backend.split("-")[1])
+
+def run_backend(backend: str, args, queue) -> None:
+    vectors, queries = make_corpus(args.documents, args.dim, args.queries)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+    embedding = ArrayEmbeddings(vectors, queries)
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        try:
+            store = build(backend, embedding, args.documents, directory)
+        except ImportError as e:
+            queue.put({"backend": backend, "skipped": str(e)})
+            return
+        build_seconds = time.perf_counter() - start
+        # Memory of the data only: drop the source arrays, open the index, touch it with one query
+        del vectors
+        rss_before = rss_mb()
+        store.similarity_search("query-0", k=args.k)
+
+        latencies, found = [], 0
+        for i in range(args.queries):
+            start = time.perf_counter()
+            hits = store.similarity_search(f"query-{i}", k=args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found += len({int(document.id) for document in hits} & set(exact[i].tolist()))
+        result = {
+            "backend": backend,
+            "build_seconds": round(build_seconds, 3),
+            "latency_ms": {
+                "p50": round(float(np.percentile(latencies, 50)), 3),
+                "p95": round(float(np.percentile(latencies, 95)), 3),
+            },
+            f"recall_at_{args.k}": round(found / exact.size, 4),
+            "rss_mb": round(rss_mb(), 1),
+            "rss_mb_after_open": round(rss_mb() - rss_before, 1),
+        }
+        if hasattr(store, "batch_similarity_search_with_score"):
+            names = [f"query-{i}" for i in range(args.queries)]
+            start = time.perf_counter()
+            store.batch_similarity_search_with_score(names, k=args.k)
+            result["batch_queries_per_second"] = round(args.queries / (time.perf_counter() - start), 1)
+        queue.put(result)
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector index benchmark")
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768, help="768 like the default HuggingFace embedding model")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4, help="Documents per query, 4 like as_retriever()")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for backend in args.backends:
+        queue = context.Queue()
+        process = context.Process(target=run_backend, args=(backend, args, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    report = {"config": {"documents": args.documents, "dim": args.dim, "queries": args.queries, "k": args.k}, "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
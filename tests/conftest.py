@@ -0,0 +1,33 @@
+import os
+import pytest
+from langchain_core.tools import tool
+from langgraph.prebuilt import create_react_agent
+from stand_ins import FakeChatModel
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# The app opens Chinook.db relative to the app directory
+@pytest.fixture(autouse=True)
+def app_dir(monkeypatch):
+    monkeypatch.chdir(APP_DIR)
+
+@pytest.fixture
+def chinook_path() -> str:
+    return os.path.join(APP_DIR, "Chinook.db")
+
+@pytest.fixture
+def llm() -> FakeChatModel:
+    return FakeChatModel()
+
+@tool
+def retrieve_blog_posts(query: str) -> str:
+    """Search and return information about Lilian Weng blog posts."""
+    return "No blog posts found."
+
+@pytest.fixture
+def retriever_tool():
+    return retrieve_blog_posts
+
+@pytest.fixture
+def research_agent(llm):
+    return create_react_agent(model=llm, tools=[retrieve_blog_posts], name="research_agent")
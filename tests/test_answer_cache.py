@@ -0,0 +1,52 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from graph import build_graph
+from tools.answer_cache import SemanticAnswerCache
+from tools.chinook_db import get_sql_db_tool
+from agents.answer_cache import create_answer_cache_nodes
+
+QUESTION = "Which genre on average has the longest tracks?"
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticAnswerCache(str(tmp_path / "answer_cache.sqlite"), DeterministicFakeEmbedding(size=32))
+
+@pytest.fixture
+def agent(llm, retriever_tool, research_agent, cache):
+    db_tools, db = get_sql_db_tool(llm)
+    return build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver(), answer_cache=cache)
+
+def ask(agent, question: str, thread_id: str) -> AIMessage:
+    result = agent.invoke({"messages": [{"role": "user", "content": question}]}, {"configurable": {"thread_id": thread_id}})
+    return result["messages"][-1]
+
+def test_first_question_is_answered_from_cache_in_other_threads(agent, cache):
+    answer = ask(agent, QUESTION, "t0")
+    assert answer.name == "supervisor"
+    cached = ask(agent, QUESTION, "t1")
+    assert cached.name == "answer_cache"
+    assert cached.content == answer.content
+
+def test_follow_up_questions_are_never_cached(agent, cache, llm):
+    ask(agent, QUESTION, "t0")
+    ask(agent, "Why?", "t0")
+    assert cache.stats()["entries"] == 1
+
+    # The same follow-up in another conversation runs the graph instead of reusing t0's answer
+    ask(agent, QUESTION, "t1")
+    calls = llm.calls
+    answer = ask(agent, "Why?", "t1")
+    assert answer.name == "supervisor"
+    assert llm.calls > calls
+
+def test_direct_answers_are_never_cached(cache):
+    _, (store, _) = create_answer_cache_nodes(cache)
+    question = HumanMessage("Hi, my name is Sam", id="q")
+    store({"messages": [question, AIMessage("Hello Sam!", name="supervisor")], "turn_message_id": "q"})
+    assert cache.stats()["entries"] == 0
+
+    tool_message = ToolMessage("[('Rock',)]", name="sql_db_query", tool_call_id="1")
+    store({"messages": [question, tool_message, AIMessage("Rock", name="supervisor")], "turn_message_id": "q"})
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,38 @@
+import time
+import asyncio
+from langgraph.checkpoint.memory import MemorySaver
+from graph import build_graph
+from tools.chinook_db import get_sql_db_tool
+
+QUESTION = "Which genre on average has the longest tracks?"
+
+async def ask(agent, thread_id: str) -> str:
+    last = None
+    async for step in agent.astream(
+        {"messages": [{"role": "user", "content": QUESTION}]},
+        config={"configurable": {"thread_id": thread_id}},
+        stream_mode="values",
+    ):
+        last = step
+    return last["messages"][-1].content
+
+def test_concurrent_requests_take_about_as_long_as_one(llm, retriever_tool, research_agent):
+    db_tools, db = get_sql_db_tool(llm)
+    # LLM schema path and LLM check_query, so every SQL node runs
+    agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver())
+
+    async def run():
+        start = time.perf_counter()
+        answer = await ask(agent, "single")
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        answers = await asyncio.gather(*(ask(agent, f"thread-{i}") for i in range(10)))
+        concurrent = time.perf_counter() - start
+        return answer, single, answers, concurrent
+
+    answer, single, answers, concurrent = asyncio.run(run())
+    assert answer.startswith("Final answer")
+    assert answers == [answer] * 10
+    # Nodes never block the event loop, so ten requests overlap instead of queueing
+    assert concurrent < 2 * single, (single, concurrent)
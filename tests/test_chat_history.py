@@ -0,0 +1,72 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from starlette.testclient import TestClient
+from api import create_app
+from chatbot import Chatbot
+from graph import build_graph
+from stand_ins import FakeChatModel
+from tools.chat_history import ChatHistory, SqliteChatHistoryStore
+from tools.chinook_db import get_sql_db_tool
+
+def turn(i: int) -> list:
+    return [HumanMessage(f"question {i}"), AIMessage(f"answer {i}")]
+
+def test_turns_are_batched_in_order_and_read_in_pages(tmp_path):
+    history = ChatHistory(SqliteChatHistoryStore(str(tmp_path / "history.sqlite")), flush_interval=0.05)
+    for i in range(30):
+        history.append(f"t{i % 3}", "u", turn(i))
+
+    # Reads wait for the thread's queued messages
+    page = history.read("t0", limit=8)
+    assert [message.content for message in page.messages] == [text for i in (18, 21, 24, 27) for text in (f"question {i}", f"answer {i}")]
+    contents = []
+    before = None
+    while True:
+        page = history.read("t0", limit=8, before=before)
+        contents = [message.content for message in page.messages] + contents
+        if page.before is None:
+            break
+        before = page.before
+    assert contents == [text for i in range(0, 30, 3) for text in (f"question {i}", f"answer {i}")]
+    assert isinstance(page.messages[0], HumanMessage)
+
+    history.close()
+    stats = history.stats()
+    assert stats["written"] == 60 and stats["batches"] < 10
+
+def test_failed_batches_are_retried_before_later_ones(tmp_path):
+    class FlakyStore(SqliteChatHistoryStore):
+        failures = 2
+
+        def write(self, records):
+            if self.failures:
+                self.failures -= 1
+                raise OSError("connection reset")
+            super().write(records)
+
+    path = str(tmp_path / "history.sqlite")
+    history = ChatHistory(FlakyStore(path), retry_backoff=0.01, flush_interval=0.01)
+    for i in range(5):
+        history.append("t", "u", turn(i))
+    # close writes what is still queued
+    history.close()
+    assert history.stats()["retries"] == 2 and history.stats()["failed"] == 0
+
+    page = SqliteChatHistoryStore(path).read("t", limit=100)
+    assert [message.content for message in page.messages] == [text for i in range(5) for text in (f"question {i}", f"answer {i}")]
+
+def test_api_records_turns_and_serves_history(tmp_path, retriever_tool, research_agent):
+    llm = FakeChatModel(latency=0)
+    db_tools, db = get_sql_db_tool(llm)
+    agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver())
+    history = ChatHistory(SqliteChatHistoryStore(str(tmp_path / "history.sqlite")))
+    with TestClient(create_app(lambda: Chatbot(agent, db_tools, history=history))) as client:
+        for question in ("Which genre on average has the longest tracks?", "And the shortest?"):
+            answer = client.post("/generate", json={"question": question, "user_id": "u", "thread_id": "t"}).json()["result"]
+        body = client.get("/history/t", params={"limit": 2}).json()
+        assert body["messages"] == [{"role": "human", "content": "And the shortest?"}, {"role": "ai", "content": answer}]
+        older = client.get("/history/t", params={"limit": 2, "before": body["before"]}).json()
+        assert older["messages"][0]["content"] == "Which genre on average has the longest tracks?"
+        assert older["before"] is None
+    # Shutting the app down closed the history
+    assert history.closed
@@ -0,0 +1,68 @@
+from langchain_core.messages import AIMessage
+from langgraph.graph import StateGraph, START, MessagesState
+from langgraph.types import Command, interrupt
+from tools.checkpointer import BoundedSqliteSaver
+
+# Parent graph with a subgraph node, like the supervisor and the agents: every turn checkpoints the
+# subgraph under a new "agent:<task id>" namespace
+def build_graph(checkpointer, ask_user: bool = False):
+    def think(state: MessagesState):
+        return {"messages": [AIMessage("thinking")]}
+
+    def answer(state: MessagesState):
+        if ask_user:
+            return {"messages": [AIMessage(interrupt("more details?"))]}
+        return {"messages": [AIMessage("answer")]}
+
+    sub_builder = StateGraph(MessagesState)
+    sub_builder.add_node(think)
+    sub_builder.add_node(answer)
+    sub_builder.add_edge(START, "think")
+    sub_builder.add_edge("think", "answer")
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("agent", sub_builder.compile())
+    builder.add_edge(START, "agent")
+    return builder.compile(checkpointer=checkpointer)
+
+def count_checkpoints(saver: BoundedSqliteSaver, thread_id: str) -> tuple:
+    with saver.cursor() as cur:
+        return cur.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT checkpoint_ns) FROM checkpoints WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()
+
+def test_compaction_bounds_total_checkpoints_per_thread(tmp_path):
+    saver = BoundedSqliteSaver(str(tmp_path / "checkpoints.sqlite"), max_checkpoints_per_thread=5, compaction_interval=None)
+    graph = build_graph(saver)
+    config = {"configurable": {"thread_id": "t1"}}
+    for turn in range(10):
+        graph.invoke({"messages": [{"role": "user", "content": f"question {turn}"}]}, config)
+    assert count_checkpoints(saver, "t1")[1] > 1
+
+    saver.compact()
+
+    total, namespaces = count_checkpoints(saver, "t1")
+    assert total <= 5
+    assert namespaces == 1
+    # The conversation is intact and the thread keeps working
+    assert len(graph.get_state(config).values["messages"]) == 30
+    graph.invoke({"messages": [{"role": "user", "content": "one more"}]}, config)
+    saver.compact()
+    assert count_checkpoints(saver, "t1")[0] <= 5
+    saver.close()
+
+def test_compaction_keeps_interrupted_subgraph_run(tmp_path):
+    saver = BoundedSqliteSaver(str(tmp_path / "checkpoints.sqlite"), max_checkpoints_per_thread=5, compaction_interval=None)
+    graph = build_graph(saver, ask_user=True)
+    config = {"configurable": {"thread_id": "t1"}}
+    graph.invoke({"messages": [{"role": "user", "content": "question"}]}, config)
+
+    saver.compact()
+
+    # The subgraph run is still waiting for the user, so its checkpoints survive and it can resume
+    result = graph.invoke(Command(resume="details"), config)
+    assert [message.content for message in result["messages"]] == ["question", "thinking", "details"]
+    saver.compact()
+    assert count_checkpoints(saver, "t1")[1] == 1
+    saver.close()
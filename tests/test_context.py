@@ -0,0 +1,77 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+from stand_ins import FakeChatModel
+from agents.context import ContextManager
+from graph import build_graph
+from tools.chinook_db import get_schema_index, get_sql_db_tool
+from tools.metrics import MetricsCallbackHandler
+
+def turn(i: int, result_words: int = 200) -> list:
+    call = AIMessage("", tool_calls=[{"name": "sql_db_query", "args": {"query": "SELECT 1"}, "id": f"call-{i}", "type": "tool_call"}])
+    return [
+        HumanMessage(f"question {i}", id=f"q{i}"),
+        HumanMessage(f"task {i}", id=f"t{i}"),
+        call,
+        ToolMessage("row " * result_words, name="sql_db_query", tool_call_id=f"call-{i}", id=f"r{i}"),
+        AIMessage(f"agent answer {i}", id=f"a{i}"),
+        AIMessage(f"final answer {i}", name="supervisor", id=f"f{i}"),
+    ]
+
+def test_completed_turns_lose_tool_outputs_and_the_current_turn_its_stale_ones():
+    current = turn(9)[:4] + [
+        AIMessage("", tool_calls=[{"name": "sql_db_query", "args": {"query": "SELECT 2"}, "id": "retry", "type": "tool_call"}]),
+        ToolMessage("fixed result", name="sql_db_query", tool_call_id="retry"),
+    ]
+    prepared = ContextManager(budget=100000).prepare(turn(0) + turn(1) + current)
+    assert [message.content for message in prepared[:6]] == ["question 0", "agent answer 0", "final answer 0", "question 1", "agent answer 1", "final answer 1"]
+    tool_outputs = [message.content for message in prepared if isinstance(message, ToolMessage)]
+    assert tool_outputs == ["[Earlier sql_db_query output removed]", "fixed result"]
+
+def test_budget_trims_oldest_turns_and_keeps_the_current_one():
+    messages = [message for i in range(20) for message in turn(i)] + [HumanMessage("current question")]
+    context = ContextManager(budget=60)
+    prepared = context.prepare(messages)
+    assert prepared[-1].content == "current question"
+    assert isinstance(prepared[0], HumanMessage) and prepared[0].content.startswith("question")
+    assert context.token_counter(prepared) <= 60
+    assert "final answer 19" in [message.content for message in prepared]
+
+def test_current_turn_over_budget_has_its_tool_outputs_truncated():
+    prepared = ContextManager(budget=300).prepare(turn(0, result_words=2000)[:4])
+    assert "characters truncated" in prepared[-1].content
+    assert len(prepared[-1].content) < 2000 * 4
+
+def test_older_turns_are_summarized_in_the_background():
+    llm = FakeChatModel(latency=0)
+    context = ContextManager(budget=100000, llm=llm, keep_turns=2, summary_trigger=10)
+    messages = [message for i in range(5) for message in turn(i)] + [HumanMessage("current question")]
+    # First call starts the summary of turns 0 to 2, the history is still complete meanwhile
+    assert context.prepare(messages, "thread")[0].content == "question 0"
+    context.flush()
+    prepared = context.prepare(messages, "thread")
+    assert isinstance(prepared[0], SystemMessage) and prepared[0].content.endswith("ok")
+    assert [message.content for message in prepared[1:4]] == ["question 3", "agent answer 3", "final answer 3"]
+    assert context.stats()["summaries"] == 1
+    # Summaries are per thread
+    assert context.prepare(messages, "other thread")[0].content == "question 0"
+
+def test_supervisor_prompt_stops_growing_with_the_conversation(llm, retriever_tool):
+    llm.latency = 0
+    db_tools, db = get_sql_db_tool(llm)
+    agent = build_graph(
+        llm, retriever_tool, create_react_agent(model=llm, tools=[retriever_tool], name="research_agent"), db_tools, db,
+        checkpointer=MemorySaver(),
+        schema_index=get_schema_index(),
+        supervisor_context=ContextManager(budget=800),
+        sql_context=ContextManager(budget=800),
+    )
+    supervisor_tokens = []
+    for i in range(10):
+        handler = MetricsCallbackHandler("test")
+        result = agent.invoke({"messages": [{"role": "user", "content": f"Which genre has the longest tracks? ({i})"}]}, {"configurable": {"thread_id": "t"}, "callbacks": [handler]})
+        supervisor_tokens.append(sum(span["prompt_tokens"] for span in handler.trace()["spans"] if span["kind"] == "llm" and span["name"].startswith("supervisor")))
+    assert supervisor_tokens[-1] == supervisor_tokens[-2] == supervisor_tokens[-3]
+    # The state still has every message
+    assert sum(isinstance(message, ToolMessage) for message in result["messages"]) >= 16
+    assert result["messages"][-1].content.startswith("Final answer")
@@ -0,0 +1,137 @@
+import time
+import asyncio
+import httpx
+import pytest
+from langchain_core.messages import ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from starlette.testclient import TestClient
+from agents.branch import create_branch_node
+from agents.deadline import Deadlines, deadline_config
+from agents.research import create_research_agent
+from api import create_app
+from chatbot import Chatbot
+from graph import build_graph
+from stand_ins import FakeChatModel, FakeWebSearch
+from tools.chinook_db import get_sql_db_tool
+from tools.metrics import CANCELLED, MetricsCallbackHandler
+
+QUESTION = "Which genre has the longest tracks, and what is new in rock music?"
+
+# generate_query never settles on an answer, it runs the same query again and again
+class LoopingModel(FakeChatModel):
+    def _script(self, messages, tools=None, tool_choice=None):
+        names = [tool["function"]["name"] for tool in tools or []]
+        if names[:1] == ["sql_db_query"] and not tool_choice:
+            return self._tool_call("sql_db_query", {"query": self.query})
+        return super()._script(messages, tools, tool_choice)
+
+# Agent whose HTTP client gives up: its TimeoutError is a failure of the agent, not the branch's deadline
+class TimingOutAgent:
+    name = "research_agent"
+
+    def stream(self, input, config=None, stream_mode=None):
+        raise TimeoutError("search API read timeout")
+        yield
+
+    async def astream(self, input, config=None, stream_mode=None):
+        raise TimeoutError("search API read timeout")
+        yield
+
+def test_slow_agent_is_stopped_before_the_deadline(retriever_tool):
+    llm = FakeChatModel(latency=0.05, handoffs=["research_agent", "sql_agent"])
+    db_tools, db = get_sql_db_tool(llm)
+    deadlines = Deadlines(reserve=0.2)
+    research_agent = create_research_agent(llm, FakeWebSearch(latency=5))
+    agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver(), parallel_agents=True, deadlines=deadlines)
+    cancelled = CANCELLED.values.get(("node", "research_agent/tools"), 0)
+
+    async def run():
+        start = time.perf_counter()
+        config = {"configurable": {"thread_id": "t", **deadline_config(1.0)}, "callbacks": [MetricsCallbackHandler("test")]}
+        result = await agent.ainvoke({"messages": [{"role": "user", "content": QUESTION}]}, config)
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(run())
+    # The research agent had until 0.8s, the supervisor answered from the SQL agent's result within the second
+    assert elapsed < 1.0
+    contents = [message.content for message in result["messages"]]
+    assert any(content.startswith("research_agent did not answer within 0.") for content in contents)
+    assert result["messages"][-1].content.startswith("Final answer: The result is")
+    # Its search was cancelled in flight
+    assert CANCELLED.values[("node", "research_agent/tools")] == cancelled + 1
+    assert deadlines.stats()["timeouts.research_agent"] == 1
+
+def test_sql_query_loop_is_capped(retriever_tool, research_agent):
+    llm = LoopingModel(latency=0)
+    db_tools, db = get_sql_db_tool(llm)
+    deadlines = Deadlines(max_queries=3)
+    agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver(), deadlines=deadlines)
+
+    result = agent.invoke({"messages": [{"role": "user", "content": "Which genre has the longest tracks?"}]}, {"configurable": {"thread_id": "t"}})
+    queries = [message for message in result["messages"] if isinstance(message, ToolMessage) and message.name == "sql_db_query"]
+    assert len(queries) == 3
+    assert result["messages"][-1].content == "Final answer: sql_agent stopped after 3 queries without an answer."
+    assert deadlines.stats()["sql_query_caps"] == 1
+
+def test_request_deadline_returns_the_partial_answer(retriever_tool, research_agent):
+    # Each LLM call takes 0.3s: the SQL agent's query result comes at 1.2s, the agent is stopped at 1.35s while it
+    # writes its answer, and the deadline passes at 1.5s while the supervisor writes the final answer
+    llm = FakeChatModel(latency=0.3)
+    db_tools, db = get_sql_db_tool(llm)
+    deadlines = Deadlines(reserve=0.1)
+    agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver(), deadlines=deadlines)
+    with TestClient(create_app(lambda: Chatbot(agent, db_tools, deadlines=deadlines))) as client:
+        start = time.perf_counter()
+        body = client.post("/generate", json={"question": "Which genre has the longest tracks?", "user_id": "u", "thread_id": "t", "timeout": 1.5}).json()
+        assert time.perf_counter() - start < 1.8
+        assert body["timed_out"] is True
+        # The query result, the last tool result of the turn
+        assert body["result"].startswith("Name:TEXT\tAVG(t.Milliseconds):REAL\nSci Fi & Fantasy")
+        assert deadlines.stats()["partial_answers"] == 1
+        # The stopped run left no pending task behind
+        assert agent.get_state({"configurable": {"thread_id": "t"}}).next == ()
+
+        # The partial answer is the turn's answer in the thread, the next turn runs normally
+        body = client.post("/generate", json={"question": "And the shortest?", "user_id": "u", "thread_id": "t"}).json()
+        assert "timed_out" not in body and body["result"].startswith("Final answer")
+        messages = agent.get_state({"configurable": {"thread_id": "t"}}).values["messages"]
+        partial = messages[[message.content for message in messages].index("And the shortest?") - 1]
+        assert partial.name == "supervisor" and partial.content.startswith("Name:TEXT")
+
+def test_repeated_question_timed_out_in_the_queue_gets_no_answer_of_the_previous_turn(monkeypatch, retriever_tool, research_agent):
+    monkeypatch.setenv("ADMISSION_MAX_CONCURRENCY", "1")
+    llm = FakeChatModel(latency=0.1)
+    db_tools, db = get_sql_db_tool(llm)
+    agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver(), deadlines=Deadlines())
+    app = create_app(lambda: Chatbot(agent, db_tools))
+    question = {"question": "Which genre has the longest tracks?", "user_id": "u", "thread_id": "t"}
+
+    async def scenario():
+        async with app.router.lifespan_context(app), httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = (await client.post("/generate", json=question)).json()
+            config = {"configurable": {"thread_id": "t"}}
+            before = (await agent.aget_state(config)).values["messages"]
+            # Another request holds the only slot while the same question is asked again
+            other = asyncio.ensure_future(client.post("/generate", json={**question, "user_id": "v", "thread_id": "other"}))
+            await asyncio.sleep(0.05)
+            repeated = (await client.post("/generate", json={**question, "timeout": 0.2})).json()
+            await other
+            return first, repeated, before, await agent.aget_state(config)
+
+    first, repeated, before, state = asyncio.run(scenario())
+    assert first["result"].startswith("Final answer")
+    assert repeated == {"result": "Sorry, I could not answer within 0.2 seconds.", "timed_out": True}
+    # The thread is as the first turn left it
+    assert state.values["messages"] == before and state.next == ()
+
+@pytest.mark.parametrize("timeout", [None, 5.0])
+def test_agent_errors_are_not_taken_for_its_deadline(timeout):
+    deadlines = Deadlines()
+    run_branch, arun_branch = create_branch_node(TimingOutAgent(), deadlines=deadlines)
+    state = {"messages": [{"role": "user", "content": QUESTION}]}
+    config = {"configurable": deadline_config(timeout)}
+    with pytest.raises(TimeoutError, match="read timeout"):
+        asyncio.run(arun_branch(state, config))
+    with pytest.raises(TimeoutError, match="read timeout"):
+        run_branch(state, config)
+    assert deadlines.stats()["node_timeouts"] == 0
@@ -0,0 +1,23 @@
+import asyncio
+from e2e import compare, run
+
+def test_benchmark_runs_offline(monkeypatch, tmp_path):
+    # Keep the environment the harness sets up local to this test
+    monkeypatch.setenv("CHECKPOINT_DB", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setenv("ANSWER_CACHE_DB", str(tmp_path / "answer_cache.sqlite"))
+    monkeypatch.setenv("ANSWER_CACHE", "0")
+    monkeypatch.setenv("LLM_CACHE_DB", str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setenv("LLM_CACHE", "off")
+    monkeypatch.setenv("CHAT_HISTORY_DB", str(tmp_path / "chat_history.sqlite"))
+    monkeypatch.setenv("SEARCH_CACHE", "0")
+
+    result = asyncio.run(run([1, 3], 3, llm_latency=0.0, search_latency=0.0, answer_cache=False))
+
+    assert [level["concurrency"] for level in result["levels"]] == [1, 3]
+    for level in result["levels"]:
+        assert level["errors"] == 0
+        assert level["latency_ms"]["p50"] <= level["latency_ms"]["p99"]
+        assert level["steps_per_request"] > 0
+        assert level["overhead_ms_per_step"]["p50"] is not None
+    assert set(compare(result, result)) == {1, 3}
+    assert compare(result, result)[1]["throughput"] == "+0.0%"
@@ -0,0 +1,85 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from langchain_core.embeddings import Embeddings
+from stand_ins import HashEmbeddings
+from tools.embedding_service import EmbeddingService
+
+# Records the size of every model call, each call takes `latency` seconds like a forward pass
+class RecordingEmbeddings(Embeddings):
+    def __init__(self, latency: float = 0.01, fail: bool = False):
+        self.model = HashEmbeddings()
+        self.latency = latency
+        self.fail = fail
+        self.calls = []
+        self.threads = set()
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def test_concurrent_queries_are_batched():
+    model = RecordingEmbeddings()
+    service = EmbeddingService(model, max_batch=32, max_wait=0.02)
+    questions = [f"question number {i}" for i in range(16)]
+    with ThreadPoolExecutor(16) as executor:
+        vectors = list(executor.map(service.embed_query, questions))
+    assert vectors == [model.model.embed_query(question) for question in questions]
+    assert sum(model.calls) == 16 and len(model.calls) < 16
+    assert model.threads == {"embedding-service"}
+    assert service.stats()["mean_batch_size"] > 1
+
+def test_query_cache_normalizes_whitespace_and_evicts():
+    model = RecordingEmbeddings(latency=0)
+    service = EmbeddingService(model, cache_size=2, max_wait=0)
+    first = service.embed_query("reward hacking")
+    assert service.embed_query("  reward   hacking ") == first
+    assert model.calls == [1]
+    service.embed_query("hallucination")
+    service.embed_query("video diffusion")
+    # Least recently used entry evicted
+    service.embed_query("reward hacking")
+    assert len(model.calls) == 4
+    stats = service.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 4, 2)
+
+def test_async_queries_do_not_block_the_event_loop():
+    model = RecordingEmbeddings(latency=0.05)
+    service = EmbeddingService(model, max_wait=0.01)
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        task = asyncio.create_task(ticker())
+        vectors = await asyncio.gather(*(service.aembed_query(f"question {i}") for i in range(8)), service.aembed_query("question 0"))
+        task.cancel()
+        return vectors, ticks
+
+    vectors, ticks = asyncio.run(main())
+    assert vectors[0] == vectors[-1]
+    # Identical queries in flight are embedded once
+    assert sum(model.calls) == 8
+    assert ticks >= 5
+
+def test_model_errors_reach_every_caller():
+    service = EmbeddingService(RecordingEmbeddings(latency=0, fail=True), max_wait=0)
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        service.embed_query("question")
+    with pytest.raises(RuntimeError):
+        service.embed_documents(["a", "b"])
+    assert service.stats()["size"] == 0
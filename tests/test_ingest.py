@@ -0,0 +1,98 @@
+import os
+import pytest
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from stand_ins import BLOG_TOPICS, HashEmbeddings
+from tools import lilianweng_vectorstore
+from tools.ingest import Source, dedup_chunks, ingest, local_sources
+
+TOPICS = list(BLOG_TOPICS)
+
+def post(topic: str, paragraphs: int = 20) -> str:
+    return "\n\n".join(f"Paragraph {i} of the post about {topic}, with a few more words about {topic} in it." for i in range(paragraphs))
+
+@pytest.fixture
+def blog(tmp_path):
+    source_dir = tmp_path / "posts"
+    source_dir.mkdir()
+    for i, topic in enumerate(TOPICS):
+        (source_dir / f"post-{i}.md").write_text(post(topic))
+    return source_dir
+
+@pytest.fixture
+def run(tmp_path, blog):
+    vectorstore = InMemoryVectorStore(HashEmbeddings())
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=100, add_start_index=True)
+
+    def run():
+        return ingest(local_sources(str(blog)), vectorstore, str(tmp_path / "manifest.json"), splitter, batch_size=4, workers=2)
+    run.vectorstore = vectorstore
+    return run
+
+def test_ingest_then_skip_unchanged(run, blog):
+    first = run()
+    assert first["added"] == len(TOPICS)
+    assert first["chunks_embedded"] == len(run.vectorstore.store) > 0
+    second = run()
+    assert second["unchanged"] == len(TOPICS)
+    assert second["chunks_embedded"] == 0 and second["chunks_deleted"] == 0
+
+def test_changed_document_reembeds_only_its_new_chunks(run, blog):
+    run()
+    before = set(run.vectorstore.store)
+    (blog / "post-0.md").write_text(post(TOPICS[0]) + "\n\nA new closing paragraph.")
+    stats = run()
+    assert stats["updated"] == 1 and stats["unchanged"] == len(TOPICS) - 1
+    # The unchanged start of the post keeps its vectors
+    assert 0 < stats["chunks_embedded"] < stats["chunks"]
+    assert len(set(run.vectorstore.store) - before) == stats["chunks_embedded"]
+    assert any("closing paragraph" in doc["text"] for doc in run.vectorstore.store.values())
+
+def test_deleted_document_is_removed(run, blog):
+    run()
+    os.remove(blog / "post-1.md")
+    stats = run()
+    assert stats["deleted"] == 1 and stats["chunks_deleted"] > 0
+    assert not any(TOPICS[1] in doc["text"] for doc in run.vectorstore.store.values())
+
+def test_shared_chunks_are_stored_once_and_kept(run, blog):
+    (blog / "copy.md").write_text(post(TOPICS[0]))
+    stats = run()
+    assert stats["chunks_embedded"] < stats["chunks"] - stats["chunks_deduplicated"]
+    # Deleting one of the copies keeps the chunks the other one still uses
+    os.remove(blog / "copy.md")
+    assert run()["chunks_deleted"] == 0
+    assert any(TOPICS[0] in doc["text"] for doc in run.vectorstore.store.values())
+
+def test_dedup_removes_overlap_and_keeps_all_text():
+    splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=50, add_start_index=True, separators=[" "])
+    text = " ".join(f"word{i}" for i in range(500))
+    chunks = splitter.create_documents([text])
+    kept = dedup_chunks(chunks)
+    assert len(kept) <= len(chunks) * 0.6
+    assert {word for chunk in kept for word in chunk.page_content.split()} == set(text.split())
+
+def test_first_build_needs_a_fetched_source_and_replaces_a_store_without_manifest(tmp_path, blog, monkeypatch):
+    store_dir = tmp_path / "index"
+    monkeypatch.setenv("VECTORSTORE", "numpy")
+    monkeypatch.setattr(lilianweng_vectorstore, "get_persist_directory", lambda: str(store_dir))
+    monkeypatch.setattr(lilianweng_vectorstore, "get_embedding", HashEmbeddings)
+    monkeypatch.setattr(lilianweng_vectorstore, "get_splitter", lambda: RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=100, add_start_index=True))
+
+    def unreachable():
+        raise OSError("network is unreachable")
+
+    # Offline first start: it fails, and nothing is left behind that a later start would take for a built store
+    monkeypatch.setattr(lilianweng_vectorstore, "web_sources", lambda urls: [Source(url, unreachable) for url in urls])
+    with pytest.raises(RuntimeError, match="Could not fetch any"):
+        lilianweng_vectorstore.get_vectorstore()
+    assert not store_dir.exists()
+
+    # A store from before manifests is rebuilt rather than added to
+    store_dir.mkdir()
+    (store_dir / "stale.bin").write_bytes(b"chunks under random ids")
+    monkeypatch.setattr(lilianweng_vectorstore, "web_sources", lambda urls: local_sources(str(blog)))
+    vectorstore = lilianweng_vectorstore.get_vectorstore()
+    assert not (store_dir / "stale.bin").exists()
+    assert (store_dir / "manifest.json").exists()
+    assert TOPICS[0] in vectorstore.similarity_search(TOPICS[0], k=1)[0].page_content
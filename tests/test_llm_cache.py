@@ -0,0 +1,69 @@
+import pytest
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration
+from langgraph.checkpoint.memory import MemorySaver
+from graph import build_graph
+from stand_ins import FakeChatModel
+from tools.chinook_db import get_sql_db_tool
+from tools.llm_cache import LLMCacheMiss, SqliteLLMCache, cache_key
+
+QUESTION = "Which genre on average has the longest tracks?"
+
+def build(llm, retriever_tool, research_agent):
+    db_tools, db = get_sql_db_tool(llm)
+    return build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver())
+
+def ask(agent, question: str, thread_id: str) -> list:
+    return agent.invoke({"messages": [{"role": "user", "content": question}]}, {"configurable": {"thread_id": thread_id}})["messages"]
+
+def test_identical_prompts_are_answered_from_the_cache(tmp_path, retriever_tool, research_agent):
+    cache = SqliteLLMCache(str(tmp_path / "llm_cache.sqlite"))
+    llm = FakeChatModel(latency=0, cache=cache)
+    agent = build(llm, retriever_tool, research_agent)
+
+    first = ask(agent, QUESTION, "a")
+    calls = llm.calls
+    # Another user asking the same question: every LLM call is a hit
+    second = ask(agent, QUESTION, "b")
+    assert llm.calls == calls
+    assert second[-1].content == first[-1].content
+    assert cache.stats()["hits"] == calls
+
+    # Asked again on the same thread, the cached responses are added to the history, not replacing the earlier ones
+    again = ask(agent, QUESTION, "a")
+    assert len(again) == 2 * len(first)
+    assert len({message.id for message in again}) == len(again)
+
+def test_record_then_replay_without_the_model(tmp_path, retriever_tool, research_agent):
+    path = str(tmp_path / "recording.sqlite")
+    recorded = ask(build(FakeChatModel(latency=0, cache=SqliteLLMCache(path, mode="record")), retriever_tool, research_agent), QUESTION, "t")
+
+    replay = SqliteLLMCache(path, mode="replay")
+    llm = FakeChatModel(latency=0, cache=replay)
+    agent = build(llm, retriever_tool, research_agent)
+    assert ask(agent, QUESTION, "t2")[-1].content == recorded[-1].content
+    assert llm.calls == 0
+    with pytest.raises(LLMCacheMiss):
+        ask(agent, "How many customers are there?", "t3")
+
+def test_key_ignores_message_ids_but_not_tools():
+    def prompt(message_id: str) -> str:
+        return dumps([HumanMessage("hi", id=message_id), AIMessage("hello", id=f"run-{message_id}", usage_metadata={"input_tokens": 1, "output_tokens": 1, "total_tokens": 2})])
+
+    assert cache_key(prompt("a"), "model") == cache_key(prompt("b"), "model")
+    assert cache_key(prompt("a"), "model tools=[x]") != cache_key(prompt("a"), "model tools=[y]")
+
+def test_ttl_and_size_eviction(tmp_path):
+    cache = SqliteLLMCache(str(tmp_path / "llm_cache.sqlite"), ttl=60, max_bytes=2000)
+    response = [ChatGeneration(message=AIMessage("x" * 300))]
+    for i in range(10):
+        cache.update(dumps([HumanMessage(f"q{i}")]), "model", response)
+    stats = cache.stats()
+    assert stats["bytes"] <= 2000 and stats["evictions"] > 0
+    assert cache.lookup(dumps([HumanMessage("q0")]), "model") is None
+    assert cache.lookup(dumps([HumanMessage("q9")]), "model")[0].message.content == "x" * 300
+
+    # Expired entries are misses
+    cache.ttl = 0.000001
+    assert cache.lookup(dumps([HumanMessage("q9")]), "model") is None
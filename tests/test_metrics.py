@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from graph import build_graph
+from tools.chinook_db import get_sql_db_tool
+from tools.metrics import Counter, Histogram, Registry, RequestMetrics, LLM_TOKENS, NODE_SECONDS, REQUESTS_TOTAL, TOOL_SECONDS
+
+QUESTION = "Which genre on average has the longest tracks?"
+
+def count(histogram: Histogram, **labels) -> int:
+    state = histogram.values.get(histogram._key(labels))
+    return state[-2] if state else 0
+
+@pytest.fixture
+def agent(llm, retriever_tool, research_agent):
+    db_tools, db = get_sql_db_tool(llm)
+    return build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver())
+
+def test_render_prometheus_text():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests.", ["endpoint"]))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ["node"], buckets=(0.1, 1.0)))
+    requests.inc(endpoint="generate")
+    requests.inc(2, endpoint="generate")
+    latency.observe(0.5, node='say "hi"')
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{endpoint="generate"} 3.0' in text
+    assert 'latency_seconds_bucket{node="say \\"hi\\"",le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{node="say \\"hi\\"",le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{node="say \\"hi\\"",le="+Inf"} 1' in text
+    assert 'latency_seconds_count{node="say \\"hi\\""} 1' in text
+    assert 'latency_seconds_sum{node="say \\"hi\\""} 0.5' in text
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_run_records_nodes_tokens_and_tools(agent, use_async):
+    nodes = (
+        "supervisor", "supervisor/agent", "sql_agent", "sql_agent/list_tables", "sql_agent/call_get_schema",
+        "sql_agent/get_schema", "sql_agent/generate_query", "sql_agent/check_query", "sql_agent/run_query", "merge_branches",
+    )
+    before = {node: count(NODE_SECONDS, node=node) for node in nodes}
+    tokens_before = LLM_TOKENS.values.get(("sql_agent/generate_query", "prompt"), 0)
+    tool_before = count(TOOL_SECONDS, tool="sql_db_query")
+    ok_before = REQUESTS_TOTAL.values.get(("test", "ok"), 0)
+
+    metrics = RequestMetrics("test")
+    config = {"configurable": {"thread_id": f"metrics-{use_async}"}, "callbacks": [metrics.handler]}
+    with metrics:
+        if use_async:
+            asyncio.run(agent.ainvoke({"messages": [{"role": "user", "content": QUESTION}]}, config))
+        else:
+            agent.invoke({"messages": [{"role": "user", "content": QUESTION}]}, config)
+
+    # Supervisor runs twice (handoff, answer), generate_query twice (query, answer); nested runs of a node are counted once
+    expected = {
+        "supervisor": 2, "supervisor/agent": 2, "sql_agent": 1, "sql_agent/list_tables": 1, "sql_agent/call_get_schema": 1,
+        "sql_agent/get_schema": 1, "sql_agent/generate_query": 2, "sql_agent/check_query": 1, "sql_agent/run_query": 1, "merge_branches": 1,
+    }
+    assert {node: count(NODE_SECONDS, node=node) - before[node] for node in nodes} == expected
+    assert LLM_TOKENS.values[("sql_agent/generate_query", "prompt")] > tokens_before
+    assert count(TOOL_SECONDS, tool="sql_db_query") == tool_before + 1
+    assert REQUESTS_TOTAL.values[("test", "ok")] == ok_before + 1
+
+    trace = metrics.handler.trace()
+    assert trace["queue_ms"] is not None
+    assert [span["name"] for span in trace["spans"] if span["kind"] == "node"][0] == "supervisor"
+    llm_spans = [span for span in trace["spans"] if span["kind"] == "llm"]
+    assert [span["name"] for span in llm_spans] == [
+        "supervisor/agent", "sql_agent/call_get_schema", "sql_agent/generate_query",
+        "sql_agent/check_query", "sql_agent/generate_query", "supervisor/agent",
+    ]
+    assert all(span["prompt_tokens"] > 0 for span in llm_spans)
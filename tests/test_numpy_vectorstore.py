@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from agents.retriever import get_retriever_tool
+from stand_ins import HashEmbeddings, fake_vectorstore
+from tools.numpy_vectorstore import NumpyVectorStore
+
+# Random unit vectors looked up by text, to compare the search with exact float32 cosine similarity
+class ArrayEmbeddings(Embeddings):
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 64)).astype(np.float32)
+    queries = vectors[:50] + 0.5 * rng.standard_normal((50, 64)).astype(np.float32)
+    embedding = ArrayEmbeddings({**{f"doc-{i}": v.tolist() for i, v in enumerate(vectors)}, **{f"query-{i}": q.tolist() for i, q in enumerate(queries)}})
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = np.argsort(-(queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T, axis=1)[:, :10]
+    return embedding, exact
+
+@pytest.mark.parametrize("dtype, min_recall", [("float32", 1.0), ("float16", 0.99), ("int8", 0.95)])
+def test_recall_against_exact_search(corpus, tmp_path, dtype, min_recall):
+    embedding, exact = corpus
+    store = NumpyVectorStore.from_texts([f"doc-{i}" for i in range(2000)], embedding, ids=[str(i) for i in range(2000)], path=str(tmp_path), dtype=dtype)
+    results = store.batch_similarity_search_with_score([f"query-{i}" for i in range(50)], k=10)
+    found = sum(len({int(document.id) for document, _ in hits} & set(expected)) for hits, expected in zip(results, exact))
+    assert found / exact.size >= min_recall
+    # One query at a time gives the same ranking as the batch
+    assert [document.id for document in store.similarity_search("query-3", k=10)] == [document.id for document, _ in results[3]]
+
+def test_persistence_upsert_and_delete(tmp_path):
+    embedding = HashEmbeddings()
+    store = NumpyVectorStore(embedding, str(tmp_path))
+    store.add_documents([Document(page_content="reward hacking in RL", metadata={"post": "a"}), Document(page_content="video diffusion models")], ids=["a", "b"])
+    store.add_documents([Document(page_content="hallucination of language models", metadata={"post": "a"})], ids=["a"])
+    reopened = NumpyVectorStore(embedding, str(tmp_path))
+    assert isinstance(reopened.index.vectors, np.memmap)
+    assert {document.id for document in reopened.get_by_ids(["a", "b"])} == {"a", "b"}
+    top = reopened.similarity_search("language model hallucination", k=1)[0]
+    assert (top.id, top.metadata) == ("a", {"post": "a"})
+
+    assert store.delete(["b"])
+    # Other instances pick up the new generation
+    assert reopened.get_by_ids(["b"]) == []
+    assert len(reopened.similarity_search("video", k=5)) == 1
+    assert len([name for name in tmp_path.iterdir() if name.name.startswith("gen-")]) == 1
+
+def test_retriever_tool_over_numpy_store():
+    embedding = HashEmbeddings()
+    store = NumpyVectorStore(embedding)
+    chunks = fake_vectorstore(embedding, chunks_per_post=5).store.values()
+    store.add_documents([Document(page_content=chunk["text"], metadata=chunk["metadata"]) for chunk in chunks])
+    tool = get_retriever_tool(store, "retrieve_blog_posts", "Search and return information about Lilian Weng blog posts.")
+    assert "Hallucination" in tool.invoke({"query": "hallucination in language models"}).split("\n\n")[0]
@@ -0,0 +1,50 @@
+import time
+import asyncio
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+from stand_ins import FakeChatModel
+from graph import build_graph
+from tools.chinook_db import get_sql_db_tool
+
+QUESTION = "Which genre has the longest tracks, and what is new in rock music?"
+
+def build(llm, retriever_tool, research_agent, **kwargs):
+    db_tools, db = get_sql_db_tool(llm)
+    return build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver(), parallel_agents=True, **kwargs)
+
+def test_handoffs_run_as_parallel_branches_merged_in_fixed_order(retriever_tool):
+    # The supervisor hands over to the SQL agent first, the merged history still starts with research
+    llm = FakeChatModel(handoffs=["sql_agent", "research_agent"])
+    research_agent = create_react_agent(model=llm, tools=[retriever_tool], name="research_agent")
+    agent = build(llm, retriever_tool, research_agent)
+
+    result = agent.invoke({"messages": [{"role": "user", "content": QUESTION}]}, {"configurable": {"thread_id": "t1"}})
+
+    messages = result["messages"]
+    tasks = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    assert len(tasks) == 3  # question, research task, sql task
+    research = messages[tasks[1]:tasks[2]]
+    sql = messages[tasks[2]:-1]
+    assert research[-1].name == "research_agent"
+    assert any(isinstance(message, ToolMessage) and message.name == "sql_db_query" for message in sql)
+    # One synthesis step after both branches
+    assert [m.name for m in messages if isinstance(m, AIMessage) and m.name == "supervisor"] == ["supervisor"]
+    assert messages[-1].content.startswith("Final answer")
+    assert result["branch_results"] == []
+
+def test_slow_branch_times_out(llm, retriever_tool):
+    llm.handoffs = ["sql_agent", "research_agent"]
+    slow_research_agent = create_react_agent(model=FakeChatModel(latency=5), tools=[retriever_tool], name="research_agent")
+    agent = build(llm, retriever_tool, slow_research_agent, agent_timeout=1)
+
+    async def run():
+        start = time.perf_counter()
+        result = await agent.ainvoke({"messages": [{"role": "user", "content": QUESTION}]}, {"configurable": {"thread_id": "t1"}})
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(run())
+    assert elapsed < 3
+    contents = [message.content for message in result["messages"]]
+    assert "research_agent did not answer within 1 seconds." in contents
+    assert result["messages"][-1].content.startswith("Final answer")
@@ -0,0 +1,133 @@
+import time
+import asyncio
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+from api import create_app
+from chatbot import Chatbot
+from stand_ins import FakeChatModel
+from tools.metrics import ADMISSION_REJECTED
+from tools.scheduler import AdmissionController, LLMRateLimiter, Rejected
+
+# Chatbot stand-in whose runs take `latency` seconds
+class SlowAgent:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def astream(self, input, config=None, stream_mode=None):
+        await asyncio.sleep(self.latency)
+        yield {"messages": [type("Message", (), {"content": "answer"})()]}
+
+def test_waiting_requests_are_served_round_robin_across_users():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_per_user=1, max_wait=None)
+        order = []
+
+        async def run(user_id: str):
+            async with controller.enqueue(user_id):
+                order.append(user_id)
+                await asyncio.sleep(0.01)
+
+        # A burst from one user, then a single request from another
+        tasks = [asyncio.create_task(run("burst")) for _ in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(run("other")))
+        await asyncio.gather(*tasks)
+        return order, controller.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order[:3] == ["burst", "other", "burst"]
+    assert stats["running"] == 0 and stats["queued"] == 0
+
+def test_per_user_concurrency_cap_and_cancelled_waiters():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=8, max_per_user=2, max_wait=None)
+        running, peak = 0, 0
+
+        async def run():
+            nonlocal running, peak
+            async with controller.enqueue("u"):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.02)
+                running -= 1
+
+        tasks = [asyncio.create_task(run()) for _ in range(6)]
+        await asyncio.sleep(0.005)
+        tasks[-1].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return peak, controller.stats()
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == 2
+    assert stats["running"] == 0 and stats["queued"] == 0
+
+def test_full_queues_are_rejected_with_retry_after():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_per_user=1, max_queue=3, max_queue_per_user=2, max_wait=None)
+        tasks = [asyncio.create_task(controller.enqueue("a").__aenter__()) for _ in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as per_user:
+            controller.enqueue("a")
+        tasks.append(asyncio.create_task(controller.enqueue("b").__aenter__()))
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as overall:
+            controller.enqueue("c")
+        for task in tasks:
+            task.cancel()
+        return per_user.value, overall.value
+
+    per_user, overall = asyncio.run(scenario())
+    assert per_user.status_code == 429 and per_user.headers["Retry-After"] >= "1"
+    assert overall.status_code == 503 and overall.reason == "queue_full"
+
+def test_api_rejects_requests_beyond_the_expected_wait(monkeypatch):
+    monkeypatch.setenv("ADMISSION_MAX_CONCURRENCY", "1")
+    monkeypatch.setenv("ADMISSION_MAX_WAIT_SECONDS", "1")
+    app = create_app(lambda: Chatbot(SlowAgent(0.2), []))
+
+    async def scenario():
+        async with app.router.lifespan_context(app), httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = asyncio.ensure_future(client.post("/generate", json={"question": "hi", "user_id": "u", "thread_id": "t"}))
+            await asyncio.sleep(0.05)
+            # The default estimate of 5 seconds per run is over the 1 second allowed
+            rejected = await client.post("/generate", json={"question": "hi", "user_id": "v", "thread_id": "t"})
+            return await first, rejected
+
+    first, rejected = asyncio.run(scenario())
+    assert first.json() == {"result": "answer"}
+    assert rejected.status_code == 503
+    assert int(rejected.headers["Retry-After"]) >= 5
+    assert 'chatbot_admission_rejected_total{reason="overloaded"}' in "\n".join(ADMISSION_REJECTED.render())
+
+def test_rate_limiter_paces_llm_calls_to_the_requests_per_minute():
+    # 600 requests per minute with a burst of 2: two calls at once, then one every 0.1s
+    limiter = LLMRateLimiter(requests_per_minute=600, burst_seconds=0.2)
+    llm = FakeChatModel(latency=0, rate_limiter=limiter, callbacks=[limiter.usage_handler])
+    start = time.perf_counter()
+    for _ in range(5):
+        llm.invoke([HumanMessage("one two three")])
+    assert 0.25 <= time.perf_counter() - start < 1.0
+
+def test_rate_limiter_settles_token_estimates_with_the_actual_usage():
+    limiter = LLMRateLimiter(tokens_per_minute=6000, burst_seconds=1, tokens_per_call=100)
+    llm = FakeChatModel(latency=0, rate_limiter=limiter, callbacks=[limiter.usage_handler])
+    llm.invoke([HumanMessage("one two three")])
+    # The call used 3 prompt tokens and a few completion tokens, not the 100 reserved
+    assert limiter.tokens_per_call < 100
+    assert limiter.tokens.level > 0
+    assert limiter.wait_time() == 0.0
+
+def test_concurrent_calls_are_refunded_what_they_reserved():
+    # 1 token per second, so refills are negligible; both calls reserve 100 tokens before either ends
+    limiter = LLMRateLimiter(tokens_per_minute=60, burst_seconds=300, tokens_per_call=100)
+    llm = FakeChatModel(latency=0.05, rate_limiter=limiter, callbacks=[limiter.usage_handler])
+
+    async def scenario():
+        return await asyncio.gather(llm.ainvoke([HumanMessage("one two three")]), llm.ainvoke([HumanMessage("four five")]))
+
+    replies = asyncio.run(scenario())
+    used = sum(reply.usage_metadata["total_tokens"] for reply in replies)
+    # The second call to end is refunded its 100 tokens, not the moving average the first one changed
+    assert limiter.tokens.level == pytest.approx(300 - used, abs=1)
+    assert not limiter.reserved
@@ -0,0 +1,104 @@
+import os
+import shutil
+import sqlite3
+import pytest
+from tools.chinook_db import get_schema_index
+from tools.schema_index import SchemaIndex
+
+@pytest.fixture(scope="module")
+def schema_index():
+    return get_schema_index(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "Chinook.db"))
+
+@pytest.mark.parametrize(
+    "question, tables",
+    [
+        ("Which genre on average has the longest tracks?", {"Genre", "Track"}),
+        ("List the top 5 artists with the most albums.", {"Album", "Artist"}),
+        ("How many songs are in the Rock genre?", {"Genre", "Track"}),
+        ("Which customers spent the most?", {"Customer", "Invoice"}),
+        ("Which employee has the most customers?", {"Customer", "Employee"}),
+        ("How many tracks are in the playlist Grunge?", {"Playlist", "PlaylistTrack", "Track"}),
+        ("Which media type is most common?", {"MediaType", "Track"}),
+        # Artists named in the question are found through the indexed values, the join path adds Album
+        ("How many tracks are by AC/DC?", {"Album", "Artist", "Track"}),
+        ("What are the albums of Iron Maiden?", {"Album", "Artist"}),
+        ("Who bought the most Metallica songs?", {"Artist", "Album", "Track", "InvoiceLine", "Invoice"}),
+    ],
+)
+def test_select_tables(schema_index, question, tables):
+    assert tables <= set(schema_index.select_tables(question))
+
+def test_select_tables_skips_weak_partial_matches(schema_index):
+    # "track" alone is a strong match for Track, not for PlaylistTrack
+    assert "PlaylistTrack" not in schema_index.select_tables("How many tracks are by AC/DC?")
+
+def test_select_tables_adds_neighbours_of_column_only_matches(schema_index):
+    # UnitPrice is a column of Track and InvoiceLine, no table is named in the question
+    selected = schema_index.select_tables("What is the average unit price?")
+    assert {"InvoiceLine", "Track", "Invoice"} <= set(selected)
+
+def test_get_table_info_has_ddl_and_sample_rows(schema_index):
+    info = schema_index.get_table_info(["Genre"])
+    assert "CREATE TABLE [Genre]" in info
+    assert "3 rows from Genre table" in info
+
+def test_refresh_rebuilds_when_the_file_changes(tmp_path, chinook_path):
+    path = str(tmp_path / "Chinook.db")
+    shutil.copy(chinook_path, path)
+    index = SchemaIndex(path)
+    assert not index.refresh()
+
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Concert (ConcertId INTEGER PRIMARY KEY, Venue TEXT)")
+    conn.commit()
+    conn.close()
+
+    assert index.refresh()
+    assert "Concert" in index.select_tables("Which venue hosted the most concerts?")
+
+def test_failed_rebuild_keeps_the_old_index_and_is_retried(tmp_path, chinook_path, monkeypatch):
+    path = str(tmp_path / "Chinook.db")
+    shutil.copy(chinook_path, path)
+    index = SchemaIndex(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Concert (ConcertId INTEGER PRIMARY KEY, Venue TEXT, ArtistId INTEGER REFERENCES Artist (ArtistId))")
+    conn.commit()
+    conn.close()
+
+    build = SchemaIndex._build
+    def failing_build(self):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(SchemaIndex, "_build", failing_build)
+    with pytest.raises(sqlite3.OperationalError):
+        index.select_tables("Which venue hosted the most concerts?")
+    # The old index is still whole
+    assert "Concert" not in index.snapshot.tables and "Concert" not in index.snapshot.neighbours
+
+    monkeypatch.setattr(SchemaIndex, "_build", build)
+    assert "Concert" in index.select_tables("Which venue hosted the most concerts?")
+    assert "Concert" in index.snapshot.neighbours["Artist"]
+
+def test_artifact_is_loaded_instead_of_rebuilt(tmp_path, chinook_path, monkeypatch):
+    path = str(tmp_path / "Chinook.db")
+    artifact_path = str(tmp_path / "artifacts" / "schema_index.pkl")
+    shutil.copy(chinook_path, path)
+    built = SchemaIndex(path, artifact_path=artifact_path)
+    assert os.path.exists(artifact_path)
+
+    def no_build(self):
+        raise AssertionError("index rebuilt")
+
+    monkeypatch.setattr(SchemaIndex, "_build", no_build)
+    loaded = SchemaIndex(path, artifact_path=artifact_path)
+    assert loaded.select_tables("How many tracks are by AC/DC?") == built.select_tables("How many tracks are by AC/DC?")
+
+    # Other build settings or another database need a rebuild
+    with pytest.raises(AssertionError, match="index rebuilt"):
+        SchemaIndex(path, artifact_path=artifact_path, sample_rows=1)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Concert (ConcertId INTEGER PRIMARY KEY, Venue TEXT)")
+    conn.commit()
+    conn.close()
+    with pytest.raises(AssertionError, match="index rebuilt"):
+        SchemaIndex(path, artifact_path=artifact_path)
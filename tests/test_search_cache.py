@@ -0,0 +1,88 @@
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from stand_ins import FakeWebSearch
+from tools.search_cache import CachedSearchTool, SearchCache, normalize_search_query
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_normalized_queries_share_an_entry():
+    search = FakeWebSearch(latency=0.01)
+    tool = CachedSearchTool.wrap(search, SearchCache())
+    first = tool.invoke({"query": "What is  RAG?"})
+    assert tool.invoke({"query": "what is rag"}) == first
+    assert search.calls == 1
+    assert normalize_search_query(" Latest LLM news! ") == "latest llm news"
+    stats = tool.cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["saved_seconds"] >= 0.01
+    # The research agent sees the same tool
+    assert tool.name == search.name and tool.description == search.description
+
+def test_concurrent_identical_searches_share_one_call():
+    search = FakeWebSearch(latency=0.1)
+    tool = CachedSearchTool.wrap(search, SearchCache())
+
+    async def run():
+        return await asyncio.gather(*(tool.ainvoke({"query": "open source models"}) for _ in range(5)))
+
+    assert len(set(asyncio.run(run()))) == 1
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda i: tool.invoke({"query": "vector databases"}), range(4)))
+    assert search.calls == 2
+    stats = tool.cache.stats()
+    assert stats["misses"] == 2
+    assert stats["coalesced"] + stats["hits"] == 7
+
+def test_stale_entries_are_served_while_refreshed():
+    clock = Clock()
+    search = FakeWebSearch(latency=0.05)
+    tool = CachedSearchTool.wrap(search, SearchCache(ttl=60, stale=600, clock=clock))
+    tool.invoke({"query": "news"})
+
+    # Past the TTL: the stale result comes back at once, the refresh runs in the background
+    clock.now += 120
+    start = time.perf_counter()
+    tool.invoke({"query": "news"})
+    assert time.perf_counter() - start < 0.05
+    deadline = time.time() + 5
+    while tool.cache.in_flight and time.time() < deadline:
+        time.sleep(0.01)
+    assert search.calls == 2
+    assert tool.cache.stats()["refreshes"] == 1
+    # Refreshed: fresh again
+    tool.invoke({"query": "news"})
+    assert search.calls == 2 and tool.cache.stats()["hits"] == 1
+
+    # Past the stale window the entry is gone
+    clock.now += 1000
+    tool.invoke({"query": "news"})
+    assert search.calls == 3
+
+    async def arun():
+        clock.now += 120
+        await tool.ainvoke({"query": "news"})
+        await asyncio.gather(*tool.cache.refresh_tasks)
+
+    asyncio.run(arun())
+    assert search.calls == 4
+
+def test_disk_tier_survives_restarts_and_errors_are_not_cached(tmp_path):
+    path = str(tmp_path / "search_cache.sqlite")
+    search = FakeWebSearch(latency=0)
+    CachedSearchTool.wrap(search, SearchCache(path=path)).invoke({"query": "langgraph"})
+    restarted = CachedSearchTool.wrap(search, SearchCache(path=path))
+    assert json.loads(restarted.invoke({"query": "LangGraph"}))["query"] == "langgraph"
+    assert search.calls == 1
+    assert restarted.cache.stats()["disk_hits"] == 1
+
+    cache = SearchCache()
+    assert cache.get_or_search("q", lambda: {"error": "timeout"}) == {"error": "timeout"}
+    assert cache.get_or_search("q", lambda: {"results": []}) == {"results": []}
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,54 @@
+import time
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+from agents.speculation import Speculator
+from graph import build_graph
+from stand_ins import FakeChatModel
+from tools.chinook_db import get_schema_index, get_sql_db_tool
+
+QUESTION = "What do the blog posts say about reward hacking?"
+
+def test_prefetched_retrieval_is_used_when_the_supervisor_hands_over(research_agent):
+    searches = []
+
+    @tool
+    def retrieve_blog_posts(query: str) -> str:
+        """Search and return information about Lilian Weng blog posts."""
+        searches.append(query)
+        time.sleep(0.1)
+        return f"Documents about {query}"
+
+    llm = FakeChatModel(latency=0.1, routes={"blog": ["retriever"]})
+    db_tools, db = get_sql_db_tool(llm)
+    speculator = Speculator()
+    agent = build_graph(llm, retrieve_blog_posts, research_agent, db_tools, db, checkpointer=MemorySaver(), schema_index=get_schema_index(), speculator=speculator)
+    config = {"configurable": {"thread_id": "t"}}
+
+    messages = agent.invoke({"messages": [{"role": "user", "content": QUESTION}]}, config)["messages"]
+    # Searched once, while the supervisor was deciding
+    assert searches == [QUESTION]
+    assert any(message.type == "tool" and message.content == f"Documents about {QUESTION}" for message in messages)
+    stats = speculator.stats()
+    assert stats["started"] == 2 and stats["hits"] == 1
+    assert stats["saved_seconds"] > 0.05
+
+    # The unused schema lookup is discarded when the next turn of the thread starts
+    agent.invoke({"messages": [{"role": "user", "content": "Which genre has the longest tracks?"}]}, config)
+    stats = speculator.stats()
+    assert stats["discarded"] >= 1 and stats["hits"] == 2
+
+def test_prefetch_only_fits_its_own_question():
+    speculator = Speculator()
+    speculator.register("retriever", lambda question: f"Documents about {question}")
+    config = {"configurable": {"thread_id": "t"}}
+
+    # A follow-up question is not a task description, the supervisor's rewording is searched instead
+    speculator.start("t", "and the other one?", standalone=False)
+    assert speculator.take(config, "retriever", "Reward hacking in RLHF") is None
+    speculator.start("t", "and the other one?", standalone=False)
+    assert speculator.take(config, "retriever", "And the other one?") == "Documents about and the other one?"
+    # Taken once, and never without a thread
+    assert speculator.take(config, "retriever", "And the other one?") is None
+    assert speculator.take({}, "retriever", "x") is None
+    stats = speculator.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["pending_threads"] == 0
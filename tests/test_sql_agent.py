@@ -0,0 +1,59 @@
+import sqlite3
+import asyncio
+from langgraph.checkpoint.memory import MemorySaver
+from agents.sql import SQLAgent
+from graph import build_graph
+from stand_ins import FakeChatModel
+from tools.chinook_db import get_sql_db_tool
+from tools.schema_index import SchemaIndex
+
+QUESTION = "Which genre on average has the longest tracks?"
+
+# A small database with the tables of the stand-in model's query and other content
+def create_archive_db(path: str) -> str:
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name TEXT);
+        CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, GenreId INTEGER, Milliseconds INTEGER);
+        INSERT INTO Genre VALUES (1, 'Live Jazz'), (2, 'Field Recordings');
+        INSERT INTO Track VALUES (1, 1, 600000), (2, 2, 90000);
+        """
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+def test_agents_of_two_databases_run_side_by_side(tmp_path):
+    llm = FakeChatModel(latency=0.05)
+    chinook = SQLAgent(llm, *get_sql_db_tool(llm))
+    archive_tools, archive_db = get_sql_db_tool(llm, create_archive_db(str(tmp_path / "archive.db")))
+    archive = SQLAgent(llm, archive_tools, archive_db, name="archive_agent", schema_index=SchemaIndex(str(tmp_path / "archive.db")))
+
+    async def run():
+        return await asyncio.gather(*(
+            agent.graph.ainvoke({"messages": [{"role": "user", "content": QUESTION}]}) for agent in (chinook, archive)
+        ))
+
+    chinook_result, archive_result = asyncio.run(run())
+    assert "Sci Fi & Fantasy" in chinook_result["messages"][-1].content
+    assert "Live Jazz" in archive_result["messages"][-1].content
+    assert "Sci Fi" not in archive_result["messages"][-1].content
+    # Everything is prepared once per agent, nothing is shared
+    assert chinook.run_query_tool is not archive.run_query_tool
+    assert chinook.graph.name == "sql_agent" and archive.graph.name == "archive_agent"
+
+def test_supervisor_hands_over_to_the_agents_of_every_database(tmp_path, retriever_tool, research_agent):
+    llm = FakeChatModel(latency=0, handoffs=["sql_agent", "archive_agent"])
+    db_tools, db = get_sql_db_tool(llm)
+    archive_tools, archive_db = get_sql_db_tool(llm, create_archive_db(str(tmp_path / "archive.db")))
+    archive = SQLAgent(llm, archive_tools, archive_db, name="archive_agent", description="the archive of live recordings")
+    agent = build_graph(
+        llm, retriever_tool, research_agent, db_tools, db,
+        checkpointer=MemorySaver(), parallel_agents=True, sql_agents=[archive],
+    )
+
+    messages = agent.invoke({"messages": [{"role": "user", "content": QUESTION}]}, {"configurable": {"thread_id": "t"}})["messages"]
+    answers = [message.content for message in messages if message.type == "ai" and message.content]
+    assert any("Sci Fi & Fantasy" in answer for answer in answers)
+    assert any("Live Jazz" in answer for answer in answers)
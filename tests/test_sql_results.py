@@ -0,0 +1,54 @@
+import re
+from langchain_core.messages import AIMessage
+from stand_ins import FakeChatModel
+from agents.sql import SQLAgent
+from tools.chinook_db import create_read_only_engine, get_sql_db_tool
+from tools.sql_results import SQLResultFormatter, format_cell
+
+QUESTION = "Which genre on average has the longest tracks?"
+
+def cursor_of(page: str) -> str:
+    return re.search(r'cursor "(\w+)"', page).group(1)
+
+def test_pages_within_the_row_budget_until_the_end():
+    formatter = SQLResultFormatter(create_read_only_engine("Chinook.db"), max_rows=10)
+    page = formatter.run("SELECT GenreId, Name FROM Genre ORDER BY GenreId")
+    lines = page.splitlines()
+    assert lines[0] == "GenreId:INTEGER\tName:TEXT"
+    assert lines[1] == "1\tRock"
+    assert len(lines) == 12 and "first 10 rows shown" in lines[-1]
+
+    rows = lines[1:-1]
+    while "end of result" not in page:
+        page = formatter.next_page(cursor_of(page))
+        rows += page.splitlines()[1:-1]
+    assert page.splitlines()[-1] == "-- rows 21-25, end of result"
+    assert [row.split("\t")[0] for row in rows] == [str(i) for i in range(1, 26)]
+    assert formatter.next_page("cmissing").startswith("Error:")
+    assert formatter.stats()["truncated_pages"] == 2
+
+def test_byte_budget_and_compact_cells():
+    formatter = SQLResultFormatter(create_read_only_engine("Chinook.db"), max_rows=100, max_bytes=200)
+    page = formatter.run("SELECT Name, Composer, UnitPrice FROM Track ORDER BY TrackId")
+    assert len(page.split("\n-- ")[0]) <= 300
+    assert "(byte budget)" in page
+    assert page.splitlines()[0] == "Name:TEXT\tComposer:TEXT\tUnitPrice:REAL"
+    assert format_cell(None) == "NULL"
+    assert format_cell("a\tb\nc") == "a\\tb\\nc"
+    assert format_cell(1 / 3) == "0.3333"
+    assert format_cell("x" * 150).endswith("...")
+    assert formatter.run("SELECT nope FROM Genre").startswith("Error:")
+
+def test_agent_pages_through_results_without_the_check_query_call():
+    llm = FakeChatModel(latency=0)
+    tools, db = get_sql_db_tool(llm)
+    agent = SQLAgent(llm, tools, db)
+    assert [tool.name for tool in agent.query_tools] == ["sql_db_query", "sql_db_next_page"]
+
+    messages = agent.graph.invoke({"messages": [{"role": "user", "content": QUESTION}]})["messages"]
+    result = next(message for message in messages if message.type == "tool" and message.name == "sql_db_query")
+    assert result.content.startswith("Name:TEXT\t")
+    assert "Sci Fi & Fantasy" in messages[-1].content
+
+    page_call = AIMessage("", tool_calls=[{"name": "sql_db_next_page", "args": {"cursor": "c0"}, "id": "1", "type": "tool_call"}])
+    assert agent.should_continue({"messages": [page_call]}) == "run_query"
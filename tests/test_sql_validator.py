@@ -0,0 +1,88 @@
+import shutil
+import sqlite3
+import pytest
+from langchain_core.messages import AIMessage
+from tools.sql_validator import SQLValidator, strip_literals
+
+@pytest.fixture
+def validator(chinook_path):
+    return SQLValidator(chinook_path)
+
+def test_valid_query_passes(validator):
+    query = "SELECT g.Name, AVG(t.Milliseconds) FROM Track t JOIN Genre g ON t.GenreId = g.GenreId GROUP BY g.Name LIMIT 5;"
+    assert validator.validate(query) == []
+
+@pytest.mark.parametrize(
+    "query, issue",
+    [
+        ("DELETE FROM Track", "Only SELECT queries are allowed."),
+        ("SELECT 1; DROP TABLE Track", "Only a single SQL statement is allowed."),
+        ("WITH t AS (SELECT 1) INSERT INTO Genre VALUES (99, 'x')", "DML/DDL statement INSERT is not allowed."),
+        ("SELECT Nme FROM Track", "SQLite rejected the query: no such column: Nme"),
+        ("SELECT Name FROM Tracks", "SQLite rejected the query: no such table: Tracks"),
+        ("SELECT Name FROM Track WHERE TrackId NOT IN (SELECT TrackId FROM InvoiceLine)", "NOT IN with a subquery"),
+        ("SELECT Name FROM Artist UNION SELECT Name FROM Genre", "UNION removes duplicates"),
+        ("SELECT Name FROM Track WHERE Milliseconds BETWEEN 1000 AND 2000", "BETWEEN is inclusive"),
+        ('SELECT Name FROM Genre WHERE Name = "Rock"', '"Rock" is not an identifier'),
+        ("SELECT t.Name FROM Track t JOIN Album a ON t.TrackId = a.AlbumId", "Join on trackid = albumid"),
+    ],
+)
+def test_flagged_queries(validator, query, issue):
+    assert any(found.startswith(issue) for found in validator.validate(query)), validator.validate(query)
+
+def test_keywords_in_literals_and_functions_are_allowed(validator):
+    assert validator.validate("SELECT REPLACE(Name, 'a', 'b') FROM Genre WHERE Name != 'DROP TABLE'") == []
+    assert validator.validate('SELECT "Name" FROM "Genre" -- delete later') == []
+    assert "DROP" not in strip_literals("SELECT 'it''s DROP' /* DROP */")
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        'SELECT g.Name AS "Genre Name", COUNT(*) AS "Tracks" FROM Track t JOIN Genre g ON t.GenreId = g.GenreId GROUP BY "Genre Name" ORDER BY "Tracks" DESC',
+        'SELECT SUM(Total) AS revenue FROM Invoice ORDER BY "revenue"',
+        'WITH "long tracks" ("id", "ms") AS (SELECT TrackId, Milliseconds FROM Track) SELECT COUNT("id") FROM "long tracks"',
+        'SELECT "t".Name FROM Track "t" WHERE "t".Milliseconds > 1000',
+    ],
+)
+def test_names_defined_by_the_query_are_identifiers(validator, query):
+    assert validator.validate(query) == []
+
+def test_can_skip_llm_check_counts(validator):
+    assert validator.can_skip_llm_check(["SELECT Name FROM Genre"])
+    assert not validator.can_skip_llm_check(["SELECT Name FROM Genre", "SELECT Nme FROM Genre"])
+    assert validator.stats() == {"llm_checks_skipped": 1, "llm_checks_run": 1, "skip_rate": 0.5}
+
+def test_flagged_query_is_explained_once(validator, monkeypatch):
+    from agents.sql import SQLAgent
+    from stand_ins import FakeChatModel
+    from tools.chinook_db import get_sql_db_tool
+
+    llm = FakeChatModel()
+    db_tools, db = get_sql_db_tool(llm)
+    sql = SQLAgent(llm, db_tools, db, sql_validator=validator)
+
+    explained = []
+    run = validator._validate
+    monkeypatch.setattr(validator, "_validate", lambda query: explained.append(query) or run(query))
+
+    query = "SELECT Name FROM Artist UNION SELECT Name FROM Genre"
+    message = AIMessage(content="", tool_calls=[{"name": "sql_db_query", "args": {"query": query}, "id": "1", "type": "tool_call"}])
+    state = {"messages": [message]}
+    assert sql.should_continue(state) == "check_query"
+    messages = sql._check_query_input(state)
+    assert "-- UNION removes duplicates" in messages[-1]["content"]
+    assert explained == [query]
+
+def test_reloads_when_the_file_changes(tmp_path, chinook_path):
+    path = str(tmp_path / "Chinook.db")
+    shutil.copy(chinook_path, path)
+    validator = SQLValidator(path)
+    assert validator.validate("SELECT Venue FROM Concert")
+
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Concert (ConcertId INTEGER PRIMARY KEY, Venue TEXT)")
+    conn.commit()
+    conn.close()
+
+    assert validator.validate("SELECT Venue FROM Concert") == []
+    assert validator.validate('SELECT "Venue" FROM Concert') == []
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import httpx
+from api import create_app
+from chatbot import Chatbot
+from tools.metrics import StartupTimer
+
+# Chatbot stand-in answering from a fixed graph state
+class FakeAgent:
+    async def astream(self, input, config=None, stream_mode=None):
+        yield {"messages": [input["messages"][0]]}
+        yield {"messages": [type("Message", (), {"content": "answer"})()]}
+
+def run_app(app, scenario):
+    async def run():
+        async with app.router.lifespan_context(app), httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await scenario(client)
+    return asyncio.run(run())
+
+def test_health_reports_loading_then_ready_with_the_startup_breakdown():
+    release = threading.Event()
+    startup = StartupTimer()
+
+    def load():
+        with startup.phase("graph"):
+            release.wait(5)
+        return Chatbot(FakeAgent(), [])
+
+    async def scenario(client):
+        loading = await client.get("/health")
+        # Requests wait for the chatbot instead of failing
+        answer = asyncio.ensure_future(client.post("/generate", json={"question": "hi", "user_id": "u", "thread_id": "t"}))
+        await asyncio.sleep(0.05)
+        assert not answer.done()
+        release.set()
+        response = await answer
+        return loading, response, await client.get("/health")
+
+    loading, response, ready = run_app(create_app(load, startup), scenario)
+    assert loading.status_code == 503 and loading.json()["status"] == "loading"
+    assert response.json() == {"result": "answer"}
+    assert ready.status_code == 200
+    assert ready.json()["status"] == "ready"
+    assert set(ready.json()["startup"]["phases"]) == {"graph"}
+    assert ready.json()["startup"]["ready_seconds"] is not None
+
+def test_failed_load_is_reported_and_retried():
+    attempts = []
+
+    def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("no model")
+        return Chatbot(FakeAgent(), [])
+
+    async def scenario(client):
+        while (health := await client.get("/health")).json()["status"] == "loading":
+            await asyncio.sleep(0.01)
+        response = await client.post("/generate", json={"question": "hi", "user_id": "u", "thread_id": "t"})
+        return health, response
+
+    health, response = run_app(create_app(load), scenario)
+    assert health.status_code == 503
+    assert health.json() == {"status": "failed", "error": "no model"}
+    assert response.json() == {"result": "answer"}
+    assert len(attempts) == 2
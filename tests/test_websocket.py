@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from starlette.testclient import TestClient
+from api import SendBuffer, create_app
+from chatbot import Chatbot
+from graph import build_graph
+from tools.chinook_db import get_sql_db_tool
+
+@pytest.fixture
+def client(llm, retriever_tool, research_agent, monkeypatch):
+    monkeypatch.setenv("WS_HEARTBEAT_SECONDS", "0")
+    db_tools, db = get_sql_db_tool(llm)
+    agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver())
+    with TestClient(create_app(lambda: Chatbot(agent, db_tools))) as client:
+        yield client
+
+def question(text: str, thread_id: str = "t") -> dict:
+    return {"type": "question", "question": text, "user_id": "u", "thread_id": thread_id}
+
+# Messages of the connection until the turn of thread_id ends
+def receive_turn(ws, thread_id: str = "t") -> list:
+    messages = []
+    while True:
+        message = ws.receive_json()
+        messages.append(message)
+        if message.get("thread_id") == thread_id and message["type"] in ("end", "error", "cancelled"):
+            return messages
+
+def test_several_questions_on_one_connection_stream_deltas(client):
+    with client.websocket_connect("/ws/generate") as ws:
+        ws.send_json(question("Which genre has the longest tracks?"))
+        first = receive_turn(ws)
+        ws.send_json(question("And the shortest?"))
+        second = receive_turn(ws)
+
+    for turn in (first, second):
+        assert turn[0] == {"type": "start", "thread_id": "t"}
+        assert turn[-1]["type"] == "end" and turn[-1]["result"].startswith("Final answer")
+        tokens = [message for message in turn if message["type"] == "token"]
+        assert tokens and all(message["content"] for message in tokens)
+        assert {"supervisor", "sql_agent"} <= {message["node"] for message in turn if message["type"] == "node"}
+
+def test_cancel_stops_the_turn_and_keeps_the_connection(client, llm):
+    llm.latency = 0.5
+    with client.websocket_connect("/ws/generate") as ws:
+        ws.send_json(question("Which genre has the longest tracks?"))
+        assert ws.receive_json()["type"] == "start"
+        ws.send_json({"type": "cancel", "thread_id": "t"})
+        assert ws.receive_json() == {"type": "cancelled", "thread_id": "t"}
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+def test_one_turn_at_a_time_per_thread_and_invalid_messages(client, llm):
+    llm.latency = 0.2
+    with client.websocket_connect("/ws/generate") as ws:
+        ws.send_json(question("Which genre has the longest tracks?"))
+        ws.send_json({"type": "question", "thread_id": "x"})
+        ws.send_text("not json")
+        ws.send_json(question("And the shortest?"))
+        messages = receive_turn(ws)
+        messages += receive_turn(ws)
+
+    errors = [message for message in messages if message["type"] == "error"]
+    assert [(error.get("thread_id"), error.get("status_code")) for error in errors] == [("x", None), (None, None), ("t", 409)]
+    assert messages[-1]["type"] == "end"
+
+def test_heartbeats(client, llm, retriever_tool, research_agent, monkeypatch):
+    monkeypatch.setenv("WS_HEARTBEAT_SECONDS", "0.05")
+    db_tools, db = get_sql_db_tool(llm)
+    agent = build_graph(llm, retriever_tool, research_agent, db_tools, db, checkpointer=MemorySaver())
+    with TestClient(create_app(lambda: Chatbot(agent, db_tools))) as client, client.websocket_connect("/ws/generate") as ws:
+        assert ws.receive_json() == {"type": "ping"}
+
+def test_slow_consumer_gets_merged_deltas_then_is_dropped():
+    async def scenario():
+        buffer = SendBuffer(maxsize=2, timeout=0.1)
+        for i in range(10):
+            await buffer.put({"type": "token", "thread_id": "t", "node": "supervisor", "message_id": "m", "content": f"{i} "})
+        await buffer.put({"type": "node", "thread_id": "t", "node": "supervisor"})
+        merged = buffer.messages[0]["content"]
+        # Full: the next message waits for the client to make room
+        waiting = asyncio.ensure_future(buffer.put({"type": "end", "thread_id": "t"}))
+        await asyncio.sleep(0.02)
+        assert not waiting.done()
+        assert (await buffer.get())["type"] == "token"
+        await waiting
+        # The client stops reading: the buffer overflows and closes
+        await buffer.put({"type": "start", "thread_id": "u"})
+        return merged, buffer
+
+    merged, buffer = asyncio.run(scenario())
+    assert merged == "0 1 2 3 4 5 6 7 8 9 "
+    assert buffer.coalesced == 9
+    assert buffer.overflowed and buffer.closed
+    assert asyncio.run(buffer.get()) is None